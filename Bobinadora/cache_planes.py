@@ -0,0 +1,253 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+
+import planificador
+
+
+# Cabecera del fichero: magia, versión, nº intervalos husillo, nº intervalos guiado, longitud metadatos
+CABECERA = struct.Struct("<4sIQQI4x")
+MAGIA = b"BOBP"
+EXTENSION = ".plan"
+
+
+def clave_plan(receta, motor):
+    """
+    Calcula la clave de caché de un plan a partir de la receta y del motor.
+    :param receta: Diccionario con los parámetros de la bobina.
+    :param motor: Diccionario con los parámetros del motor.
+    :return: Cadena hexadecimal.
+    """
+    datos = {
+        "version": planificador.VERSION_PLAN,
+        "receta": planificador.completar_receta(receta),
+        "motor": motor,
+    }
+    texto = json.dumps(datos, sort_keys=True)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def _alinear(n, alineacion=8):
+    return (n + alineacion - 1) // alineacion * alineacion
+
+
+class CachePlanes:
+    """
+    Caché en disco de planes compilados. Cada plan se guarda en un fichero
+    binario que se mapea en memoria al leerlo, de modo que los intervalos se
+    usan sin copiarlos. Cuando se supera el tamaño máximo se eliminan los
+    planes usados hace más tiempo (LRU).
+    """
+    def __init__(self, directorio, max_bytes=64 * 1024 * 1024):
+        """
+        :param directorio: Carpeta donde se guardan los planes.
+        :param max_bytes: Tamaño máximo de la caché en bytes.
+        """
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        os.makedirs(directorio, exist_ok=True)
+
+        # Índice clave -> tamaño, ordenado del menos al más reciente
+        self.indice = OrderedDict()
+        ficheros = []
+        for nombre in os.listdir(directorio):
+            if nombre.endswith(EXTENSION):
+                ruta = os.path.join(directorio, nombre)
+                estado = os.stat(ruta)
+                ficheros.append((estado.st_mtime, nombre[:-len(EXTENSION)], estado.st_size))
+        for _, clave, tamano in sorted(ficheros):
+            self.indice[clave] = tamano
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + EXTENSION)
+
+    def bytes_usados(self):
+        return sum(self.indice.values())
+
+    def estadisticas(self):
+        """
+        Devuelve las estadísticas de uso de la caché. Es un diccionario.
+        """
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsiones": self.expulsiones,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+            "planes": len(self.indice),
+            "bytes": self.bytes_usados(),
+        }
+
+    def obtener_plan(self, receta, motor):
+        """
+        Devuelve el plan de la receta, mapeado desde disco si ya existe o
+        compilado y guardado si no.
+        :param receta: Diccionario con los parámetros de la bobina.
+        :param motor: Diccionario con los parámetros del motor.
+        :return: Instancia de PlanBobinado.
+        """
+        clave = clave_plan(receta, motor)
+        if clave in self.indice:
+            try:
+                plan = self._mapear(clave)
+            except (OSError, ValueError):
+                # Fichero borrado, truncado o corrupto: se borra y se trata como un fallo
+                self.indice.pop(clave, None)
+                try:
+                    os.remove(self._ruta(clave))
+                except OSError:
+                    pass
+            else:
+                self.aciertos += 1
+                self.indice.move_to_end(clave)
+                os.utime(self._ruta(clave))
+                return plan
+
+        self.fallos += 1
+        plan = planificador.compilar_plan(receta, motor)
+        plan.info["clave"] = clave
+        self._guardar(clave, plan)
+        return plan
+
+    def _guardar(self, clave, plan):
+        """
+        Escribe el plan en disco de forma atómica y aplica la expulsión LRU.
+        """
+        meta = json.dumps(plan.info, sort_keys=True).encode("utf-8")
+        meta += b" " * (_alinear(len(meta)) - len(meta))
+        cabecera = CABECERA.pack(MAGIA, planificador.VERSION_PLAN,
+                                 len(plan.husillo), len(plan.traverse), len(meta))
+        tamano = CABECERA.size + len(meta) + 8 * (len(plan.husillo) + len(plan.traverse))
+        if tamano > self.max_bytes:
+            return  # No cabe ni sola: se usa el plan sin guardarlo
+
+        fd, temporal = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fichero:
+            fichero.write(cabecera)
+            fichero.write(meta)
+            fichero.write(plan.husillo)
+            fichero.write(plan.traverse)
+        os.replace(temporal, self._ruta(clave))
+
+        self.indice[clave] = tamano
+        self.indice.move_to_end(clave)
+        self._expulsar()
+
+    def _expulsar(self):
+        """
+        Elimina los planes menos usados hasta quedar por debajo del tamaño máximo.
+        """
+        while self.bytes_usados() > self.max_bytes and len(self.indice) > 1:
+            clave, _ = self.indice.popitem(last=False)
+            try:
+                os.remove(self._ruta(clave))
+            except FileNotFoundError:
+                pass
+            self.expulsiones += 1
+
+    def _mapear(self, clave):
+        """
+        Mapea un plan guardado sin copiar los intervalos.
+        """
+        with open(self._ruta(clave), "rb") as fichero:
+            mapa = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ)
+        # Se comprueba la longitud con la cabecera antes de decodificar nada: un fichero
+        # truncado o corrupto es un ValueError, como un formato desconocido
+        if len(mapa) < CABECERA.size:
+            mapa.close()
+            raise ValueError(f"Plan truncado: {clave}")
+        magia, version, n_husillo, n_traverse, n_meta = CABECERA.unpack_from(mapa, 0)
+        if magia != MAGIA or version != planificador.VERSION_PLAN:
+            mapa.close()
+            raise ValueError(f"Plan con formato desconocido: {clave}")
+        if len(mapa) != CABECERA.size + n_meta + 8 * (n_husillo + n_traverse):
+            mapa.close()
+            raise ValueError(f"Plan truncado: {clave}")
+
+        vista = memoryview(mapa)
+        inicio = CABECERA.size
+        try:
+            info = json.loads(bytes(vista[inicio:inicio + n_meta]))
+            if not isinstance(info, dict):
+                raise ValueError(f"Metadatos no válidos en el plan {clave}")
+        except ValueError:
+            vista.release()
+            mapa.close()
+            raise
+        inicio += n_meta
+        husillo = vista[inicio:inicio + 8 * n_husillo].cast("d")
+        inicio += 8 * n_husillo
+        traverse = vista[inicio:inicio + 8 * n_traverse].cast("d")
+        vista.release()
+        return planificador.PlanBobinado(husillo, traverse, info, mapa=mapa)
+
+    def vaciar(self):
+        """
+        Elimina todos los planes de la caché.
+        """
+        for clave in list(self.indice):
+            try:
+                os.remove(self._ruta(clave))
+            except FileNotFoundError:
+                pass
+        self.indice.clear()
+
+
+# Benchmark: arranque en frío (compilar) contra arranque en caliente (mapear)
+if __name__ == "__main__":
+    motor = {"steps_per_revolution": 200}
+    receta = {"vueltas": 1000, "rps": 30, "espiras_por_capa": 80, "pasos_traverse_por_vuelta": 8}
+
+    with tempfile.TemporaryDirectory() as directorio:
+        cache = CachePlanes(directorio, max_bytes=16 * 1024 * 1024)
+
+        inicio = time.perf_counter()
+        plan = cache.obtener_plan(receta, motor)
+        frio = time.perf_counter() - inicio
+        print(f"Arranque en frío: {frio * 1000:.2f} ms ({plan.info['pasos_husillo']} pasos, "
+              f"{plan.duracion:.1f} s de bobinado)")
+
+        tiempos = []
+        for _ in range(20):
+            inicio = time.perf_counter()
+            plan = cache.obtener_plan(receta, motor)
+            tiempos.append(time.perf_counter() - inicio)
+            plan.cerrar()
+        caliente = sorted(tiempos)[len(tiempos) // 2]
+        print(f"Arranque en caliente: {caliente * 1000:.3f} ms (mediana de {len(tiempos)})")
+        print(f"Aceleración: x{frio / caliente:.0f}")
+
+        # Recetas distintas para forzar expulsiones
+        for vueltas in range(1100, 2100, 100):
+            cache.obtener_plan(dict(receta, vueltas=vueltas), motor).cerrar()
+        print(f"Estadísticas: {cache.estadisticas()}")
+
+        # Un fichero truncado o corrupto cuenta como fallo: se borra y se vuelve a compilar
+        ruta = cache._ruta(clave_plan(receta, motor))
+        cache.obtener_plan(receta, motor).cerrar()
+        with open(ruta, "rb") as fichero:
+            original = fichero.read()
+        danados = {
+            "vacío": b"",
+            "cabecera a medias": original[:CABECERA.size // 2],
+            "intervalos truncados": original[:-12],
+            "metadatos corruptos": original[:CABECERA.size] + b"\xff" * 8 + original[CABECERA.size + 8:],
+        }
+        for nombre, contenido in danados.items():
+            with open(ruta, "wb") as fichero:
+                fichero.write(contenido)
+            fallos = cache.fallos
+            plan = cache.obtener_plan(receta, motor)
+            assert cache.fallos == fallos + 1 and len(plan.husillo) == plan.info["pasos_husillo"]
+            plan.cerrar()
+            with open(ruta, "rb") as fichero:
+                assert fichero.read() == original
+        print(f"Ficheros dañados recompilados: {', '.join(danados)}")
@@ -0,0 +1,380 @@
+import itertools
+import operator
+import os
+import queue
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+
+
+# Cabecera de un fichero de traza: magia, versión, número de flancos, bytes de datos
+CABECERA_TRAZA = struct.Struct("<4sIQQ")
+MAGIA_TRAZA = b"BOBT"
+VERSION_TRAZA = 1
+
+# Cabecera de cada bloque comprimido: flancos, bytes por delta, bytes comprimidos
+BLOQUE = struct.Struct("<IBI")
+
+
+def _codificar(tiempos, codigos, n, anterior, salida):
+    """
+    Añade un bloque de n flancos a salida: deltas de tiempo (uint32, o int64
+    si algún hueco pasa de 4 s) y códigos pin << 1 | nivel, comprimidos con
+    zlib. Los pasos a velocidad constante tienen deltas repetidos y se
+    comprimen muy bien. Todo se hace con funciones en C, sin bucle por flanco.
+    :return: Instante del último flanco codificado.
+    """
+    previos = array("q", [anterior])
+    previos.extend(tiempos[:n - 1])
+    deltas = array("q", map(operator.sub, tiempos[:n], previos))
+    try:
+        deltas = array("I", deltas)
+    except OverflowError:
+        pass
+    datos = zlib.compress(deltas.tobytes() + codigos[:n].tobytes(), 1)
+    salida += BLOQUE.pack(n, deltas.itemsize, len(datos))
+    salida += datos
+    return tiempos[n - 1]
+
+
+def decodificar(datos, anterior=0):
+    """
+    Recorre una traza compacta.
+    :param datos: bytes o bytearray con los bloques codificados.
+    :param anterior: Instante del flanco anterior al primero (ns).
+    :return: Generador de (t_ns, pin, nivel).
+    """
+    i = 0
+    while i < len(datos):
+        n, ancho, longitud = BLOQUE.unpack_from(datos, i)
+        i += BLOQUE.size
+        bruto = zlib.decompress(datos[i:i + longitud])
+        i += longitud
+        deltas = array("I" if ancho == 4 else "q")
+        deltas.frombytes(bruto[:n * ancho])
+        codigos = bruto[n * ancho:]
+        tiempos = itertools.accumulate(deltas, initial=anterior)
+        next(tiempos)
+        for t, codigo in zip(tiempos, codigos):
+            yield t, codigo >> 1, codigo & 1
+        anterior = t
+
+
+class GPIOCaptura:
+    """
+    Envoltorio de un backend GPIO (RPi.GPIO o GPIOVirtual) que registra cada
+    cambio de nivel de las salidas con marca de tiempo en ns. Los flancos
+    se escriben en un buffer preasignado (sin reservar memoria por flanco);
+    cuando se llena se cambia al otro buffer y un hilo lo comprime por
+    bloques (deltas de tiempo + zlib, ~1 byte por flanco en lugar de ~100 de una tupla).
+    El resto de funciones se pasan tal cual al backend.
+    """
+    def __init__(self, gpio, reloj=time, capacidad=65536, max_bytes=64 * 1024 * 1024, hilo=True):
+        """
+        :param gpio: Backend GPIO a envolver.
+        :param reloj: Objeto con perf_counter_ns() (time o RelojVirtual).
+        :param capacidad: Flancos por buffer.
+        :param max_bytes: Tamaño máximo de la traza comprimida; los flancos que no caben se cuentan en perdidos.
+        :param hilo: Comprimir en un hilo aparte (en la Raspberry) o en el momento (simulación determinista).
+        """
+        self.gpio = gpio
+        self.reloj = reloj
+        self._ns = reloj.perf_counter_ns
+        self.capacidad = capacidad
+        self.max_bytes = max_bytes
+        self.niveles = {}
+        self.total = 0
+        self.perdidos = 0
+        self.esperas = 0
+        self.compacto = bytearray()
+        self._anterior = 0
+
+        self._libres = queue.Queue()
+        for _ in range(2):
+            self._libres.put((array("q", bytes(8 * capacidad)), array("B", bytes(capacidad))))
+        self._tiempos, self._codigos = self._libres.get()
+        self._n = 0
+        self._llenos = None
+        if hilo:
+            self._llenos = queue.Queue()
+            threading.Thread(target=self._compactador, daemon=True).start()
+
+    def __getattr__(self, nombre):
+        return getattr(self.gpio, nombre)
+
+    def output(self, canal, valor):
+        self.gpio.output(canal, valor)
+        if canal.__class__ is list or canal.__class__ is tuple:
+            valores = valor if isinstance(valor, (list, tuple)) else [valor] * len(canal)
+            for pin, v in zip(canal, valores):
+                self._registrar(pin, v)
+            return
+        # Igual que _registrar, copiado aquí para ahorrar una llamada por flanco
+        nivel = 1 if valor else 0
+        niveles = self.niveles
+        if niveles.get(canal) == nivel:
+            return
+        niveles[canal] = nivel
+        n = self._n
+        self._tiempos[n] = self._ns()
+        self._codigos[n] = canal << 1 | nivel
+        n += 1
+        self._n = n
+        if n == self.capacidad:
+            self._volcar()
+
+    def _registrar(self, pin, valor):
+        nivel = 1 if valor else 0
+        if self.niveles.get(pin) == nivel:
+            return
+        self.niveles[pin] = nivel
+        n = self._n
+        self._tiempos[n] = self._ns()
+        self._codigos[n] = pin << 1 | nivel
+        n += 1
+        self._n = n
+        if n == self.capacidad:
+            self._volcar()
+
+    def _volcar(self):
+        lleno = (self._tiempos, self._codigos, self._n)
+        self.total += self._n
+        if self._llenos is None:
+            self._compactar(*lleno)
+            self._libres.put(lleno[:2])
+        else:
+            self._llenos.put(lleno)
+        if self._libres.empty():
+            self.esperas += 1  # El compactador no da abasto: se espera a que libere un buffer
+        self._tiempos, self._codigos = self._libres.get()
+        self._n = 0
+
+    def _compactar(self, tiempos, codigos, n, tramo=None):
+        if len(self.compacto) >= self.max_bytes:
+            self.perdidos += n
+            return
+        if tramo is None:
+            self._anterior = _codificar(tiempos, codigos, n, self._anterior, self.compacto)
+            return
+        # Por tramos cortos, cediendo el GIL entre ellos para no retrasar al hilo de pasos
+        for inicio in range(0, n, tramo):
+            fin = min(n, inicio + tramo)
+            self._anterior = _codificar(tiempos[inicio:fin], codigos[inicio:fin], fin - inicio,
+                                        self._anterior, self.compacto)
+            time.sleep(0)
+
+    def _compactador(self):
+        while True:
+            tiempos, codigos, n = self._llenos.get()
+            self._compactar(tiempos, codigos, n, tramo=512)
+            self._libres.put((tiempos, codigos))
+            self._llenos.task_done()
+
+    def vaciar(self):
+        """
+        Comprime lo que queda en el buffer activo y espera al compactador.
+        """
+        if self._n:
+            self._volcar()
+        if self._llenos is not None:
+            self._llenos.join()
+
+    def flancos(self):
+        """
+        :return: Generador de (t_ns, pin, nivel) de todos los flancos capturados.
+        """
+        self.vaciar()
+        return decodificar(self.compacto)
+
+    def guardar(self, ruta):
+        """
+        Guarda la traza compacta en un fichero binario.
+        """
+        self.vaciar()
+        with open(ruta, "wb") as fichero:
+            fichero.write(CABECERA_TRAZA.pack(MAGIA_TRAZA, VERSION_TRAZA, self.total - self.perdidos,
+                                              len(self.compacto)))
+            fichero.write(self.compacto)
+
+    def estadisticas(self):
+        self.vaciar()
+        capturados = self.total - self.perdidos
+        return {
+            "flancos": capturados,
+            "perdidos": self.perdidos,
+            "bytes": len(self.compacto),
+            "bytes_por_flanco": len(self.compacto) / capturados if capturados else 0.0,
+            "esperas": self.esperas,
+        }
+
+
+def leer_traza(ruta):
+    """
+    Lee un fichero de traza guardado con GPIOCaptura.guardar().
+    :return: Generador de (t_ns, pin, nivel).
+    """
+    with open(ruta, "rb") as fichero:
+        magia, version, _, longitud = CABECERA_TRAZA.unpack(fichero.read(CABECERA_TRAZA.size))
+        if magia != MAGIA_TRAZA or version != VERSION_TRAZA:
+            raise ValueError(f"{ruta} no es una traza válida.")
+        datos = fichero.read(longitud)
+    return decodificar(datos)
+
+
+def exportar_vcd(flancos, ruta, nombres=None, modulo="bobinadora"):
+    """
+    Escribe los flancos en formato VCD (Value Change Dump) para verlos en un
+    visor de ondas como GTKWave. Los tiempos se escriben relativos al primer flanco.
+    Los flancos se recorren una sola vez y sin guardarlos: los cambios van a un
+    fichero temporal mientras se descubren los pines, y al final se escribe la
+    cabecera con las señales y se copian detrás.
+    :param flancos: Iterable de (t_ns, pin, nivel), por ejemplo leer_traza().
+    :param ruta: Fichero .vcd de salida.
+    :param nombres: Diccionario pin -> nombre de la señal ('step_husillo'...).
+    :param modulo: Nombre del bloque en el visor.
+    """
+    nombres = nombres or {}
+    identificadores = {pin: chr(33 + i) for i, pin in enumerate(sorted(nombres))}
+    with tempfile.TemporaryFile("w+") as cambios:
+        origen = None
+        actual = None
+        for t, pin, nivel in flancos:
+            if origen is None:
+                origen = t
+            identificador = identificadores.get(pin)
+            if identificador is None:
+                identificador = identificadores[pin] = chr(33 + len(identificadores))
+            if t != actual:
+                cambios.write(f"#{t - origen}\n")
+                actual = t
+            cambios.write(f"{nivel}{identificador}\n")
+        pines = sorted(identificadores)
+        with open(ruta, "w") as fichero:
+            fichero.write(f"$date {time.strftime('%Y-%m-%d %H:%M:%S')} $end\n")
+            fichero.write("$version Motor_para_bobinadora captura.py $end\n")
+            fichero.write("$timescale 1ns $end\n")
+            fichero.write(f"$scope module {modulo} $end\n")
+            for pin in pines:
+                fichero.write(f"$var wire 1 {identificadores[pin]} {nombres.get(pin, f'gpio{pin}')} $end\n")
+            fichero.write("$upscope $end\n$enddefinitions $end\n")
+            fichero.write("$dumpvars\n")
+            for pin in pines:
+                fichero.write(f"x{identificadores[pin]}\n")
+            fichero.write("$end\n")
+            cambios.seek(0)
+            shutil.copyfileobj(cambios, fichero)
+
+
+def comparar_con_plan(flancos, pin, intervalos):
+    """
+    Compara los flancos de subida de un pin STEP con los instantes del plan.
+    El origen se alinea con el primer paso.
+    :param flancos: Iterable de (t_ns, pin, nivel).
+    :param pin: Pin STEP a comparar.
+    :param intervalos: Intervalos del plan (s).
+    :return: Diccionario con pasos, faltan, error_max_ns y error_medio_ns.
+    """
+    pasos = 0
+    error_max = 0.0
+    error_total = 0.0
+    esperado = 0.0
+    origen = None
+    n = len(intervalos)
+    for t, p, nivel in flancos:
+        if p != pin or not nivel:
+            continue
+        if pasos >= n:
+            pasos += 1
+            continue
+        esperado += intervalos[pasos]
+        if origen is None:
+            origen = t - esperado * 1e9
+        error = abs(t - origen - esperado * 1e9)
+        error_max = max(error_max, error)
+        error_total += error
+        pasos += 1
+    return {
+        "pasos": pasos,
+        "faltan": n - pasos,
+        "error_max_ns": error_max,
+        "error_medio_ns": error_total / pasos if pasos else 0.0,
+    }
+
+
+# Coste por flanco de la captura y traza de una bobina simulada
+if __name__ == "__main__":
+    import planificador
+    from ejecutor import EjecutorBobinado
+    from simulador import EjeStepDir, GPIOVirtual, RelojVirtual
+
+    class GPIONulo:
+        BCM, OUT, LOW, HIGH = 11, 0, 0, 1
+
+        def output(self, canal, valor):
+            pass
+
+    def medir(gpio, n=200000, ritmo=None):
+        """Percentiles del tiempo de una llamada a output() (ns), seguidas o a un ritmo de flancos/s."""
+        tiempos = array("q", bytes(8 * n))
+        reloj = time.perf_counter_ns
+        salida = gpio.output
+        periodo = int(1e9 / ritmo) if ritmo else 0
+        siguiente = reloj()
+        for i in range(n):
+            if periodo:
+                siguiente += periodo
+                while reloj() < siguiente:
+                    pass
+            antes = reloj()
+            salida(18, i & 1)
+            tiempos[i] = reloj() - antes
+        ordenados = sorted(tiempos)
+        return sum(tiempos) / n, ordenados[n // 2], ordenados[int(n * 0.999)], ordenados[-1]
+
+    print("Coste de output() por flanco (media / p50 / p99.9 / máx, ns):")
+    for nombre, ritmo in [("seguidas", None), ("40k flancos/s (20 kHz de pasos)", 40000)]:
+        sin = medir(GPIONulo(), ritmo=ritmo)
+        captura = GPIOCaptura(GPIONulo(), capacidad=65536)
+        con = medir(captura, ritmo=ritmo)
+        print(f"  {nombre}:")
+        print(f"    sin captura  {sin[0]:6.0f} {sin[1]:6d} {sin[2]:6d} {sin[3]:8d}")
+        print(f"    con captura  {con[0]:6.0f} {con[1]:6d} {con[2]:6d} {con[3]:8d}")
+        print(f"    sobrecoste medio {con[0] - sin[0]:.0f} ns/flanco, {captura.estadisticas()}")
+
+    # Bobina simulada de 50 vueltas: traza compacta, VCD y comparación con el plan
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    plan = planificador.compilar_plan({"vueltas": 50, "rps": 5.0, "espiras_por_capa": 10},
+                                      {"steps_per_revolution": 200})
+    reloj = RelojVirtual()
+    virtual = GPIOVirtual(reloj, coste_ns=1500)  # ~1.5 µs por llamada, como RPi.GPIO en una Pi 4
+    EjeStepDir(virtual, 23, 24, nombre="husillo")
+    captura = GPIOCaptura(virtual, reloj=reloj, capacidad=4096, hilo=False)
+    EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=captura, reloj=reloj).ejecutar(plan)
+    estadisticas = captura.estadisticas()
+    tuplas = sys.getsizeof([]) + estadisticas["flancos"] * (8 + sys.getsizeof((0, 0, 0)) + 28)
+    print(f"Bobina de 50 vueltas: {estadisticas['flancos']} flancos en {estadisticas['bytes']} bytes "
+          f"({estadisticas['bytes_por_flanco']:.2f} B/flanco, ~{tuplas / estadisticas['bytes']:.0f}x menos que una lista de tuplas)")
+
+    directorio = tempfile.gettempdir()
+    ruta_traza = os.path.join(directorio, "bobina.trz")
+    ruta_vcd = os.path.join(directorio, "bobina.vcd")
+    captura.guardar(ruta_traza)
+    nombres = {23: "step_husillo", 24: "dir_husillo", 5: "step_guiado", 6: "dir_guiado"}
+    import tracemalloc
+    tracemalloc.start()
+    exportar_vcd(leer_traza(ruta_traza), ruta_vcd, nombres)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"Traza en {ruta_traza} ({os.path.getsize(ruta_traza)} bytes), VCD en {ruta_vcd} "
+          f"({os.path.getsize(ruta_vcd)} bytes, exportado con un pico de {pico / 1024:.0f} kB de memoria)")
+    print(f"Husillo contra el plan: {comparar_con_plan(captura.flancos(), 23, plan.husillo)}")
+    print(f"Guiado contra el plan:  {comparar_con_plan(captura.flancos(), 5, plan.traverse)}")
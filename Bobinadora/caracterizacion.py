@@ -0,0 +1,189 @@
+import math
+import os
+import sys
+import tempfile
+import time
+from array import array
+
+import perfiles_motor
+import planificador
+import resonancia
+
+
+class MotorSimuladoPar:
+    """
+    Motor simulado para la caracterización. El par disponible cae con la
+    velocidad; el motor pierde pasos si el par de carga más el de inercia
+    supera al disponible, si se queda demasiado tiempo en una banda de
+    resonancia o si el ejecutor no puede generar la frecuencia de pasos.
+    """
+    def __init__(self, microsteps=1, par_retencion=0.40, rps_corte=5.0, inercia=2e-5, par_carga=0.03,
+                 bandas=((3.6, 4.4), (7.2, 8.0)), t_critico=0.05, tasa_max_pasos=20000):
+        """
+        :param microsteps: Resolución de microstepping (1, 2, 4, 8, 16).
+        :param par_retencion: Par a velocidad cero (N·m).
+        :param rps_corte: Velocidad a la que el par cae a la mitad (rev/s).
+        :param inercia: Inercia del rotor más la carga (kg·m²).
+        :param par_carga: Par resistente del hilo y rozamientos (N·m).
+        :param bandas: Bandas de resonancia a paso completo (rev/s).
+        :param t_critico: Tiempo máximo seguido dentro de una banda (s). Con más micropasos aguanta más.
+        :param tasa_max_pasos: Frecuencia máxima de pasos que genera el ejecutor (pasos/s).
+        """
+        self.microsteps = microsteps
+        self.steps_per_revolution = 200 * microsteps
+        # Con micropasos el par incremental baja, pero la resonancia se amortigua
+        self.par_retencion = par_retencion * (1.0 if microsteps == 1 else 0.85)
+        self.rps_corte = rps_corte
+        self.inercia = inercia
+        self.par_carga = par_carga
+        self.bandas = list(bandas)
+        self.t_critico = t_critico * microsteps
+        self.tasa_max_pasos = tasa_max_pasos
+
+    def par_disponible(self, rps):
+        return self.par_retencion / (1 + rps / self.rps_corte)
+
+    def par_necesario(self, acel):
+        """
+        Par de carga más el de inercia para una aceleración en rev/s² (al frenar solo cuenta la carga).
+        """
+        return self.par_carga + self.inercia * 2 * math.pi * max(acel, 0.0)
+
+    def margen_par(self, intervalos):
+        """
+        :return: Margen de par en el peor paso, (disponible - necesario) / disponible.
+            Negativo si en algún paso se pierde el sincronismo por par.
+        """
+        spr = self.steps_per_revolution
+        rps_anterior = 0.0
+        margen = 1.0
+        for intervalo in intervalos:
+            rps = 1 / (intervalo * spr)
+            margen = min(margen, 1 - self.par_necesario((rps - rps_anterior) / intervalo) / self.par_disponible(rps))
+            rps_anterior = rps
+        return margen
+
+    def ejecutar(self, intervalos):
+        """
+        Recorre una secuencia de intervalos entre pasos.
+        :return: Índice del paso en que se pierde el sincronismo, o None.
+        """
+        spr = self.steps_per_revolution
+        rps_anterior = 0.0
+        en_banda = 0.0
+        for i, intervalo in enumerate(intervalos):
+            if intervalo * self.tasa_max_pasos < 1:
+                return i
+            rps = 1 / (intervalo * spr)
+            acel = (rps - rps_anterior) / intervalo
+            rps_anterior = rps
+            if self.par_necesario(acel) > self.par_disponible(rps):
+                return i
+            if resonancia.banda_de(self.bandas, rps) is not None:
+                en_banda += intervalo
+                if en_banda > self.t_critico:
+                    return i
+            else:
+                en_banda = 0.0
+        return None
+
+
+def intervalos_prueba(spr, rps, acel, rps_inicial=0.2, duracion_crucero=0.5, bandas=(), acel_cruce=None):
+    """
+    Intervalos de una prueba: rampa de aceleración constante hasta rps y crucero.
+    Las bandas indicadas se cruzan con acel_cruce (por defecto, la misma aceleración).
+    """
+    min_delay = 1 / (rps_inicial * spr)
+    target_delay = 1 / (rps * spr)
+    if min_delay < target_delay:
+        min_delay = target_delay
+    intervalos = planificador.rampa_aceleracion_constante(min_delay, target_delay, acel, spr)
+    if bandas:
+        intervalos = resonancia.rampa_evitando_bandas(intervalos, spr, bandas, acel_cruce or acel)
+    intervalos.extend(array("d", [target_delay]) * int(duracion_crucero / target_delay))
+    return intervalos
+
+
+def caracterizar_modo(motor, rps_max_barrido=40.0, paso_rps=0.2, acel_barrido=5.0, acel_cruce=100.0,
+                      acel_max_barrido=5000.0):
+    """
+    Mide los límites de un modo de funcionamiento.
+    1. Barrido de velocidades de crucero con aceleración baja (las bandas ya encontradas se
+       cruzan con acel_cruce): bandas de resonancia y velocidad máxima.
+    2. Búsqueda binaria de la aceleración máxima hasta el 80% de la velocidad máxima.
+    :param motor: Objeto con steps_per_revolution y ejecutar(intervalos) -> índice de pérdida o None.
+    :return: Diccionario con steps_per_revolution, rps_max, acel_max y resonancias.
+    """
+    spr = motor.steps_per_revolution
+
+    def pierde_en_crucero(rps, conocidas):
+        intervalos = intervalos_prueba(spr, rps, acel_barrido, duracion_crucero=0.3, bandas=conocidas,
+                                       acel_cruce=acel_cruce)
+        return motor.ejecutar(intervalos) is not None
+
+    bandas, rps_limite = resonancia.barrido(pierde_en_crucero, paso_rps, rps_max_barrido, paso_rps)
+    rps_max = rps_max_barrido if rps_limite is None else rps_limite
+
+    objetivo = resonancia.velocidad_segura(bandas, 0.8 * rps_max)
+    bajo, alto = acel_barrido, acel_max_barrido
+    for _ in range(20):
+        medio = math.sqrt(bajo * alto)
+        if motor.ejecutar(intervalos_prueba(spr, objetivo, medio, duracion_crucero=0.05, bandas=bandas)) is None:
+            bajo = medio
+        else:
+            alto = medio
+        if alto / bajo < 1.02:
+            break
+
+    return {
+        "steps_per_revolution": spr,
+        "rps_max": round(rps_max, 3),
+        "acel_max": round(bajo, 1),
+        "resonancias": [list(b) for b in bandas],
+    }
+
+
+def caracterizar(nombre_motor, crear_motor, modos, ruta, **opciones):
+    """
+    Caracteriza todos los modos de un motor y guarda el perfil versionado.
+    :param nombre_motor: Nombre del motor ('nema17', '28byj48'...).
+    :param crear_motor: Función nombre_modo -> motor a probar (real o simulado).
+    :param modos: Lista de nombres de modo ('1/1', '1/16', 'full_step'...).
+    :param ruta: Fichero JSON donde se guarda el perfil.
+    :return: Perfil guardado.
+    """
+    perfil = {"motor": nombre_motor, "modos": {}}
+    for modo in modos:
+        inicio = time.perf_counter()
+        perfil["modos"][modo] = caracterizar_modo(crear_motor(modo), **opciones)
+        datos = perfil["modos"][modo]
+        print(f"[INFO] {nombre_motor} {modo}: rps_max={datos['rps_max']} acel_max={datos['acel_max']} "
+              f"resonancias={datos['resonancias']} ({time.perf_counter() - inicio:.1f} s)")
+    return perfiles_motor.guardar_perfil(perfil, ruta)
+
+
+# Caracterización de un NEMA17 simulado con A4988 y coste de carga del perfil
+if __name__ == "__main__":
+    ruta = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.gettempdir(), "perfil_nema17.json")
+    modos = ["1/1", "1/2", "1/4", "1/8", "1/16"]
+    perfil = caracterizar("nema17", lambda modo: MotorSimuladoPar(int(modo.split("/")[1])), modos, ruta)
+    print(f"Perfil versión {perfil['version']} guardado en {ruta}")
+
+    motor = perfiles_motor.parametros_motor(perfil)
+    print(f"Modo más rápido: {perfiles_motor.modo_mas_rapido(perfil)} -> {motor}")
+
+    perfiles_motor._cache_perfiles.clear()
+    inicio = time.perf_counter()
+    perfiles_motor.cargar_perfil(ruta)
+    frio = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    for _ in range(1000):
+        perfiles_motor.cargar_perfil(ruta)
+    caliente = (time.perf_counter() - inicio) / 1000
+    print(f"Carga del perfil: {frio * 1e6:.0f} µs la primera vez, {caliente * 1e6:.1f} µs ya en caché")
+
+    # Bobina de prueba con los valores por defecto del perfil contra la configuración a mano (800 pasos de rampa)
+    receta = {"vueltas": 2000, "rps": 30}
+    plan = planificador.compilar_plan(receta, motor)
+    a_mano = planificador.compilar_plan(dict(receta, rps=5), {"steps_per_revolution": 200})
+    print(f"2000 vueltas: {a_mano.duracion:.1f} s con 5 RPS a mano, {plan.duracion:.1f} s con el perfil")
@@ -0,0 +1,279 @@
+import queue
+import time
+from threading import Thread
+
+import planificador
+
+
+def confirmar_operador(mensaje):
+    """
+    Pide al operador que confirme un paso manual (cortar hilo, cargar carrete...).
+    """
+    input(f"{mensaje} Pulsa Enter para continuar...")
+
+
+class ColaTrabajos:
+    """
+    Cola de producción para bobinar un lote de recetas seguidas.
+    Mientras se bobina la bobina N, un hilo en segundo plano planifica la
+    bobina N+1, de modo que al terminar solo queda el paso manual del operador.
+    """
+    def __init__(self, planificar, bobinar, confirmar=confirmar_operador, anticipacion=1, validar=None):
+        """
+        :param planificar: Función receta -> plan (por ejemplo CachePlanes.obtener_plan).
+        :param bobinar: Función (plan, receta) que ejecuta el bobinado.
+        :param confirmar: Función que recibe un mensaje y espera la confirmación del operador.
+        :param anticipacion: Número de planes que se preparan por adelantado.
+        :param validar: Función receta -> lista de problemas, para rechazar una receta al
+            añadirla (por ejemplo con estimador.estimar(receta, motor)["problemas"]).
+        """
+        self.planificar = planificar
+        self.validar = validar
+        self.bobinar = bobinar
+        self.confirmar = confirmar
+        self.anticipacion = anticipacion
+        self.trabajos = []
+        self.registros = []
+        self.errores = 0
+        self.running = False
+
+    def agregar(self, receta, nombre=None):
+        """
+        Añade una receta al lote.
+        :param receta: Diccionario con los parámetros de la bobina.
+        :param nombre: Nombre del trabajo (por defecto, su posición en la cola).
+        Con validar, una receta con problemas se rechaza con ValueError.
+        """
+        if nombre is None:
+            nombre = f"bobina {len(self.trabajos) + 1}"
+        if self.validar is not None:
+            problemas = self.validar(receta)
+            if problemas:
+                raise ValueError(f"{nombre} no se puede bobinar: {' '.join(problemas)}")
+        self.trabajos.append((nombre, receta))
+
+    def _planificar_lote(self, preparados):
+        """
+        Hilo de planificación: prepara los planes en orden y los deja en la cola.
+        """
+        for nombre, receta in self.trabajos:
+            if not self.running:
+                break
+            inicio = time.perf_counter()
+            try:
+                plan = self.planificar(receta)
+                error = None
+            except Exception as e:
+                plan = None
+                error = e
+            if not self._poner(preparados, (nombre, receta, plan, error, time.perf_counter() - inicio)):
+                if hasattr(plan, "cerrar"):
+                    plan.cerrar()
+                return
+        self._poner(preparados, None)
+
+    def _poner(self, preparados, elemento):
+        # Espera por tramos: si la cola termina (o falla el bobinado) el hilo no se queda bloqueado
+        while self.running:
+            try:
+                preparados.put(elemento, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def ejecutar(self):
+        """
+        Bobina todo el lote y devuelve la lista de registros por trabajo.
+        """
+        self.running = True
+        self.registros = []
+        preparados = queue.Queue(maxsize=self.anticipacion)
+        planificador_hilo = Thread(target=self._planificar_lote, args=(preparados,))
+        planificador_hilo.daemon = True
+        planificador_hilo.start()
+
+        self.inicio = time.perf_counter()
+        fin_anterior = self.inicio
+        cargado = False
+        t_operador = 0.0
+        try:
+            if self.trabajos:
+                # El primer carrete se carga mientras se planifica la primera bobina
+                self.confirmar("Carga el carrete.")
+                t_operador = time.perf_counter() - self.inicio
+                cargado = True
+            while self.running:
+                # Primero el siguiente plan: sólo se pide carrete nuevo si hay algo que bobinar
+                inicio_espera = time.perf_counter()
+                preparado = preparados.get()
+                espera_plan = time.perf_counter() - inicio_espera
+                if preparado is None:
+                    break
+
+                nombre, receta, plan, error, t_planificacion = preparado
+                if error is not None:
+                    print(f"[ERROR] No se pudo planificar {nombre}: {error}")
+                    self.errores += 1
+                    continue
+
+                # Paso manual antes de cada bobina; el plan siguiente se sigue preparando mientras tanto
+                if not cargado:
+                    inicio_operador = time.perf_counter()
+                    self.confirmar("Corta el hilo y carga un carrete nuevo.")
+                    t_operador = time.perf_counter() - inicio_operador
+
+                inicio_bobinado = time.perf_counter()
+                try:
+                    self.bobinar(plan, receta)
+                finally:
+                    if hasattr(plan, "cerrar"):
+                        plan.cerrar()
+                fin = time.perf_counter()
+                cargado = False
+
+                self.registros.append({
+                    "nombre": nombre,
+                    "planificacion": t_planificacion,
+                    "operador": t_operador,
+                    "espera_plan": espera_plan,
+                    "hueco": inicio_bobinado - fin_anterior,
+                    "bobinado": fin - inicio_bobinado,
+                })
+                fin_anterior = fin
+        finally:
+            # Al terminar, con detener() o con un error al bobinar, se libera el hilo de planificación
+            self.running = False
+            while True:
+                try:
+                    preparado = preparados.get_nowait()
+                except queue.Empty:
+                    break
+                if preparado is not None and hasattr(preparado[2], "cerrar"):
+                    preparado[2].cerrar()
+            self.fin = time.perf_counter()
+        return self.registros
+
+    def detener(self):
+        """
+        Termina la cola al acabar la bobina en curso.
+        """
+        self.running = False
+
+    def resumen(self):
+        """
+        Devuelve las métricas del lote. Es un diccionario.
+        """
+        duracion = self.fin - self.inicio
+        n = len(self.registros)
+        return {
+            "bobinas": n,
+            "duracion": duracion,
+            "bobinas_por_hora": n / duracion * 3600 if duracion > 0 else 0.0,
+            "hueco_medio": sum(r["hueco"] for r in self.registros) / n if n else 0.0,
+            "espera_plan_total": sum(r["espera_plan"] for r in self.registros),
+        }
+
+
+# Simulación de un lote: bobinado y operador simulados con tiempo comprimido
+if __name__ == "__main__":
+    import threading
+
+    motor = {"steps_per_revolution": 200}
+    compresion = 500       # 1 s de la simulación equivale a 500 s reales de bobinado
+    tiempo_operador = 0.02  # Cortar hilo y cargar carrete (simulado)
+
+    recetas = [
+        {"vueltas": 1500, "rps": 25, "espiras_por_capa": 80},
+        {"vueltas": 800, "rps": 20, "espiras_por_capa": 40},
+        {"vueltas": 2500, "rps": 30, "espiras_por_capa": 120},
+        {"vueltas": 1500, "rps": 25, "espiras_por_capa": 80},
+        {"vueltas": 1200, "rps": 15, "espiras_por_capa": 60},
+    ]
+
+    def bobinar_simulado(plan, receta):
+        time.sleep(plan.duracion / compresion)
+
+    def operador_simulado(mensaje):
+        time.sleep(tiempo_operador)
+
+    def planificar(receta):
+        return planificador.compilar_plan(receta, motor)
+
+    def ejecutar_en_serie():
+        # Referencia: planificar cada bobina justo antes de bobinarla
+        inicio = time.perf_counter()
+        for receta in recetas:
+            operador_simulado("")
+            bobinar_simulado(planificar(receta), receta)
+        return time.perf_counter() - inicio
+
+    cola = ColaTrabajos(planificar, bobinar_simulado, confirmar=operador_simulado)
+    for receta in recetas:
+        cola.agregar(receta)
+    cola.ejecutar()
+
+    print(f"{'trabajo':<10} {'plan (ms)':>10} {'espera (ms)':>12} {'hueco (ms)':>11} {'bobinado (s)':>13}")
+    for r in cola.registros:
+        print(f"{r['nombre']:<10} {r['planificacion'] * 1000:>10.1f} {r['espera_plan'] * 1000:>12.2f} "
+              f"{r['hueco'] * 1000:>11.1f} {r['bobinado'] * compresion:>13.1f}")
+
+    resumen = cola.resumen()
+    en_serie = ejecutar_en_serie()
+    print(f"Con planificación anticipada: {resumen['duracion']:.3f} s, "
+          f"{resumen['bobinas_por_hora'] / compresion:.1f} bobinas/hora reales, "
+          f"hueco medio {resumen['hueco_medio'] * 1000:.1f} ms")
+    print(f"Planificando en serie: {en_serie:.3f} s, "
+          f"{len(recetas) / en_serie * 3600 / compresion:.1f} bobinas/hora reales")
+
+    # El operador solo recibe avisos cuando hay una bobina que bobinar
+    def planificar_con_fallo(receta):
+        if receta.get("rota"):
+            raise ValueError("receta rota")
+        return planificar(receta)
+
+    mensajes = []
+    cola = ColaTrabajos(planificar_con_fallo, lambda plan, receta: None, confirmar=mensajes.append)
+    cola.agregar(recetas[1])
+    cola.agregar({"vueltas": 100, "rps": 20, "rota": True}, nombre="receta rota")
+    cola.agregar(recetas[4])
+    cola.ejecutar()
+    print(f"Avisos al operador con una receta rota en el lote: {mensajes}")
+    assert mensajes == ["Carga el carrete.", "Corta el hilo y carga un carrete nuevo."]
+    assert cola.errores == 1 and len(cola.registros) == 2
+
+    # Si falla la primera receta, el carrete ya cargado sirve para la siguiente
+    mensajes = []
+    cola = ColaTrabajos(planificar_con_fallo, lambda plan, receta: None, confirmar=mensajes.append)
+    cola.agregar({"vueltas": 100, "rps": 20, "rota": True}, nombre="receta rota")
+    cola.agregar(recetas[1])
+    cola.ejecutar()
+    assert mensajes == ["Carga el carrete."] and len(cola.registros) == 1
+
+    # El primer carrete se carga mientras se planifica la primera bobina
+    def planificar_lento(receta):
+        time.sleep(0.1)
+        return planificar(receta)
+
+    cola = ColaTrabajos(planificar_lento, lambda plan, receta: None, confirmar=lambda mensaje: time.sleep(0.1))
+    cola.agregar(recetas[1])
+    cola.ejecutar()
+    print(f"Primera bobina: planificación de 100 ms y carga de 100 ms, empieza a los "
+          f"{cola.registros[0]['hueco'] * 1000:.0f} ms")
+    assert cola.registros[0]["hueco"] < 0.15
+
+    # Un error al bobinar no deja el hilo de planificación bloqueado
+    def bobinar_con_fallo(plan, receta):
+        raise RuntimeError("atasco del hilo")
+
+    hilos = threading.active_count()
+    cola = ColaTrabajos(planificar, bobinar_con_fallo, confirmar=lambda mensaje: None)
+    for receta in recetas:
+        cola.agregar(receta)
+    try:
+        cola.ejecutar()
+    except RuntimeError as e:
+        print(f"Error al bobinar: {e}")
+    time.sleep(0.3)
+    print(f"Hilos de planificación vivos tras el error: {threading.active_count() - hilos}")
+    assert threading.active_count() == hilos
@@ -0,0 +1,639 @@
+import math
+import time
+from array import array
+
+import planificador
+from perfiles_driver import intervalo_minimo, pausa_activa
+
+
+class EjecutorBobinado:
+    """
+    Ejecuta un plan compilado (PlanBobinado) generando los pulsos STEP del
+    husillo y del guiado contra instantes absolutos, de modo que los retrasos
+    de un paso no se acumulan en los siguientes. El guiado invierte el sentido
+    al terminar cada capa.
+    """
+    def __init__(self, husillo, traverse, gpio=None, reloj=time, umbral_espera=None, driver=None, acel_avance=20.0,
+                 motor=None):
+        """
+        :param husillo: Objeto con step_pin y dir_pin del motor del husillo.
+        :param traverse: Objeto con step_pin y dir_pin del motor del guiado.
+        :param gpio: Módulo GPIO a usar (por defecto RPi.GPIO).
+        :param reloj: Objeto con perf_counter() y sleep() (por defecto el módulo time).
+        :param umbral_espera: Por debajo de este tiempo se espera de forma activa en lugar de
+            dormir, porque time.sleep no es preciso por debajo de ~100 µs. Con un reloj
+            virtual no hace falta (0).
+        :param driver: Perfil de tiempos del driver (perfiles_driver.PERFILES_DRIVER). Si se
+            indica, el pulso STEP dura al menos alto_min, entre pulsos hay al menos bajo_min
+            y DIR se cambia preparacion_dir antes del siguiente flanco de subida. Sin perfil
+            los pulsos duran lo que tarda output() (válido con RPi.GPIO, que tarda más que
+            cualquier mínimo).
+        :param acel_avance: Aceleración máxima del husillo (rev/s²) al cambiar el override del
+            avance o al retener; None para cambiarlo de golpe.
+        :param motor: Diccionario del motor (acel_max, rps_max) que limita el override del
+            avance. Sin acel_max vale la aceleración máxima del propio plan.
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.reloj = reloj
+        self.husillo = husillo
+        self.traverse = traverse
+        if umbral_espera is None:
+            umbral_espera = 0.0 if getattr(reloj, "virtual", False) else 0.0002
+        self.umbral_espera = umbral_espera
+
+        self.pasos_husillo = 0
+        self.pasos_traverse = 0
+        self.capa = 0
+        self.retraso_max = 0.0
+        self.histograma_retraso = None  # metricas.Histograma del retraso de cada paso (ejecutar_continuo)
+        self.running = False
+
+        # Override del avance (%) y retención; el bucle solo lee _escala_objetivo
+        self.acel_avance = acel_avance
+        self.avance_max = 150.0
+        self.avance = 100.0
+        self.retenido = False
+        self.escala = 1.0
+        self._escala_objetivo = 1.0
+        self.motor = motor or {}
+        self._topes = None  # (plan, topes del override) del último plan ejecutado
+
+        self.gpio.setmode(self.gpio.BCM)
+        pines = (husillo.step_pin, husillo.dir_pin, traverse.step_pin, traverse.dir_pin)
+        for pin in pines:
+            self.gpio.setup(pin, self.gpio.OUT)
+        # Nivel en que dejó STEP el proceso anterior, antes de bajarlo: resuelve un paso a
+        # medias al reanudar (punto_control.reanudar)
+        leer = getattr(self.gpio, "input", None)
+        self.niveles_step = tuple(leer(pin) if leer else 0 for pin in (husillo.step_pin, traverse.step_pin))
+        for pin in pines:
+            self.gpio.output(pin, self.gpio.LOW)
+
+        # Esperas que faltan después de cada output() para cumplir los mínimos del driver
+        self.driver = driver
+        self.coste_output = 0.0
+        self.pausa_alto = 0.0
+        self.pausa_bajo = 0.0
+        self.pausa_dir = 0.0
+        if driver is not None:
+            perf_counter = reloj.perf_counter
+            inicio = perf_counter()
+            for _ in range(20):
+                self.gpio.output(traverse.dir_pin, self.gpio.LOW)
+            self.coste_output = (perf_counter() - inicio) / 20
+            self.pausa_alto = max(0.0, driver["alto_min"] - self.coste_output)
+            self.pausa_bajo = max(0.0, driver["bajo_min"] - self.coste_output)
+            # La retención de DIR se cumple sola: DIR solo cambia después de bajar STEP
+            self.pausa_dir = max(0.0, driver["preparacion_dir"] - self.coste_output)
+
+    def _pausa(self, segundos):
+        pausa_activa(segundos, self.reloj)
+
+    def _esperar_hasta(self, instante):
+        restante = instante - self.reloj.perf_counter()
+        if restante > self.umbral_espera:
+            self.reloj.sleep(restante - self.umbral_espera)
+        if self.umbral_espera:
+            # sleep(0) suelta el GIL para que los hilos planificadores no esperen 5 ms, pero
+            # puede tardar la holgura del temporizador (~50 µs): al final se espera sin soltarlo
+            perf_counter = self.reloj.perf_counter
+            while True:
+                restante = instante - perf_counter()
+                if restante <= 0:
+                    break
+                if restante > 0.00006:
+                    self.reloj.sleep(0)
+
+    def ajustar_avance(self, porcentaje):
+        """
+        Override del avance, como en un CNC: escala la base de tiempos del plan en
+        curso sin replanificarlo (100 = el plan tal cual). El cambio empieza en el
+        paso siguiente y llega con la aceleración acel_avance. Por encima de 100 la
+        escala se queda en el tope de cada tramo del plan (_topes_avance).
+        :param porcentaje: Mayor que 0 y hasta avance_max.
+        """
+        if not 0 < porcentaje <= self.avance_max:
+            raise ValueError(f"El avance tiene que estar entre 0 y {self.avance_max:g}%.")
+        self.avance = porcentaje
+        if not self.retenido:
+            self._escala_objetivo = porcentaje / 100
+
+    def retener(self):
+        """
+        Retención del avance: frena hasta parar sobre la trayectoria del plan.
+        """
+        self.retenido = True
+        self._escala_objetivo = 0.0
+
+    def continuar(self):
+        """
+        Sale de la retención: acelera hasta el avance ajustado y sigue el plan donde se paró.
+        """
+        self.retenido = False
+        self._escala_objetivo = self.avance / 100
+
+    def _tramo_escala(self, tramo, escala, objetivo, tasa):
+        """
+        Recorre tramo segundos del plan mientras la escala va hacia objetivo,
+        cambiando a ritmo constante.
+        :param tasa: Cambio de la escala por segundo real; None para cambiarla de golpe y 0
+            para mantenerla (no queda margen de aceleración).
+        :return: (tiempo real, tiempo del plan recorrido, escala final). Al retener, lo
+            recorrido puede quedarse corto: el motor para antes del siguiente paso.
+        """
+        if objetivo == escala == 0.0:
+            return 0.0, 0.0, 0.0
+        if tasa is None:
+            if not objetivo:
+                return 0.0, 0.0, 0.0
+            return tramo / objetivo, tramo, objetivo
+        if not tasa:
+            return tramo / escala, tramo, escala
+        if objetivo > escala:
+            t_cambio = (objetivo - escala) / tasa
+            recorrido = escala * t_cambio + tasa * t_cambio * t_cambio / 2
+            if recorrido >= tramo:
+                t = (math.sqrt(escala * escala + 2 * tasa * tramo) - escala) / tasa
+                return t, tramo, min(objetivo, escala + tasa * t)
+        else:
+            t_cambio = (escala - objetivo) / tasa
+            recorrido = escala * t_cambio - tasa * t_cambio * t_cambio / 2
+            if recorrido >= tramo:
+                t = (escala - math.sqrt(max(0.0, escala * escala - 2 * tasa * tramo))) / tasa
+                return t, tramo, max(objetivo, escala - tasa * t)
+            if not objetivo:
+                return t_cambio, recorrido, 0.0
+        return t_cambio + (tramo - recorrido) / objetivo, tramo, objetivo
+
+    def _topes_avance(self, plan):
+        """
+        Escala máxima del avance en cada tramo del plan (rampas y cruceros). La
+        aceleración del plan crece con el cuadrado de la escala, así que se limita
+        con acel_max, la velocidad con rps_max y los intervalos con el mínimo del
+        driver; nunca baja de 1 (el plan tal cual ya cumple). Cada tope se rebaja
+        lo necesario para frenar con acel_avance hasta el del tramo siguiente (en
+        una rampa no se cuenta con frenar). Los tramos vienen del planificador
+        (info["tramos"]); solo un plan hecho a mano se divide aquí.
+        :return: (inicios, instantes, topes, acel_lim): paso del husillo y tiempo del plan en
+            que empieza cada tramo, su escala máxima (el último tramo es un centinela que no
+            se alcanza) y la aceleración máxima en rev/s².
+        """
+        if self._topes is not None and self._topes[0] is plan:
+            return self._topes[1]
+        spr = plan.info.get("steps_per_revolution", 200)
+        tramos = plan.info.get("tramos")
+        if tramos is None:
+            tramos = planificador.tramos_plan(plan.husillo, spr)
+        infinito = float("inf")
+        rps_max = self.motor.get("rps_max", infinito)
+        minimo = intervalo_minimo(self.driver) if self.driver is not None else 0.0
+        if "intervalos_minimos" in plan.info:
+            minimo_guiado = plan.info["intervalos_minimos"][1]
+        else:
+            minimo_guiado = min(plan.traverse, default=None)
+        if minimo_guiado is None:
+            minimo_guiado = infinito
+        tope_guiado = minimo_guiado / minimo if minimo else infinito
+        acel_lim = self.motor.get("acel_max")
+        if acel_lim is None:
+            # Aceleración máxima del plan (sin el arranque desde parado)
+            acel_lim = max((tramo[4] for tramo in tramos), default=0.0)
+
+        inicios = array("q")
+        instantes = array("d")
+        topes = array("d")
+        minimos = []  # Intervalo mínimo de cada crucero (None en las rampas)
+        for inicio, instante, rampa, intervalo, acel in tramos:
+            tope = min(rps_max * intervalo * spr, intervalo / minimo if minimo else infinito, tope_guiado)
+            if rampa and acel:
+                tope = min(tope, math.sqrt(acel_lim / acel))
+            inicios.append(inicio)
+            instantes.append(instante)
+            topes.append(tope)
+            minimos.append(None if rampa else intervalo)
+        if not topes:
+            inicios.append(0)
+            instantes.append(0.0)
+            topes.append(infinito)
+            minimos.append(None)
+        # Centinela: no se llega nunca (i_h <= len(husillo))
+        inicios.append(len(plan.husillo) + 1)
+        instantes.append(infinito)
+        topes.append(infinito)
+        for k in range(len(minimos) - 1, -1, -1):
+            if k + 1 < len(minimos) and topes[k] > topes[k + 1]:
+                tasa = self.acel_avance * minimos[k] * spr if self.acel_avance and minimos[k] else 0.0
+                if self.acel_avance is not None:
+                    duracion = instantes[k + 1] - instantes[k]
+                    topes[k] = min(topes[k], math.sqrt(topes[k + 1] ** 2 + 2 * tasa * duracion))
+            topes[k] = max(1.0, topes[k])
+        self._topes = (plan, (inicios, instantes, topes, acel_lim))
+        return self._topes[1]
+
+    def _esperar_avance(self, instante):
+        """
+        Retenido: espera a continuar() (o a detener()).
+        :return: Instante real desde el que sigue el plan.
+        """
+        self._esperar_hasta(instante)
+        while self.running and self._escala_objetivo == 0.0:
+            self.reloj.sleep(0.001)
+        return max(instante, self.reloj.perf_counter())
+
+    def ejecutar(self, plan, horario=True, punto_control=None, eventos=None):
+        """
+        Ejecuta el plan completo (o hasta detener()). Durante la ejecución se
+        puede cambiar el avance (ajustar_avance) o retenerlo (retener/continuar).
+        :param plan: Instancia de PlanBobinado (puede ser uno de reanudación, que empieza a
+            media bobina: info["pasos_husillo_inicio"] y info["pasos_traverse_inicio"]).
+        :param horario: Sentido de giro del husillo.
+        :param punto_control: PuntoControl opcional: la posición absoluta de cada eje se
+            escribe en él en cada paso y el registro completo cada punto_control.cada pasos.
+        :param eventos: EventosPosicion opcional, con acciones en posiciones absolutas del husillo.
+        :return: Tiempo empleado (s).
+        """
+        gpio = self.gpio
+        HIGH, LOW = gpio.HIGH, gpio.LOW
+        step_h = self.husillo.step_pin
+        step_t = self.traverse.step_pin
+        dir_t = self.traverse.dir_pin
+        husillo = plan.husillo
+        traverse = plan.traverse
+        n_h = len(husillo)
+        n_t = len(traverse)
+        por_capa = plan.info["pasos_traverse_por_capa"] or n_t + 1
+        base_h = plan.info.get("pasos_husillo_inicio", 0)
+        base_t = plan.info.get("pasos_traverse_inicio", 0)
+        if punto_control is not None:
+            posiciones = punto_control.posiciones
+            cada = punto_control.cada
+        else:
+            posiciones = array("q", [0, 0, 0, 0])
+            cada = n_h + 1
+        siguiente_punto = cada
+        # Posición (relativa al plan) del siguiente evento
+        siguiente_evento = eventos.preparar(base_h) - base_h if eventos is not None else n_h + 1
+        perf_counter = self.reloj.perf_counter
+        pausa_alto = self.pausa_alto
+        pausa_bajo = self.pausa_bajo
+        pausa_dir = self.pausa_dir
+        if self.driver is not None:
+            # Intervalos mínimos calculados al compilar el plan; un plan hecho a mano se recorre
+            minimos = plan.info.get("intervalos_minimos")
+            if minimos is None:
+                minimos = (min(husillo, default=None), min(traverse, default=None))
+            minimo = min((m for m in minimos if m is not None), default=1.0)
+            if minimo < intervalo_minimo(self.driver):
+                raise ValueError(f"El plan pide pasos cada {minimo * 1e6:.2f} µs y el driver necesita "
+                                 f"{intervalo_minimo(self.driver) * 1e6:.2f} µs como mínimo.")
+
+        self.pasos_husillo = 0
+        self.pasos_traverse = 0
+        self.capa = base_t // por_capa
+        gpio.output(self.husillo.dir_pin, HIGH if horario else LOW)
+        gpio.output(dir_t, LOW if self.capa % 2 else HIGH)
+        if pausa_dir:
+            self._pausa(pausa_dir)
+
+        self.running = True
+        inicio = perf_counter()
+        # Instante del siguiente paso de cada eje en tiempo del plan. El tiempo real avanza
+        # lo mismo dividido por la escala del avance, igual para los dos ejes: la
+        # trayectoria no cambia, solo la velocidad a la que se recorre
+        t_h = husillo[0] if n_h else float("inf")
+        t_t = traverse[0] if n_t else float("inf")
+        t_plan = 0.0    # Tiempo del plan recorrido
+        t_real = inicio  # Instante real que le corresponde
+        spr = plan.info.get("steps_per_revolution", 200)
+        inicios, instantes, topes, acel_lim = self._topes_avance(plan)
+        tramo = 0
+        tope = topes[0]
+        inicio_sig = inicios[1]
+        t_sig = instantes[1]
+        tope_sig = topes[1]
+        escala = self.escala = min(self._escala_objetivo, tope)
+        # Primer instante en que cada STEP puede volver a subir (bajo_min tras un paso atrasado)
+        libre_h = 0.0
+        libre_t = 0.0
+        i_h = 0
+        i_t = 0
+        while self.running and (i_h < n_h or i_t < n_t):
+            if i_h >= inicio_sig:
+                tramo += 1
+                tope = topes[tramo]
+                inicio_sig = inicios[tramo + 1]
+                t_sig = instantes[tramo + 1]
+                tope_sig = topes[tramo + 1]
+            siguiente = t_h if t_h <= t_t else t_t
+            objetivo = self._escala_objetivo
+            if objetivo > tope:
+                objetivo = tope
+            if escala > tope_sig and objetivo > tope_sig:
+                # Frenar a tiempo para entrar en el tramo siguiente con su tope
+                intervalo = husillo[i_h]
+                tasa = self.acel_avance * intervalo * spr if self.acel_avance else 0.0
+                if escala * escala - tope_sig * tope_sig >= 2 * tasa * (t_sig - t_plan - intervalo):
+                    objetivo = tope_sig
+            if escala == objetivo and escala:
+                t_real += (siguiente - t_plan) / escala
+            else:
+                # Cambio de avance o retención. Si la aceleración del plan (escalada al
+                # cuadrado) va en el mismo sentido que el cambio, este solo usa lo que
+                # quede hasta acel_lim
+                intervalo = husillo[i_h] if i_h < n_h else 0.0
+                tasa = None
+                if self.acel_avance is not None and intervalo:
+                    acel = self.acel_avance
+                    if i_h:
+                        anterior = husillo[i_h - 1]
+                        acel_plan = (anterior - intervalo) / (anterior * intervalo * intervalo * spr)
+                        if acel_plan and (acel_plan > 0) == (objetivo > escala):
+                            acel = min(acel, acel_lim - escala * escala * abs(acel_plan))
+                    tasa = acel * intervalo * spr if acel > 0 else 0.0
+                dt, recorrido, escala = self._tramo_escala(siguiente - t_plan, escala, objetivo, tasa)
+                self.escala = escala
+                t_real += dt
+                if recorrido < siguiente - t_plan:
+                    t_plan += recorrido
+                    t_real = self._esperar_avance(t_real)
+                    continue
+            t_plan = siguiente
+            if t_h <= t_t:
+                self._esperar_hasta(t_real if t_real >= libre_h else libre_h)
+                posiciones[2] = base_h + i_h + 1  # Pendiente hasta que sale el flanco
+                gpio.output(step_h, HIGH)
+                posiciones[0] = base_h + i_h + 1
+                if pausa_alto:
+                    self._pausa(pausa_alto)
+                gpio.output(step_h, LOW)
+                if pausa_bajo:
+                    libre_h = perf_counter() + pausa_bajo
+                i_h += 1
+                self.pasos_husillo = i_h
+                t_h = t_h + husillo[i_h] if i_h < n_h else float("inf")
+                if i_h == siguiente_punto:
+                    siguiente_punto += cada
+                    punto_control.guardar(base_h + i_h, base_t + i_t, self.capa, horario)
+                if i_h == siguiente_evento:
+                    siguiente_evento = eventos.disparar(base_h + i_h) - base_h
+            else:
+                self._esperar_hasta(t_real if t_real >= libre_t else libre_t)
+                posiciones[3] = base_t + i_t + 1
+                gpio.output(step_t, HIGH)
+                posiciones[1] = base_t + i_t + 1
+                if pausa_alto:
+                    self._pausa(pausa_alto)
+                gpio.output(step_t, LOW)
+                if pausa_bajo:
+                    libre_t = perf_counter() + pausa_bajo
+                i_t += 1
+                self.pasos_traverse = i_t
+                t_t = t_t + traverse[i_t] if i_t < n_t else float("inf")
+                if (base_t + i_t) % por_capa == 0:
+                    # Fin de capa: invertir el guiado antes del siguiente paso
+                    self.capa += 1
+                    gpio.output(dir_t, LOW if self.capa % 2 else HIGH)
+                    if pausa_dir:
+                        libre_t = max(libre_t, perf_counter() + pausa_dir)
+        if punto_control is not None:
+            punto_control.guardar(base_h + i_h, base_t + i_t, self.capa, horario)
+        if eventos is not None and i_h == n_h:
+            eventos.terminar(base_h + i_h)
+        self.running = False
+        return perf_counter() - inicio
+
+    def ejecutar_continuo(self, plan, horario=True, pasos_traverse_por_vuelta=0, pasos_traverse_por_capa=0,
+                          entre_tramos=None):
+        """
+        Marcha continua con un PlanContinuo hasta que el plan termina
+        (plan.detener()) o se llama a detener(). El guiado, si se indica, da
+        un paso cada steps_per_revolution / pasos_traverse_por_vuelta pasos del husillo.
+        :param plan: PlanContinuo ya iniciado.
+        :param horario: Sentido de giro del husillo.
+        :param pasos_traverse_por_vuelta: Pasos del guiado por vuelta del husillo (0 sin guiado).
+        :param pasos_traverse_por_capa: Pasos del guiado antes de invertirlo (0 sin inversión).
+        :param entre_tramos: Función sin argumentos que se llama en este hilo antes de pedir cada
+            tramo (por ejemplo EntradasFisicas.sondear, para que un paro no espere al GIL).
+        :return: Tiempo empleado (s).
+        """
+        gpio = self.gpio
+        HIGH, LOW = gpio.HIGH, gpio.LOW
+        step_h = self.husillo.step_pin
+        step_t = self.traverse.step_pin
+        dir_t = self.traverse.dir_pin
+        perf_counter = self.reloj.perf_counter
+        observar = self.histograma_retraso.observar if self.histograma_retraso is not None else None
+        cada = plan.steps_per_revolution / pasos_traverse_por_vuelta if pasos_traverse_por_vuelta else 0
+        siguiente_traverse = cada
+        pausa_alto = self.pausa_alto
+        pausa_bajo = self.pausa_bajo
+        pausa_dir = self.pausa_dir
+
+        self.pasos_husillo = 0
+        self.pasos_traverse = 0
+        self.capa = 0
+        self.retraso_max = 0.0
+        gpio.output(self.husillo.dir_pin, HIGH if horario else LOW)
+        gpio.output(dir_t, HIGH)
+        if pausa_dir:
+            self._pausa(pausa_dir)
+
+        self.running = True
+        inicio = perf_counter()
+        t = inicio
+        libre = 0.0
+        i_h = 0
+        while self.running:
+            if entre_tramos is not None:
+                entre_tramos()
+            tramo = plan.siguiente_tramo()
+            if tramo is None:
+                break
+            for intervalo in tramo:
+                t += intervalo
+                self._esperar_hasta(t if t >= libre else libre)
+                retraso = perf_counter() - t
+                if retraso > self.retraso_max:
+                    self.retraso_max = retraso
+                if observar:
+                    observar(retraso)
+                gpio.output(step_h, HIGH)
+                if pausa_alto:
+                    self._pausa(pausa_alto)
+                gpio.output(step_h, LOW)
+                i_h += 1
+                if cada and i_h >= siguiente_traverse:
+                    siguiente_traverse += cada
+                    gpio.output(step_t, HIGH)
+                    if pausa_alto:
+                        self._pausa(pausa_alto)
+                    gpio.output(step_t, LOW)
+                    self.pasos_traverse += 1
+                    if pasos_traverse_por_capa and self.pasos_traverse % pasos_traverse_por_capa == 0:
+                        self.capa += 1
+                        gpio.output(dir_t, LOW if self.capa % 2 else HIGH)
+                        if pausa_dir:
+                            self._pausa(pausa_dir)
+                if pausa_bajo:
+                    libre = perf_counter() + pausa_bajo
+                if not self.running:
+                    break
+            self.pasos_husillo = i_h
+        if not self.running:
+            plan.cerrar()  # Parada sin rampa: el planificador no tiene que seguir
+        self.running = False
+        return perf_counter() - inicio
+
+    def detener(self):
+        """
+        Detiene la ejecución después del paso en curso.
+        """
+        self.running = False
+
+
+# Override del avance y retención: latencia, aceleración, trayectoria y coste por paso
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    from types import SimpleNamespace
+    from cache_planes import CachePlanes
+    from eventos import EventosPosicion
+    from perfiles_driver import perfil_driver
+    from gpio_registros import GPIORegistros, crear_fichero_registros
+    from simulador import EjeStepDir, GPIOVirtual, RelojVirtual
+
+    # 1. Bobina simulada a 20 RPS con un motor de 40 rev/s² y 25 RPS como mucho: 50% en t = 3 s,
+    #    150% en t = 6 s (se queda en 125% por rps_max), retención en t = 9 s y continuar en t = 12 s.
+    #    Se compara el orden de los pasos con una ejecución sin override
+    spr = 200
+    motor = {"steps_per_revolution": spr, "acel_max": 40.0, "rps_max": 25.0}
+    receta = {"vueltas": 300, "rps": 20.0, "espiras_por_capa": 50}
+    plan = planificador.compilar_plan(receta, motor)
+
+    def simular(cambios):
+        reloj = RelojVirtual()
+        gpio = GPIOVirtual(reloj, traza=True)
+        husillo = EjeStepDir(gpio, 23, 24, nombre="husillo")
+        guiado = EjeStepDir(gpio, 5, 6, nombre="guiado")
+        ejecutor = EjecutorBobinado(husillo, guiado, gpio=gpio, reloj=reloj, driver=perfil_driver("A4988"),
+                                    motor=motor)
+        gpio.flancos.clear()
+        ordenes = []
+        for instante, orden in cambios:
+            def aplicar(orden=orden):
+                ordenes.append((reloj.perf_counter(), husillo.pulsos, orden))
+                if orden == "retener":
+                    ejecutor.retener()
+                elif orden == "continuar":
+                    ejecutor.continuar()
+                else:
+                    ejecutor.ajustar_avance(orden)
+            reloj.programar(instante, aplicar)
+        ejecutor.ejecutar(plan)
+        pasos = [(t, pin) for t, pin, nivel in gpio.flancos if nivel and pin in (23, 5)]
+        return ejecutor, husillo, guiado, pasos, ordenes
+
+    def cinematica(subidas, desde=0, hasta=None, ventana=20):
+        """
+        Velocidad y aceleración máximas del husillo a partir de los instantes de sus pasos,
+        con velocidades medias de `ventana` pasos y sin las ventanas que cruzan una parada.
+        """
+        hasta = len(subidas) if hasta is None else hasta
+        v_max = acel_max = 0.0
+        anterior = None
+        for i in range(max(desde, 2 * ventana), hasta):
+            dt = subidas[i] - subidas[i - ventana]
+            if dt > ventana * 0.01:
+                anterior = None
+                continue
+            v = ventana / (spr * dt)
+            medio = (subidas[i] + subidas[i - ventana]) / 2
+            if anterior is not None:
+                acel_max = max(acel_max, abs(v - anterior[0]) / (medio - anterior[1]))
+            if i % ventana == 0:
+                anterior = (v, medio)
+            v_max = max(v_max, v)
+        return v_max, acel_max
+
+    ejecutor, husillo, guiado, referencia, _ = simular([])
+    subidas_ref = [t / 1e9 for t, pin in referencia if pin == 23]
+    cambios = [(3.0, 50), (6.0, 150), (9.0, "retener"), (12.0, "continuar")]
+    ejecutor, husillo_o, guiado_o, pasos, ordenes = simular(cambios)
+    igual = [pin for _, pin in pasos] == [pin for _, pin in referencia]
+    print(f"Bobina de {receta['vueltas']} vueltas a {receta['rps']:g} RPS: {referencia[-1][0] / 1e9:.2f} s sin override, "
+          f"{pasos[-1][0] / 1e9:.2f} s con override; pasos {husillo_o.pulsos}/{husillo.pulsos} y "
+          f"{guiado_o.pulsos}/{guiado.pulsos}, mismo orden de pasos que el plan: {'sí' if igual else 'no'}")
+    # Escala real de cada paso del husillo: intervalo del plan / intervalo real
+    subidas = [t / 1e9 for t, pin in pasos if pin == 23]
+    escalas = [plan.husillo[i] / (subidas[i] - subidas[i - 1]) for i in range(1, len(subidas))]
+    for t_orden, paso, orden in ordenes:
+        objetivo = 0.0 if orden == "retener" else min(ejecutor.avance if orden == "continuar" else orden, 125) / 100
+        antes = escalas[paso - 1] if paso else 1.0
+        # Latencia: pasos hasta que la escala se mueve; llegada: hasta el 1% del objetivo
+        latencia = next(i - paso + 1 for i in range(paso, len(escalas)) if abs(escalas[i] - antes) > 1e-6)
+        if objetivo:
+            llegada = next(i for i in range(paso, len(escalas)) if abs(escalas[i] - objetivo) < 0.01 * objetivo)
+            fin = f"{objetivo * 100:g}% en {llegada - paso + 1} pasos ({subidas[llegada + 1] - t_orden:.3f} s)"
+        else:
+            parada = max(range(paso, len(subidas) - 1), key=lambda i: subidas[i + 1] - subidas[i])
+            fin = (f"parado en el paso {parada + 1} ({parada + 1 - paso} pasos de frenada), "
+                   f"{subidas[parada + 1] - subidas[parada]:.2f} s quieto")
+        print(f"  {str(orden):>9s} en t = {t_orden:.0f} s (paso {paso}): cambia en {latencia} paso(s), {fin}")
+    # Límites del motor y del driver en toda la bobina, incluidas las rampas del plan
+    v_ref, acel_ref = cinematica(subidas_ref)
+    v_max, acel = cinematica(subidas)
+    intervalo = min(b - a for a, b in zip(subidas, subidas[1:]))
+    print(f"  velocidad máx {v_max:.2f} RPS (sin override {v_ref:.2f}, límite {motor['rps_max']:g}), aceleración máx "
+          f"{acel:.1f} rev/s² (sin override {acel_ref:.1f}, límite {motor['acel_max']:g}), intervalo mínimo "
+          f"{intervalo * 1e6:.0f} µs (driver {intervalo_minimo(ejecutor.driver) * 1e6:.0f} µs)")
+
+    # 2. Tiempo real con el backend de registros: coste por paso a escala fija y cambiando,
+    #    y bloques de memoria ocupados antes y después de una ejecución con cambios
+    ruta = crear_fichero_registros()
+    gpio = GPIORegistros(ruta)
+    ejecutor = EjecutorBobinado(SimpleNamespace(step_pin=23, dir_pin=24), SimpleNamespace(step_pin=17, dir_pin=27),
+                                gpio=gpio)
+    n = 300000
+    plan = planificador.PlanBobinado(array("d", [1e-7]) * n, array("d"), {"pasos_traverse_por_capa": 0,
+                                                                         "steps_per_revolution": spr})
+    # El cambio a 50% se pide en el paso 1: con intervalos tan cortos dura toda la ejecución
+    cambio = EventosPosicion(spr)
+    cambio.en_paso(1, lambda p: ejecutor.ajustar_avance(50), en_linea=True)
+    for nombre, eventos in (("al 100%", None), ("cambiando de avance", cambio)):
+        ejecutor.ajustar_avance(100)
+        ejecutor.ejecutar(plan, eventos=eventos)  # Calentamiento
+        ejecutor.ajustar_avance(100)
+        bloques = sys.getallocatedblocks()
+        duracion = ejecutor.ejecutar(plan, eventos=eventos)
+        bloques = sys.getallocatedblocks() - bloques
+        print(f"Backend de registros {nombre}: {duracion / n * 1e9:.0f} ns por paso, escala final "
+              f"{ejecutor.escala:.6f}, {bloques:+d} bloques de memoria tras {n} pasos")
+    cambio.esperar()
+
+    # 3. Arranque de una bobina de 2 h desde la caché: los tramos del override y los intervalos
+    #    mínimos vienen con el plan, así que no se recorre antes del primer paso
+    motor_2h = {"steps_per_revolution": spr, "acel_max": 30.0}
+    receta_2h = {"vueltas": 14400, "rps": 2.0, "espiras_por_capa": 100}
+    with tempfile.TemporaryDirectory() as directorio:
+        cache = CachePlanes(directorio, max_bytes=256 * 1024 * 1024)
+        inicio = time.perf_counter()
+        cache.obtener_plan(receta_2h, motor_2h).cerrar()
+        compilacion = time.perf_counter() - inicio
+        plan = cache.obtener_plan(receta_2h, motor_2h)
+        ejecutor = EjecutorBobinado(SimpleNamespace(step_pin=23, dir_pin=24), SimpleNamespace(step_pin=17, dir_pin=27),
+                                    gpio=gpio, driver=perfil_driver("A4988"), motor=motor_2h)
+        primero = EventosPosicion(spr)
+        primero.en_paso(1, lambda p: ejecutor.detener(), en_linea=True)
+        inicio = time.perf_counter()
+        ejecutor.ejecutar(plan, eventos=primero)
+        arranque = time.perf_counter() - inicio - plan.husillo[0]
+        primero.esperar()
+        print(f"Bobina de 2 h ({len(plan.husillo)} pasos) desde la caché: {arranque * 1e3:.2f} ms antes del primer paso "
+              f"(compilarla y guardarla: {compilacion:.2f} s)")
+        assert arranque < 0.05
+        plan.cerrar()
+    gpio.cleanup()
+    os.remove(ruta)
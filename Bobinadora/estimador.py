@@ -0,0 +1,267 @@
+import math
+import os
+from array import array
+from types import SimpleNamespace
+
+import planificador
+from perfiles_driver import intervalo_minimo
+
+# CPU por paso medida con cada perfil de driver (medir_coste_paso)
+_COSTES_MEDIDOS = {}
+
+
+def medir_coste_paso(driver=None, pasos=20000):
+    """
+    CPU que ocupa el ejecutor por cada paso (pulso y bucle), midiendo un plan
+    sin esperas con el backend de registros sobre un fichero: no toca pines.
+    Se mide una vez por perfil de driver. Con un driver lento el plan va al
+    intervalo mínimo del driver, así que el valor es como mucho ese intervalo.
+    :param driver: Perfil de perfiles_driver, o None.
+    :return: Segundos por paso.
+    """
+    clave = tuple(sorted(driver.items())) if driver else None
+    if clave in _COSTES_MEDIDOS:
+        return _COSTES_MEDIDOS[clave]
+    from ejecutor import EjecutorBobinado
+    from gpio_registros import GPIORegistros, crear_fichero_registros
+
+    ruta = crear_fichero_registros()
+    gpio = GPIORegistros(ruta)
+    try:
+        ejecutor = EjecutorBobinado(SimpleNamespace(step_pin=23, dir_pin=24), SimpleNamespace(step_pin=17, dir_pin=27),
+                                    gpio=gpio, driver=driver)
+        intervalo = intervalo_minimo(driver) if driver else 1e-7
+        plan = planificador.PlanBobinado(array("d", [intervalo]) * pasos, array("d"), {"pasos_traverse_por_capa": 0})
+        coste = ejecutor.ejecutar(plan) / pasos
+    finally:
+        gpio.cleanup()
+        os.remove(ruta)
+    _COSTES_MEDIDOS[clave] = coste
+    return coste
+
+
+def _trapecio(s, e, v_max, d, acel):
+    """
+    Tiempo para recorrer d vueltas empezando a s rev/s y acabando a e rev/s,
+    sin pasar de v_max ni de la aceleración acel.
+    :return: (tiempo en s, velocidad máxima alcanzada).
+    """
+    pico = math.sqrt(min(v_max * v_max, (2 * acel * d + s * s + e * e) / 2))
+    d_acel = (pico * pico - s * s) / (2 * acel)
+    d_frenada = (pico * pico - e * e) / (2 * acel)
+    return (pico - s) / acel + (pico - e) / acel + max(0.0, d - d_acel - d_frenada) / pico, pico
+
+
+def _aceleraciones(subida, spr, bandas):
+    """
+    Aceleración máxima de una rampa de subida, por separado para los pasos que
+    cruzan una banda de resonancia y para el resto. Por paso, a = Δ(v²)·spr/2
+    (exacta en una rampa de aceleración constante).
+    :return: (aceleración fuera de las bandas, aceleración en los cruces), en rev/s².
+    """
+    fuera = cruce = 0.0
+    v2_anterior = None
+    for delay in subida:
+        v = 1 / (delay * spr)
+        if v2_anterior is not None:
+            acel = (v * v - v2_anterior) * spr / 2
+            if any(banda[0] < v <= banda[1] for banda in bandas):
+                cruce = max(cruce, acel)
+            else:
+                fuera = max(fuera, acel)
+        v2_anterior = v * v
+    return fuera, cruce
+
+
+def _tramos_rps_fijas(receta, motor):
+    subida, crucero, total = planificador.rampa_subida(receta, motor)
+    spr = motor["steps_per_revolution"]
+    n = len(subida)
+    pico = 1 / (min(subida) * spr) if n else 1 / (crucero * spr)
+    t_rampa = sum(subida)
+    return [
+        ("subida", n / spr, t_rampa, pico),
+        ("crucero", (total - 2 * n) / spr, (total - 2 * n) * crucero, 1 / (crucero * spr)),
+        ("bajada", n / spr, t_rampa, pico),
+    ], _aceleraciones(subida, spr, motor.get("resonancias", []))
+
+
+def _tramos_velocidad_hilo(receta, motor):
+    # Como compilar_plan_velocidad_hilo, pero por capas: cada capa es un trapecio
+    # entre las velocidades de unión con sus vecinas
+    completa = planificador.completar_receta(receta)
+    for clave in ("velocidad_hilo", "diametro_nucleo", "diametro_hilo"):
+        if completa.get(clave, 0) <= 0:
+            raise ValueError(f"La receta de velocidad de hilo constante necesita {clave} mayor que 0.")
+    spr = motor["steps_per_revolution"]
+    acel = completa.get("acel", motor.get("acel_max", 20.0))
+    velocidades = planificador.rps_por_capa(completa, motor)
+    total = int(completa["vueltas"] * spr)
+    pasos_capa = int(completa["espiras_por_capa"] * spr)
+    longitudes = [min(pasos_capa, total - k * pasos_capa) / spr for k in range(len(velocidades))]
+    inicial = min(completa["rps_inicial"], velocidades[0])
+    uniones = [inicial] + [min(a, b) for a, b in zip(velocidades, velocidades[1:])] + [completa["rps_inicial"]]
+    for k, d in enumerate(longitudes):
+        uniones[k + 1] = min(uniones[k + 1], math.sqrt(uniones[k] ** 2 + 2 * acel * d))
+    for k in range(len(longitudes) - 1, -1, -1):
+        uniones[k] = min(uniones[k], math.sqrt(uniones[k + 1] ** 2 + 2 * acel * longitudes[k]))
+    tramos = []
+    for k, (v, d) in enumerate(zip(velocidades, longitudes)):
+        tiempo, pico = _trapecio(uniones[k], uniones[k + 1], v, d, acel)
+        tramos.append((f"capa {k + 1}", d, tiempo, pico))
+    return tramos, (acel, 0.0)  # rps_por_capa deja las capas fuera de las bandas: no hay cruces
+
+
+def estimar(receta, motor, guiado=None, driver=None, coste_paso=None, carga_max=0.8):
+    """
+    Estima sin hardware y sin compilar el plan entero si una receta se puede
+    bobinar y cuánto tardará: la bobina se recorre por tramos (rampas y
+    crucero, o una capa por tramo con velocidad de hilo constante), así que
+    el tiempo no depende de las horas de bobinado.
+    :param receta: Receta como la de compilar_plan.
+    :param motor: Diccionario del motor del husillo (como en compilar_plan).
+    :param guiado: Diccionario del motor del guiado (steps_per_revolution y rps_max), opcional.
+    :param driver: Perfil de perfiles_driver de los drivers, opcional.
+    :param coste_paso: CPU del ejecutor por paso (s); por defecto se mide (medir_coste_paso).
+    :param carga_max: Fracción de un núcleo que puede ocupar el ejecutor (el resto es para la interfaz
+        y los planificadores).
+    :return: Diccionario con duracion (s), pasos de cada eje, pasos/s máximos de cada eje, carga de
+        CPU máxima y media del ejecutor, tramos, avisos y problemas (vacía si se puede bobinar).
+    """
+    completa = planificador.completar_receta(receta)
+    spr = motor["steps_per_revolution"]
+    ptv = completa["pasos_traverse_por_vuelta"]
+    if coste_paso is None:
+        coste_paso = medir_coste_paso(driver)
+    avisos = []
+    problemas = []
+
+    if "velocidad_hilo" in receta:
+        tramos, (acel, acel_cruce) = _tramos_velocidad_hilo(receta, motor)
+    else:
+        tramos, (acel, acel_cruce) = _tramos_rps_fijas(receta, motor)
+        rps_crucero = tramos[1][3]
+        if rps_crucero < completa["rps"] * 0.999:
+            avisos.append(f"El crucero se baja de {completa['rps']} a {rps_crucero:.2f} RPS "
+                          f"(rps_max o banda de resonancia del motor).")
+    # La rampa se comprueba contra acel_max y solo los cruces de bandas contra la aceleración de cruce
+    limite_acel = motor.get("acel_max")
+    if limite_acel is not None and acel > limite_acel * 1.05:
+        problemas.append(f"La rampa acelera hasta {acel:.0f} rev/s² y el motor admite {limite_acel:.0f} rev/s²: "
+                         f"perderá pasos.")
+    limite_cruce = planificador.aceleracion_cruce(motor)
+    if acel_cruce > limite_cruce * 1.05:
+        problemas.append(f"El cruce de las bandas de resonancia acelera hasta {acel_cruce:.0f} rev/s² y el motor "
+                         f"admite {limite_cruce:.0f} rev/s²: perderá pasos.")
+
+    f_driver = 1 / intervalo_minimo(driver) if driver else float("inf")
+    salida = []
+    excesos = {"cpu": [], "driver": [], "guiado": []}  # (valor, tramo) de los tramos que no se pueden ejecutar
+    inicio = 0.0
+    pico_h = pico_t = carga_pico = 0.0
+    for nombre, vueltas, duracion, rps in tramos:
+        f_h = rps * spr
+        f_t = rps * ptv
+        carga = (f_h + f_t) * coste_paso
+        salida.append({"nombre": nombre, "inicio": inicio, "duracion": duracion, "vueltas": vueltas, "rps": rps,
+                       "pasos_s_husillo": f_h, "pasos_s_guiado": f_t, "carga": carga})
+        inicio += duracion
+        pico_h = max(pico_h, f_h)
+        pico_t = max(pico_t, f_t)
+        carga_pico = max(carga_pico, carga)
+        if carga > carga_max:
+            excesos["cpu"].append((carga, nombre))
+        if max(f_h, f_t) > f_driver:
+            excesos["driver"].append((max(f_h, f_t), nombre))
+        if guiado and f_t / guiado["steps_per_revolution"] > guiado["rps_max"]:
+            excesos["guiado"].append((f_t / guiado["steps_per_revolution"], nombre))
+
+    for tipo, lista in excesos.items():
+        if not lista:
+            continue
+        peor, nombre = max(lista, key=lambda exceso: exceso[0])
+        donde = nombre if len(lista) == 1 else f"{len(lista)} tramos (el peor, {nombre})"
+        if tipo == "cpu":
+            problemas.append(f"{donde}: el ejecutor necesita el {peor * 100:.0f}% de la CPU "
+                             f"(máximo {carga_max * 100:.0f}%).")
+        elif tipo == "driver":
+            problemas.append(f"{donde}: {peor:.0f} pasos/s, el driver admite {f_driver:.0f}.")
+        else:
+            problemas.append(f"{donde}: el guiado tendría que ir a {peor:.1f} RPS y su motor llega a "
+                             f"{guiado['rps_max']} RPS.")
+
+    total_h = int(completa["vueltas"] * spr)
+    total_t = int(completa["vueltas"] * ptv)
+    return {
+        "duracion": inicio,
+        "pasos_husillo": total_h,
+        "pasos_traverse": total_t,
+        "pasos_s_max_husillo": pico_h,
+        "pasos_s_max_guiado": pico_t,
+        "carga_max": carga_pico,
+        "carga_media": (total_h + total_t) * coste_paso / inicio if inicio else 0.0,
+        "coste_paso": coste_paso,
+        "tramos": salida,
+        "avisos": avisos,
+        "problemas": problemas,
+    }
+
+
+# Estimación contra el plan compilado, tiempo de estimación de trabajos de horas y recetas inviables
+if __name__ == "__main__":
+    import time
+    from perfiles_driver import perfil_driver
+
+    inicio = time.perf_counter()
+    coste = medir_coste_paso()
+    print(f"CPU del ejecutor por paso (backend de registros): {coste * 1e6:.2f} µs "
+          f"(medido una vez en {(time.perf_counter() - inicio) * 1e3:.0f} ms)")
+
+    motor = {"steps_per_revolution": 200, "acel_max": 30.0, "rps_max": 40.0}
+    recetas = {
+        "rps fijas, rampa lineal": ({"vueltas": 400, "rps": 8.0}, {"steps_per_revolution": 200}),
+        "rps fijas, acel. constante": ({"vueltas": 400, "rps": 12.0}, motor),
+        "velocidad de hilo": ({"vueltas": 600, "espiras_por_capa": 30, "velocidad_hilo": 120.0,
+                               "diametro_nucleo": 15.0, "diametro_hilo": 0.35}, motor),
+    }
+    print("Estimación contra el plan compilado:")
+    for nombre, (receta, m) in recetas.items():
+        t0 = time.perf_counter()
+        estimacion = estimar(receta, m, coste_paso=coste)
+        t_estimar = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        plan = planificador.compilar_plan(receta, m)
+        t_compilar = time.perf_counter() - t0
+        pico = 1 / (min(plan.husillo) * m["steps_per_revolution"])
+        print(f"  {nombre:28s} {estimacion['duracion']:8.2f} s (plan {plan.duracion:8.2f} s, error "
+              f"{abs(estimacion['duracion'] / plan.duracion - 1) * 100:.3f}%), pico {estimacion['pasos_s_max_husillo'] / 200:.2f}"
+              f" RPS (plan {pico:.2f}); {t_estimar * 1e3:.2f} ms contra {t_compilar * 1e3:.0f} ms compilando")
+        assert not estimacion["problemas"], estimacion["problemas"]  # Recetas que el motor sí puede bobinar
+
+    print("Trabajos de horas:")
+    for nombre, receta in (("4 h a 3 RPS", {"vueltas": 43200, "rps": 3.0, "espiras_por_capa": 200}),
+                           ("velocidad de hilo, 3000 capas", {"vueltas": 90000, "espiras_por_capa": 30,
+                                                              "velocidad_hilo": 60.0, "diametro_nucleo": 20.0,
+                                                              "diametro_hilo": 0.1})):
+        t0 = time.perf_counter()
+        estimacion = estimar(receta, motor, coste_paso=coste)
+        t_estimar = time.perf_counter() - t0
+        print(f"  {nombre:30s} {estimacion['duracion'] / 3600:.2f} h, {len(estimacion['tramos'])} tramos, "
+              f"{estimacion['pasos_husillo']:,} pasos, estimado en {t_estimar * 1e3:.1f} ms")
+
+    print("Recetas inviables:")
+    drv = perfil_driver("DRV8825")
+    casos = (
+        ("50 RPS a 1/32 de paso con DRV8825", {"vueltas": 500, "rps": 50.0},
+         {"steps_per_revolution": 6400}, None, drv, None),
+        ("guiado lento", {"vueltas": 500, "rps": 20.0, "pasos_traverse_por_vuelta": 100},
+         {"steps_per_revolution": 200}, {"steps_per_revolution": 200, "rps_max": 5.0}, None, coste),
+        ("rampa fijada demasiado brusca", {"vueltas": 500, "rps": 12.0, "pasos_rampa": 400}, motor, None, None, coste),
+        ("rampa fijada brusca con bandas de resonancia", {"vueltas": 500, "rps": 12.0, "pasos_rampa": 40000},
+         dict(motor, resonancias=[[3.6, 4.4]]), None, None, coste),
+    )
+    for nombre, receta, m, guiado, driver, coste_caso in casos:
+        estimacion = estimar(receta, m, guiado=guiado, driver=driver, coste_paso=coste_caso)
+        print(f"  {nombre}:")
+        for problema in estimacion["problemas"] + estimacion["avisos"]:
+            print(f"    - {problema}")
@@ -0,0 +1,231 @@
+import bisect
+import math
+import queue
+import threading
+import time
+from array import array
+
+
+class EventosPosicion:
+    """
+    Acciones ligadas a posiciones absolutas del husillo (pasos desde el
+    inicio de la bobina). Las posiciones se guardan ordenadas y sin repetir;
+    el ejecutor solo compara su contador de pasos con la siguiente (un
+    entero) y, al llegar, disparar() hace las acciones en_linea en el mismo
+    paso (escribir un pin, detener el ejecutor) y pasa el resto a un hilo
+    despachador, así las funciones lentas (LCD, registro) no retrasan los pulsos.
+    """
+    SIN_EVENTOS = 1 << 62
+
+    def __init__(self, steps_per_revolution=200, reloj=time):
+        """
+        :param steps_per_revolution: Pasos del husillo por vuelta (para en_vuelta).
+        :param reloj: Objeto con perf_counter() para la marca de tiempo de cada disparo.
+        """
+        self.steps_per_revolution = steps_per_revolution
+        self.reloj = reloj
+        self.posiciones = array("q")  # Pasos con eventos, ordenados
+        self.acciones = []            # Lista de (accion, args, en_linea) de cada posición
+        self.finales = []
+        self.disparos = []            # (paso, instante) de cada disparo
+        self.latencias = []           # Despacho: desde el disparo hasta que empieza la acción (s)
+        self.errores = 0
+        self._indice = 0
+        self._cola = queue.Queue()
+        self._hilo = None
+
+    def en_paso(self, paso, accion, *args, en_linea=False):
+        """
+        :param paso: Posición absoluta del husillo (la acción va justo después de ese paso).
+        :param accion: Función a llamar como accion(paso, *args).
+        :param en_linea: Llamarla dentro del bucle del ejecutor (tiene que ser rápida).
+        """
+        if paso <= 0:
+            raise ValueError("La posición de un evento tiene que ser mayor que 0.")
+        i = bisect.bisect_left(self.posiciones, paso)
+        if i < len(self.posiciones) and self.posiciones[i] == paso:
+            self.acciones[i].append((accion, args, en_linea))
+        else:
+            self.posiciones.insert(i, paso)
+            self.acciones.insert(i, [(accion, args, en_linea)])
+
+    def en_vuelta(self, vuelta, accion, *args, en_linea=False):
+        self.en_paso(math.ceil(vuelta * self.steps_per_revolution - 1e-9), accion, *args, en_linea=en_linea)
+
+    def al_final_de_capa(self, capa, receta, accion, *args, en_linea=False):
+        """
+        :param capa: Capa (desde 1) tras la que se hace la acción.
+        :param receta: Receta completa (espiras_por_capa).
+        """
+        self.en_vuelta(capa * receta["espiras_por_capa"], accion, *args, en_linea=en_linea)
+
+    def pin(self, paso, gpio, pin, nivel):
+        """
+        Escribe un pin justo después del paso indicado (en línea).
+        """
+        self.en_paso(paso, lambda _, p, n: gpio.output(p, n), pin, nivel, en_linea=True)
+
+    def al_terminar(self, accion, *args):
+        """
+        Acción al acabar el plan (despachada como las demás).
+        """
+        self.finales.append((accion, args, False))
+
+    def preparar(self, inicio=0):
+        """
+        Coloca el índice en el primer evento después de inicio (un plan de
+        reanudación empieza a media bobina) y arranca el despachador.
+        :return: Posición del siguiente evento.
+        """
+        self._indice = bisect.bisect_right(self.posiciones, inicio)
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._despachar, daemon=True)
+            self._hilo.start()
+        return self.posiciones[self._indice] if self._indice < len(self.posiciones) else self.SIN_EVENTOS
+
+    def disparar(self, paso):
+        """
+        Hace los eventos de la posición paso (la que devolvió la llamada anterior).
+        :return: Posición del siguiente evento.
+        """
+        i = self._indice
+        instante = self.reloj.perf_counter()
+        self.disparos.append((paso, instante))
+        for accion, args, en_linea in self.acciones[i]:
+            if en_linea:
+                accion(paso, *args)
+            else:
+                self._cola.put((accion, args, paso, instante))
+        i += 1
+        self._indice = i
+        return self.posiciones[i] if i < len(self.posiciones) else self.SIN_EVENTOS
+
+    def terminar(self, paso):
+        for accion, args, _ in self.finales:
+            self._cola.put((accion, args, paso, self.reloj.perf_counter()))
+
+    def _despachar(self):
+        while True:
+            accion, args, paso, instante = self._cola.get()
+            self.latencias.append(self.reloj.perf_counter() - instante)
+            try:
+                accion(paso, *args)
+            except Exception as e:
+                self.errores += 1
+                print(f"[ERROR] Evento en el paso {paso}: {e}")
+            finally:
+                self._cola.task_done()
+
+    def esperar(self):
+        """
+        Espera a que el despachador termine las acciones pendientes.
+        """
+        self._cola.join()
+
+
+# Eventos en la vuelta exacta con el ejecutor a toda velocidad: simulación y coste por paso
+if __name__ == "__main__":
+    import os
+    import planificador
+    from types import SimpleNamespace
+    from ejecutor import EjecutorBobinado
+    from gpio_registros import GPIORegistros, crear_fichero_registros
+    from simulador import EjeStepDir, GPIOVirtual, RelojVirtual
+
+    # 1. Bobina simulada a 30 RPS: pausa en la vuelta 500, aviso al acabar la capa 3,
+    #    LED cada 100 vueltas y al terminar; se comprueba la posición real del motor en cada evento
+    motor = {"steps_per_revolution": 200}
+    receta = planificador.completar_receta({"vueltas": 1200, "rps": 30.0, "espiras_por_capa": 150})
+    plan = planificador.compilar_plan(receta, motor)
+    reloj = RelojVirtual()
+    gpio = GPIOVirtual(reloj, traza=True)
+    husillo = EjeStepDir(gpio, 23, 24, nombre="husillo")
+    guiado = EjeStepDir(gpio, 5, 6, nombre="guiado")
+    ejecutor = EjecutorBobinado(husillo, guiado, gpio=gpio, reloj=reloj)
+    gpio.setup(16, gpio.OUT)
+    gpio.flancos.clear()
+
+    eventos = EventosPosicion(200, reloj=reloj)
+    vistos = []
+    eventos.en_vuelta(500, lambda paso: ejecutor.detener(), en_linea=True)
+    eventos.en_vuelta(500, lambda paso: vistos.append(("pausa para la toma", paso)))
+    eventos.al_final_de_capa(3, receta, lambda paso, capa: vistos.append((f"fin de la capa {capa}", paso)), 3)
+    for vuelta in range(100, 1201, 100):
+        eventos.pin(vuelta * 200, gpio, 16, vuelta // 100 % 2)
+    eventos.al_terminar(lambda paso: vistos.append(("final: parpadeo del LCD", paso)))
+    # Posición real del motor en cada disparo (el observador ve los flancos al momento)
+    posicion_real = {}
+    for paso in eventos.posiciones:
+        eventos.en_paso(paso, lambda p: posicion_real.__setitem__(p, husillo.pulsos), en_linea=True)
+
+    ejecutor.ejecutar(plan, eventos=eventos)
+    pausa = husillo.pulsos
+    resto = planificador.reanudar_plan(plan, receta, pausa, guiado.pulsos)
+    ejecutor.ejecutar(resto, eventos=eventos)
+    eventos.esperar()
+    exactos = sum(posicion_real[p] == p for p in posicion_real)
+    print(f"Pausa en el paso {pausa} (vuelta {pausa / 200:.0f}) y reanudación; al final {husillo.pulsos} pasos")
+    for nombre, paso in vistos:
+        print(f"  {nombre}: paso {paso} (vuelta {paso / 200:g})")
+    # Cada flanco del LED tiene que caer entre el paso del evento y el siguiente
+    subidas = [t for t, pin, nivel in gpio.flancos if pin == 23 and nivel]
+    led = [(t, nivel) for t, pin, nivel in gpio.flancos if pin == 16]
+    subidas.append(float("inf"))  # El último evento es el último paso
+    bien = sum(subidas[v * 200 - 1] <= t < subidas[v * 200] for v, (t, _) in zip(range(100, 1201, 100), led))
+    print(f"  {exactos} de {len(posicion_real)} eventos con el motor en el paso exacto; LED: {bien} de "
+          f"{len(led)} flancos entre el paso del evento y el siguiente")
+
+    # 2. Tiempo real con el backend de registros: coste por paso del ejecutor con y sin eventos
+    ruta = crear_fichero_registros()
+    gpio = GPIORegistros(ruta)
+    ejecutor = EjecutorBobinado(SimpleNamespace(step_pin=23, dir_pin=24), SimpleNamespace(step_pin=17, dir_pin=27),
+                                gpio=gpio)
+    n = 300000
+    plan = planificador.PlanBobinado(array("d", [1e-7]) * n, array("d"), {"pasos_traverse_por_capa": 0})
+
+    def medir(con_eventos):
+        eventos = None
+        if con_eventos:
+            eventos = EventosPosicion(200)
+            for paso in range(1000, n + 1, 1000):
+                eventos.en_paso(paso, lambda p: None)
+        duracion = ejecutor.ejecutar(plan, eventos=eventos)
+        if eventos is not None:
+            eventos.esperar()
+        return duracion / n
+
+    # Calentamiento y rondas alternando el orden. La máquina se va acelerando durante varias
+    # ejecuciones, así que el coste de los eventos se toma de la diferencia dentro de cada ronda
+    for _ in range(3):
+        medir(False)
+        medir(True)
+    medidas = {False: [], True: []}
+    diferencias = []
+    for ronda in range(15):
+        orden = (False, True) if ronda % 2 == 0 else (True, False)
+        ronda_medidas = {con_eventos: medir(con_eventos) for con_eventos in orden}
+        for con_eventos, tiempo in ronda_medidas.items():
+            medidas[con_eventos].append(tiempo)
+        diferencias.append(ronda_medidas[True] - ronda_medidas[False])
+    for con_eventos, texto in ((False, "sin eventos"), (True, f"con {n // 1000} eventos")):
+        tiempos = sorted(medidas[con_eventos])
+        print(f"Backend de registros a toda velocidad {texto}: {tiempos[len(tiempos) // 2] * 1e9:.0f} ns por paso "
+              f"(mediana de {len(tiempos)}, de {tiempos[0] * 1e9:.0f} a {tiempos[-1] * 1e9:.0f})")
+    diferencias.sort()
+    print(f"  Coste de los eventos (mediana de la diferencia por ronda): {diferencias[len(diferencias) // 2] * 1e9:+.0f} "
+          f"ns por paso, entre {diferencias[len(diferencias) // 4] * 1e9:+.0f} y "
+          f"{diferencias[3 * len(diferencias) // 4] * 1e9:+.0f} (cuartiles)")
+
+    # 3. Latencia del despacho a 6000 pasos/s (30 RPS): el ejecutor suelta el GIL entre pasos
+    n = 12000
+    plan = planificador.PlanBobinado(array("d", [1 / 6000]) * n, array("d"), {"pasos_traverse_por_capa": 0})
+    eventos = EventosPosicion(200)
+    for paso in range(100, n + 1, 100):
+        eventos.en_paso(paso, lambda p: None)
+    ejecutor.ejecutar(plan, eventos=eventos)
+    eventos.esperar()
+    latencias = sorted(eventos.latencias)
+    print(f"Despacho fuera del bucle a 6000 pasos/s: {len(latencias)} eventos, latencia mediana "
+          f"{latencias[len(latencias) // 2] * 1e6:.0f} µs, máxima {latencias[-1] * 1e6:.0f} µs")
+    gpio.cleanup()
+    os.remove(ruta)
@@ -0,0 +1,494 @@
+import atexit
+import os
+import select
+import threading
+import time
+from datetime import timedelta
+
+
+class GPIOGpiod:
+    """
+    Backend GPIO sobre el dispositivo de caracteres de Linux (libgpiod v2)
+    con la misma interfaz que RPi.GPIO, para usarlo en su lugar en las clases
+    de motor y en el ejecutor. Las líneas configuradas con setup() se piden
+    al kernel en una sola solicitud, así output() con una lista de pines
+    cambia STEP/DIR/MS/EN a la vez con un único ioctl. Los cambios
+    posteriores (otro setup(), detección de flancos) reconfiguran las líneas
+    ya pedidas sin soltarlas, y las líneas nuevas van en otra solicitud: las
+    salidas nunca se quedan sueltas ni flotando. Las entradas con
+    add_event_detect() usan los eventos de flanco del kernel, con su marca de
+    tiempo. El kernel libera las líneas al cerrar el proceso, sin cleanup().
+    La numeración es la de gpiochip0, que en la Raspberry coincide con BCM.
+    """
+    BOARD, BCM = 10, 11
+    OUT, IN = 0, 1
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self, chip="/dev/gpiochip0", consumidor="bobinadora", gpiod=None):
+        """
+        :param chip: Dispositivo del chip GPIO.
+        :param consumidor: Nombre con el que aparecen las líneas en gpioinfo.
+        :param gpiod: Módulo gpiod a usar (por defecto el instalado; GpiodSimulado para probar sin la Raspberry).
+        """
+        if gpiod is None:
+            import gpiod
+        if not hasattr(gpiod, "request_lines"):
+            raise RuntimeError("Se necesita libgpiod v2 (python3-libgpiod >= 2.0).")
+        self.gpiod = gpiod
+        self.chip = chip
+        self.consumidor = consumidor
+        self.modo = None
+        self.salidas = {}    # pin -> último nivel escrito
+        self.entradas = {}   # pin -> resistencia de pull
+        self.detecciones = {}  # pin -> (flanco, callbacks, bouncetime)
+        self.detectados = set()
+        self.ultimos_flancos = {}  # pin -> marca de tiempo del kernel (ns)
+        self._solicitudes = []  # (solicitud, pines) en el orden en que se pidieron
+        self._solicitud_de = {}  # pin -> solicitud que tiene su línea
+        self._pendiente = False
+        self._lock = threading.Lock()
+        self._hilo_eventos = None
+        self._activo = False
+
+        linea = gpiod.line
+        self._activa, self._inactiva = linea.Value.ACTIVE, linea.Value.INACTIVE
+        self._sesgos = {self.PUD_OFF: linea.Bias.DISABLED, self.PUD_UP: linea.Bias.PULL_UP,
+                        self.PUD_DOWN: linea.Bias.PULL_DOWN}
+        self._flancos = {self.RISING: linea.Edge.RISING, self.FALLING: linea.Edge.FALLING,
+                         self.BOTH: linea.Edge.BOTH}
+        atexit.register(self.cleanup)
+
+    def setmode(self, modo):
+        if modo != self.BCM:
+            raise ValueError("El backend libgpiod solo admite numeración BCM (offsets de gpiochip0).")
+        self.modo = modo
+
+    def getmode(self):
+        return self.modo
+
+    def setwarnings(self, activar):
+        pass
+
+    def setup(self, canal, modo, pull_up_down=PUD_OFF, initial=-1):
+        """
+        Registra las líneas. La solicitud al kernel se hace de una vez, en el
+        primer output() o input() después de los setup().
+        """
+        if self.modo is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BCM)")
+        for pin in canal if isinstance(canal, (list, tuple)) else (canal,):
+            if modo == self.OUT:
+                self.entradas.pop(pin, None)
+                self.salidas[pin] = 1 if initial == 1 else self.salidas.get(pin, 0)
+            else:
+                self.salidas.pop(pin, None)
+                self.entradas[pin] = pull_up_down
+        self._pendiente = True
+
+    def _configuracion(self, pines):
+        """
+        Ajustes de las líneas indicadas. Las salidas conservan el último nivel
+        escrito; las que ya no están configuradas quedan como entradas.
+        """
+        linea = self.gpiod.line
+        configuracion = {}
+        for nivel in (0, 1):
+            salidas = tuple(pin for pin in pines if self.salidas.get(pin) == nivel)
+            if salidas:
+                configuracion[salidas] = self.gpiod.LineSettings(
+                    direction=linea.Direction.OUTPUT, output_value=self._activa if nivel else self._inactiva)
+        for pin in pines:
+            if pin in self.salidas:
+                continue
+            ajustes = {"direction": linea.Direction.INPUT}
+            if pin in self.entradas:
+                ajustes["bias"] = self._sesgos.get(self.entradas[pin], linea.Bias.AS_IS)
+            if pin in self.detecciones:
+                flanco, _, rebote = self.detecciones[pin]
+                ajustes["edge_detection"] = self._flancos[flanco]
+                if rebote:
+                    ajustes["debounce_period"] = timedelta(milliseconds=rebote)
+            configuracion[(pin,)] = self.gpiod.LineSettings(**ajustes)
+        return configuracion
+
+    def _solicitar(self):
+        """
+        Aplica la configuración: las solicitudes que ya existen se reconfiguran
+        (reconfigure_lines, sin soltar las líneas) y las líneas nuevas se piden
+        todas juntas en una solicitud más.
+        """
+        with self._lock:
+            for solicitud, pines in self._solicitudes:
+                solicitud.reconfigure_lines(self._configuracion(pines))
+            nuevos = tuple(sorted(pin for pin in (*self.salidas, *self.entradas) if pin not in self._solicitud_de))
+            if nuevos:
+                solicitud = self.gpiod.request_lines(self.chip, consumer=self.consumidor,
+                                                     config=self._configuracion(nuevos))
+                self._solicitudes.append((solicitud, nuevos))
+                for pin in nuevos:
+                    self._solicitud_de[pin] = solicitud
+            self._pendiente = False
+        if self.detecciones and self._hilo_eventos is None:
+            self._activo = True
+            self._hilo_eventos = threading.Thread(target=self._leer_eventos, daemon=True)
+            self._hilo_eventos.start()
+
+    def output(self, canal, valor):
+        if self._pendiente:
+            self._solicitar()
+        if isinstance(canal, (list, tuple)):
+            valores = valor if isinstance(valor, (list, tuple)) else [valor] * len(canal)
+            por_solicitud = {}
+            for pin, v in zip(canal, valores):
+                if pin not in self.salidas:
+                    raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+                self.salidas[pin] = 1 if v else 0
+                por_solicitud.setdefault(self._solicitud_de[pin], {})[pin] = self._activa if v else self._inactiva
+            for solicitud, cambios in por_solicitud.items():
+                solicitud.set_values(cambios)  # Un solo ioctl si los pines se pidieron juntos
+            return
+        if canal not in self.salidas:
+            raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+        self.salidas[canal] = 1 if valor else 0
+        self._solicitud_de[canal].set_value(canal, self._activa if valor else self._inactiva)
+
+    def input(self, pin):
+        if self._pendiente:
+            self._solicitar()
+        if pin not in self.entradas and pin not in self.salidas:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        return 1 if self._solicitud_de[pin].get_value(pin) == self._activa else 0
+
+    def add_event_detect(self, pin, flanco, callback=None, bouncetime=None):
+        if pin not in self.entradas:
+            raise RuntimeError("You must setup() the GPIO channel as an input first")
+        if pin in self.detecciones:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self.detecciones[pin] = (flanco, [callback] if callback else [], bouncetime)
+        self._solicitar()
+
+    def add_event_callback(self, pin, callback):
+        self.detecciones[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        if self.detecciones.pop(pin, None) is not None:
+            self._solicitar()
+
+    def event_detected(self, pin):
+        if pin in self.detectados:
+            self.detectados.discard(pin)
+            return True
+        return False
+
+    def ultimo_flanco_ns(self, pin):
+        """
+        Marca de tiempo del kernel (CLOCK_MONOTONIC, ns) del último flanco de la entrada.
+        """
+        return self.ultimos_flancos.get(pin)
+
+    def _leer_eventos(self):
+        while self._activo:
+            # Solicitudes con detección de flancos (normalmente una: la de las entradas)
+            solicitudes = list({self._solicitud_de[pin]: None for pin in list(self.detecciones)
+                                if pin in self._solicitud_de})
+            if not solicitudes:
+                time.sleep(0.01)
+                continue
+            # Se espera a la vez en todas (poll sobre sus descriptores): esperándolas por turnos, un
+            # flanco en una tardaba lo que quedase de espera en las otras (hasta 100 ms)
+            try:
+                listas, _, _ = select.select([solicitud.fd for solicitud in solicitudes], [], [], 0.1)
+                for solicitud in solicitudes:
+                    if solicitud.fd in listas:
+                        self._despachar_eventos(solicitud.read_edge_events())
+            except (OSError, ValueError):
+                time.sleep(0.01)  # Alguna solicitud se ha liberado mientras se esperaba
+
+    def _despachar_eventos(self, eventos):
+        for evento in eventos:
+            pin = evento.line_offset
+            self.ultimos_flancos[pin] = evento.timestamp_ns
+            deteccion = self.detecciones.get(pin)
+            if deteccion is None:
+                continue
+            self.detectados.add(pin)
+            for callback in deteccion[1]:
+                callback(pin)
+
+    def cleanup(self, canal=None):
+        """
+        Libera las líneas. No es imprescindible: el kernel las libera al cerrar el proceso.
+        Con canal, esas líneas pasan a entradas sin soltar la solicitud (como RPi.GPIO).
+        """
+        if canal is not None:
+            for pin in canal if isinstance(canal, (list, tuple)) else (canal,):
+                self.salidas.pop(pin, None)
+                self.entradas.pop(pin, None)
+                self.detecciones.pop(pin, None)
+            if self.salidas or self.entradas:
+                self._solicitar()
+                return
+        self._activo = False
+        with self._lock:
+            for solicitud, _ in self._solicitudes:
+                solicitud.release()
+            self._solicitudes.clear()
+            self._solicitud_de.clear()
+        self.salidas.clear()
+        self.entradas.clear()
+        self.detecciones.clear()
+        self._pendiente = False
+
+
+class GpiodSimulado:
+    """
+    Chip GPIO simulado con la parte de la API de libgpiod v2 que usa
+    GPIOGpiod (request_lines, LineSettings, set_value(s), get_value y
+    eventos de flanco con el descriptor fd para esperarlos con poll). Cuenta las llamadas al kernel (ioctls) y puede
+    añadir un coste fijo a cada una.
+    """
+    class line:
+        class Direction:
+            AS_IS, INPUT, OUTPUT = "as_is", "input", "output"
+
+        class Value:
+            INACTIVE, ACTIVE = 0, 1
+
+        class Edge:
+            NONE, RISING, FALLING, BOTH = "none", "rising", "falling", "both"
+
+        class Bias:
+            AS_IS, DISABLED, PULL_UP, PULL_DOWN = "as_is", "disabled", "pull_up", "pull_down"
+
+    class LineSettings:
+        def __init__(self, direction="as_is", edge_detection="none", bias="as_is", output_value=0,
+                     debounce_period=timedelta(0)):
+            self.direction = direction
+            self.edge_detection = edge_detection
+            self.bias = bias
+            self.output_value = output_value
+            self.debounce_period = debounce_period
+
+    class EdgeEvent:
+        class Type:
+            RISING_EDGE, FALLING_EDGE = "rising_edge", "falling_edge"
+
+        def __init__(self, event_type, timestamp_ns, line_offset):
+            self.event_type = event_type
+            self.timestamp_ns = timestamp_ns
+            self.line_offset = line_offset
+
+    def __init__(self, num_lineas=58, coste_ioctl=0.0):
+        """
+        :param num_lineas: Líneas del chip (58 en el BCM2711).
+        :param coste_ioctl: Tiempo de espera activa por llamada al kernel (s).
+        """
+        self.num_lineas = num_lineas
+        self.coste_ioctl = coste_ioctl
+        self.niveles = [0] * num_lineas
+        self.ocupadas = {}
+        self.ioctls = 0
+
+    def _ioctl(self):
+        self.ioctls += 1
+        if self.coste_ioctl:
+            fin = time.perf_counter() + self.coste_ioctl
+            while time.perf_counter() < fin:
+                pass
+
+    def request_lines(self, path, consumer=None, config=None):
+        self._ioctl()
+        ajustes = {}
+        for claves, valor in (config or {}).items():
+            for offset in claves if isinstance(claves, tuple) else (claves,):
+                if not 0 <= offset < self.num_lineas:
+                    raise ValueError(f"offset {offset} fuera de rango")
+                if offset in self.ocupadas:
+                    raise OSError(16, "Device or resource busy")
+                ajustes[offset] = valor
+        return GpiodSimulado._Solicitud(self, consumer, ajustes)
+
+    def forzar_entrada(self, offset, nivel):
+        """
+        Cambia el nivel de una entrada desde fuera y genera el evento de flanco si está pedido.
+        """
+        if self.niveles[offset] == nivel:
+            return
+        self.niveles[offset] = nivel
+        solicitud = self.ocupadas.get(offset)
+        if solicitud is not None:
+            solicitud._flanco(offset, nivel)
+
+    class _Solicitud:
+        def __init__(self, chip, consumidor, ajustes):
+            self.chip = chip
+            self.consumidor = consumidor
+            self.ajustes = ajustes
+            self.eventos = []
+            self.cond = threading.Condition()
+            self.fd, self._aviso = os.pipe()  # Como LineRequest.fd: legible con eventos pendientes
+            os.set_blocking(self.fd, False)
+            self.liberada = False
+            self.reconfiguraciones = 0
+            for offset, ajuste in ajustes.items():
+                chip.ocupadas[offset] = self
+                if ajuste.direction == "output":
+                    chip.niveles[offset] = ajuste.output_value
+                elif ajuste.bias == "pull_up":
+                    chip.niveles[offset] = 1
+
+        def _comprobar(self, offset):
+            if self.liberada:
+                raise ValueError("la solicitud está liberada")
+            if offset not in self.ajustes:
+                raise ValueError(f"la línea {offset} no está en la solicitud")
+
+        def set_value(self, offset, valor):
+            self._comprobar(offset)
+            self.chip._ioctl()
+            self.chip.niveles[offset] = valor
+
+        def set_values(self, valores):
+            for offset in valores:
+                self._comprobar(offset)
+            self.chip._ioctl()
+            for offset, valor in valores.items():
+                self.chip.niveles[offset] = valor
+
+        def reconfigure_lines(self, config):
+            if self.liberada:
+                raise ValueError("la solicitud está liberada")
+            ajustes = {}
+            for claves, valor in config.items():
+                for offset in claves if isinstance(claves, tuple) else (claves,):
+                    self._comprobar(offset)
+                    ajustes[offset] = valor
+            self.chip._ioctl()
+            for offset in self.ajustes:
+                # Las líneas sin ajustes vuelven a los de por defecto, como en libgpiod
+                ajuste = self.ajustes[offset] = ajustes.get(offset, GpiodSimulado.LineSettings())
+                if ajuste.direction == "output":
+                    self.chip.niveles[offset] = ajuste.output_value
+            self.reconfiguraciones += 1
+
+        def get_value(self, offset):
+            self._comprobar(offset)
+            self.chip._ioctl()
+            return self.chip.niveles[offset]
+
+        def _flanco(self, offset, nivel):
+            flanco = self.ajustes[offset].edge_detection
+            if flanco == "none" or (flanco == "rising" and not nivel) or (flanco == "falling" and nivel):
+                return
+            tipo = GpiodSimulado.EdgeEvent.Type.RISING_EDGE if nivel else GpiodSimulado.EdgeEvent.Type.FALLING_EDGE
+            with self.cond:
+                if not self.eventos:
+                    os.write(self._aviso, b"\0")
+                self.eventos.append(GpiodSimulado.EdgeEvent(tipo, time.monotonic_ns(), offset))
+                self.cond.notify_all()
+
+        def wait_edge_events(self, timeout=None):
+            if self.liberada:
+                raise ValueError("la solicitud está liberada")
+            segundos = timeout.total_seconds() if isinstance(timeout, timedelta) else timeout
+            with self.cond:
+                if not self.eventos:
+                    self.cond.wait(segundos)
+                return bool(self.eventos)
+
+        def read_edge_events(self, max_events=None):
+            self.chip._ioctl()
+            with self.cond:
+                eventos, self.eventos = self.eventos, []
+                try:
+                    os.read(self.fd, 64)
+                except BlockingIOError:
+                    pass
+            return eventos
+
+        def release(self):
+            if self.liberada:
+                return
+            self.liberada = True
+            for offset in self.ajustes:
+                if self.chip.ocupadas.get(offset) is self:
+                    del self.chip.ocupadas[offset]
+            with self.cond:
+                self.cond.notify_all()
+                os.close(self._aviso)
+                os.close(self.fd)
+                self.fd = -1
+
+
+# Comparación con RPi.GPIO: conmutaciones/s y escritura de varios pines
+if __name__ == "__main__":
+    from simulador import GPIOVirtual, RelojVirtual
+
+    pines = [23, 24, 17, 27]  # STEP, DIR, MS1, EN
+    try:
+        import RPi.GPIO as rpi
+        gpiod_backend = GPIOGpiod()
+        en_la_raspberry = True
+    except ImportError:
+        # Sin la Raspberry: chip simulado con ~1 µs por ioctl y GPIOVirtual en lugar de RPi.GPIO
+        print("[INFO] Sin RPi.GPIO ni libgpiod: se usan GpiodSimulado (1 µs por ioctl) y GPIOVirtual; "
+              "los tiempos solo miden el coste en Python.")
+        rpi = GPIOVirtual(RelojVirtual())
+        chip = GpiodSimulado(coste_ioctl=1e-6)
+        gpiod_backend = GPIOGpiod(gpiod=chip)
+        en_la_raspberry = False
+
+    def medir(gpio, n=100000):
+        gpio.setmode(gpio.BCM)
+        gpio.setup(pines, gpio.OUT)
+        gpio.output(pines[0], 0)
+        inicio = time.perf_counter()
+        for i in range(n):
+            gpio.output(23, i & 1)
+        conmutaciones = n / (time.perf_counter() - inicio)
+        valores = [1, 0, 1, 1]
+        # Varios pines: RPi.GPIO escribe pin a pin, libgpiod de una vez
+        inicio = time.perf_counter()
+        for i in range(n // 10):
+            gpio.output(pines, valores if i & 1 else [0, 0, 0, 0])
+        multiple = (time.perf_counter() - inicio) / (n // 10)
+        return conmutaciones, multiple
+
+    for nombre, gpio in [("RPi.GPIO" if en_la_raspberry else "GPIOVirtual", rpi), ("libgpiod", gpiod_backend)]:
+        conmutaciones, multiple = medir(gpio)
+        print(f"{nombre:12s} {conmutaciones:10.0f} conmutaciones/s, escritura de 4 pines {multiple * 1e6:6.2f} µs")
+    if not en_la_raspberry:
+        antes = chip.ioctls
+        gpiod_backend.output(pines, [1, 1, 0, 1])
+        print(f"ioctls por escritura de 4 pines con libgpiod: {chip.ioctls - antes} (RPi.GPIO: 4 escrituras separadas)")
+
+        # Eventos de flanco con marca de tiempo del kernel
+        recibidos = []
+        gpiod_backend.setup(22, gpiod_backend.IN, pull_up_down=gpiod_backend.PUD_UP)
+        gpiod_backend.add_event_detect(22, gpiod_backend.FALLING,
+                                       callback=lambda pin: recibidos.append(time.monotonic_ns()))
+        latencias = []
+        for _ in range(200):
+            chip.forzar_entrada(22, 0)
+            while len(recibidos) <= len(latencias):
+                time.sleep(0)
+            latencias.append(recibidos[-1] - gpiod_backend.ultimo_flanco_ns(22))
+            chip.forzar_entrada(22, 1)
+        latencias.sort()
+        print(f"Flanco -> callback: mediana {latencias[100] / 1e3:.0f} µs, máx {latencias[-1] / 1e3:.0f} µs "
+              f"(el flanco conserva la marca de tiempo del kernel)")
+
+        # Otro setup() y quitar la detección con el motor en marcha: las salidas no se sueltan
+        salidas = gpiod_backend._solicitud_de[23]
+        niveles = [chip.niveles[pin] for pin in pines]
+        gpiod_backend.setup(16, gpiod_backend.OUT, initial=gpiod_backend.HIGH)
+        gpiod_backend.output(16, 1)
+        gpiod_backend.remove_event_detect(22)
+        seguidas = (gpiod_backend._solicitud_de[23] is salidas and not salidas.liberada
+                    and [chip.niveles[pin] for pin in pines] == niveles)
+        print(f"setup() y remove_event_detect() después de usarlo: {len(gpiod_backend._solicitudes)} solicitudes, "
+              f"{salidas.reconfiguraciones} reconfiguraciones de la de STEP/DIR/MS/EN y ninguna liberación: "
+              f"{'sí' if seguidas else 'no'}")
+    gpiod_backend.cleanup()
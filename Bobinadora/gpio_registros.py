@@ -0,0 +1,288 @@
+import mmap
+import os
+import tempfile
+import time
+
+
+# Registros del bloque GPIO del BCM2835/BCM2711 (desplazamiento en bytes)
+GPFSEL0 = 0x00          # Función de cada pin, 3 bits por pin, 10 pines por registro
+GPSET0 = 0x1C           # Escribir un 1 pone el pin a HIGH (pines 0-31)
+GPCLR0 = 0x28           # Escribir un 1 pone el pin a LOW (pines 0-31)
+GPLEV0 = 0x34           # Nivel de los pines (pines 0-31)
+GPPUD = 0x94            # Pull-up/down del BCM2835/2836/2837: valor a aplicar...
+GPPUDCLK0 = 0x98        # ...y reloj que lo aplica a los pines marcados (pines 0-31)
+GPIO_PUP_PDN_CNTRL0 = 0xE4  # Pull-up/down del BCM2711, 2 bits por pin, 16 pines por registro
+TAMANO_BLOQUE = 4096
+
+
+def detectar_soc(ruta="/proc/device-tree/compatible"):
+    """
+    Identifica el SoC por el árbol de dispositivos.
+    :return: 'bcm2711' en la Raspberry Pi 4 y 'bcm2835' en las anteriores (o si no se puede leer).
+    """
+    try:
+        with open(ruta, "rb") as fichero:
+            compatible = fichero.read()
+    except OSError:
+        return "bcm2835"
+    return "bcm2711" if b"bcm2711" in compatible or b"bcm2838" in compatible else "bcm2835"
+
+
+def crear_fichero_registros(ruta=None):
+    """
+    Crea un fichero con el tamaño del bloque GPIO, todo a cero, que se puede
+    mapear en lugar de /dev/gpiomem para probar el backend sin la Raspberry.
+    :return: Ruta del fichero.
+    """
+    if ruta is None:
+        fd, ruta = tempfile.mkstemp(suffix=".gpiomem")
+        os.close(fd)
+    with open(ruta, "wb") as fichero:
+        fichero.write(bytes(TAMANO_BLOQUE))
+    return ruta
+
+
+class GPIORegistros:
+    """
+    Backend GPIO que mapea el bloque de registros (/dev/gpiomem) y escribe
+    directamente en GPSET/GPCLR, con la misma interfaz que RPi.GPIO. Un
+    flanco en varios pines a la vez es una sola escritura de 32 bits (sin
+    llamadas al sistema). Solo para BCM2835/2836/2837/2711 (Raspberry Pi 1-4; los
+    pull-up/down se configuran con GPPUD/GPPUDCLK o, en el BCM2711, con GPIO_PUP_PDN_CNTRL);
+    la Pi 5 tiene los GPIO en el RP1. Las entradas con eventos no están
+    disponibles: para eso está GPIOGpiod.
+    """
+    BOARD, BCM = 10, 11
+    OUT, IN = 0, 1
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self, dispositivo="/dev/gpiomem", soc=None):
+        """
+        :param dispositivo: /dev/gpiomem o un fichero creado con crear_fichero_registros().
+        :param soc: 'bcm2835' (Pi 1-3: BCM2835/2836/2837) o 'bcm2711' (Pi 4). Por defecto se detecta;
+            solo cambia cómo se configuran las resistencias de pull.
+        """
+        if soc is None:
+            soc = detectar_soc()
+        if soc not in ("bcm2835", "bcm2711"):
+            raise ValueError(f"SoC no soportado: {soc}")
+        self.soc = soc
+        self.dispositivo = dispositivo
+        fd = os.open(dispositivo, os.O_RDWR | os.O_SYNC)
+        try:
+            self._mapa = mmap.mmap(fd, TAMANO_BLOQUE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.registros = memoryview(self._mapa).cast("I")
+        self.modo = None
+        self.configurados = {}
+        self._set = [GPSET0 // 4, GPSET0 // 4 + 1]
+        self._clr = [GPCLR0 // 4, GPCLR0 // 4 + 1]
+
+    def setmode(self, modo):
+        if modo != self.BCM:
+            raise ValueError("El backend de registros solo admite numeración BCM.")
+        self.modo = modo
+
+    def getmode(self):
+        return self.modo
+
+    def setwarnings(self, activar):
+        pass
+
+    def _funcion(self, pin, funcion):
+        indice = GPFSEL0 // 4 + pin // 10
+        desplazamiento = (pin % 10) * 3
+        valor = self.registros[indice]
+        self.registros[indice] = (valor & ~(0b111 << desplazamiento)) | (funcion << desplazamiento)
+
+    def _pull(self, pin, pull):
+        if self.soc == "bcm2835":
+            # Secuencia del BCM2835: valor en GPPUD, esperar 150 ciclos, pulso de reloj en el pin
+            # y volver a dejar los dos registros a cero
+            codigo = {self.PUD_OFF: 0b00, self.PUD_DOWN: 0b01, self.PUD_UP: 0b10}[pull]
+            reloj = GPPUDCLK0 // 4 + (pin >> 5)
+            self.registros[GPPUD // 4] = codigo
+            time.sleep(1e-5)
+            self.registros[reloj] = 1 << (pin & 31)
+            time.sleep(1e-5)
+            self.registros[GPPUD // 4] = 0
+            self.registros[reloj] = 0
+            return
+        codigo = {self.PUD_OFF: 0b00, self.PUD_UP: 0b01, self.PUD_DOWN: 0b10}[pull]
+        indice = GPIO_PUP_PDN_CNTRL0 // 4 + pin // 16
+        desplazamiento = (pin % 16) * 2
+        valor = self.registros[indice]
+        self.registros[indice] = (valor & ~(0b11 << desplazamiento)) | (codigo << desplazamiento)
+
+    def setup(self, canal, modo, pull_up_down=PUD_OFF, initial=-1):
+        if self.modo is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BCM)")
+        for pin in canal if isinstance(canal, (list, tuple)) else (canal,):
+            if not 0 <= pin <= 53:
+                raise ValueError(f"Pin BCM no válido: {pin}")
+            if modo == self.OUT:
+                if initial != -1:
+                    self._escribir(pin, initial)
+                self._funcion(pin, 0b001)
+            else:
+                self._funcion(pin, 0b000)
+                self._pull(pin, pull_up_down)
+            self.configurados[pin] = modo
+
+    def _escribir(self, pin, valor):
+        registros = self._set if valor else self._clr
+        self.registros[registros[pin >> 5]] = 1 << (pin & 31)
+
+    def output(self, canal, valor):
+        if canal.__class__ is int:
+            if self.configurados.get(canal) != self.OUT:
+                raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+            self.registros[(self._set if valor else self._clr)[canal >> 5]] = 1 << (canal & 31)
+            return
+        valores = valor if isinstance(valor, (list, tuple)) else [valor] * len(canal)
+        altos = [0, 0]
+        bajos = [0, 0]
+        for pin, v in zip(canal, valores):
+            if self.configurados.get(pin) != self.OUT:
+                raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+            (altos if v else bajos)[pin >> 5] |= 1 << (pin & 31)
+        self.escribir_mascaras(altos[0], bajos[0], altos[1], bajos[1])
+
+    def escribir_mascaras(self, altos, bajos=0, altos_1=0, bajos_1=0):
+        """
+        Escribe las máscaras de pines directamente: una escritura por registro
+        con bits. Es la vía rápida para los bucles de pasos.
+        :param altos: Pines 0-31 a poner a HIGH (bit n = pin n).
+        :param bajos: Pines 0-31 a poner a LOW.
+        :param altos_1: Pines 32-53 a HIGH (bit n = pin 32 + n).
+        :param bajos_1: Pines 32-53 a LOW.
+        """
+        registros = self.registros
+        if altos:
+            registros[GPSET0 // 4] = altos
+        if bajos:
+            registros[GPCLR0 // 4] = bajos
+        if altos_1:
+            registros[GPSET0 // 4 + 1] = altos_1
+        if bajos_1:
+            registros[GPCLR0 // 4 + 1] = bajos_1
+
+    @staticmethod
+    def mascara(pines):
+        """
+        Máscara de bits de una lista de pines 0-31.
+        """
+        resultado = 0
+        for pin in pines:
+            if pin > 31:
+                raise ValueError("escribir_mascaras usa máscaras separadas para los pines 32-53.")
+            resultado |= 1 << pin
+        return resultado
+
+    def input(self, pin):
+        if pin not in self.configurados:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        return (self.registros[GPLEV0 // 4 + (pin >> 5)] >> (pin & 31)) & 1
+
+    def add_event_detect(self, pin, flanco, callback=None, bouncetime=None):
+        raise RuntimeError("El backend de registros no tiene eventos de flanco; use GPIOGpiod para las entradas.")
+
+    def cleanup(self, canal=None):
+        """
+        Deja los pines usados como entradas, como hace RPi.GPIO.cleanup().
+        """
+        pines = list(self.configurados) if canal is None else (canal if isinstance(canal, (list, tuple)) else [canal])
+        for pin in pines:
+            if pin in self.configurados:
+                self._funcion(pin, 0b000)
+                del self.configurados[pin]
+        if canal is None and self._mapa is not None:
+            self.registros.release()
+            self._mapa.close()
+            self._mapa = None
+
+
+# Conmutaciones por segundo contra un bloque de registros en fichero (o /dev/gpiomem en la Raspberry)
+if __name__ == "__main__":
+    from simulador import GPIOVirtual, RelojVirtual
+
+    if os.path.exists("/dev/gpiomem"):
+        dispositivo = "/dev/gpiomem"
+    else:
+        dispositivo = crear_fichero_registros()
+        print(f"[INFO] Sin /dev/gpiomem: se usa el fichero {dispositivo} con la misma disposición de registros.")
+    gpio = GPIORegistros(dispositivo)
+    gpio.setmode(gpio.BCM)
+    pines = [23, 24, 17, 27]  # STEP husillo, DIR husillo, STEP guiado, DIR guiado
+    gpio.setup(pines, gpio.OUT)
+
+    # Comprobación de la disposición: función de salida y máscaras en GPSET/GPCLR
+    assert (gpio.registros[GPFSEL0 // 4 + 2] >> 9) & 0b111 == 0b001  # Pin 23 como salida
+    gpio.output([23, 17], [1, 1])
+    assert gpio.registros[GPSET0 // 4] == (1 << 23) | (1 << 17)
+    gpio.output(24, 0)
+    assert gpio.registros[GPCLR0 // 4] == 1 << 24
+
+    # Pull-up según el SoC: secuencia GPPUD/GPPUDCLK0 en la Pi 1-3 y GPIO_PUP_PDN_CNTRL en la Pi 4
+    class RegistrosAnotados:
+        def __init__(self, registros):
+            self.registros = registros
+            self.escrituras = []
+
+        def __getitem__(self, indice):
+            return self.registros[indice]
+
+        def __setitem__(self, indice, valor):
+            self.escrituras.append((indice * 4, valor))
+            self.registros[indice] = valor
+
+    for soc in ("bcm2835", "bcm2711"):
+        ruta = crear_fichero_registros()
+        prueba = GPIORegistros(ruta, soc=soc)
+        prueba.setmode(prueba.BCM)
+        anotados = prueba.registros = RegistrosAnotados(prueba.registros)
+        prueba.setup(22, prueba.IN, pull_up_down=prueba.PUD_UP)
+        pull = [(hex(r), bin(v)) for r, v in anotados.escrituras if r != GPFSEL0 + 8]
+        print(f"Pull-up del pin 22 en {soc}: {pull}")
+        if soc == "bcm2835":
+            assert anotados.escrituras[1:] == [(GPPUD, 0b10), (GPPUDCLK0, 1 << 22), (GPPUD, 0), (GPPUDCLK0, 0)]
+        else:
+            assert anotados.escrituras[1:] == [(GPIO_PUP_PDN_CNTRL0 + 4, 0b01 << 12)]
+        prueba.registros = anotados.registros
+        prueba.cleanup()
+        os.remove(ruta)
+
+    n = 1000000
+    medidas = []
+
+    inicio = time.perf_counter()
+    for i in range(n):
+        gpio.output(23, i & 1)
+    medidas.append(("GPIORegistros.output()", time.perf_counter() - inicio))
+
+    # Paso simultáneo de husillo y guiado: una escritura en GPSET y otra en GPCLR por pulso
+    registros = gpio.registros
+    mascara = GPIORegistros.mascara([23, 17])
+    inicio = time.perf_counter()
+    for _ in range(n // 2):
+        registros[GPSET0 // 4] = mascara
+        registros[GPCLR0 // 4] = mascara
+    medidas.append(("escritura directa, 2 pines", time.perf_counter() - inicio))
+
+    virtual = GPIOVirtual(RelojVirtual())
+    virtual.setmode(virtual.BCM)
+    virtual.setup(23, virtual.OUT)
+    inicio = time.perf_counter()
+    for i in range(n):
+        virtual.output(23, i & 1)
+    medidas.append(("GPIOVirtual.output()", time.perf_counter() - inicio))
+
+    for nombre, segundos in medidas:
+        print(f"{nombre:28s} {n / segundos / 1e6:6.2f} M conmutaciones/s ({segundos / n * 1e9:4.0f} ns)")
+    print("En la Raspberry, RPi.GPIO.output() cuesta del orden de 1 µs por llamada.")
+    gpio.cleanup()
+    if dispositivo != "/dev/gpiomem":
+        os.remove(dispositivo)
@@ -0,0 +1,384 @@
+import os
+import queue
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from threading import Thread
+
+
+# Lenguaje de comandos (una orden por línea, comentarios con ';' o entre paréntesis):
+#   G0 X<pos> [F<pasos/s>]       Movimiento rápido del guiado (sin F, a la velocidad máxima)
+#   G1 X<pos> F<pasos/s>         Movimiento a velocidad dada
+#   G4 P<ms> | G4 S<s>           Pausa con el guiado parado
+#   G90 / G91                    Posiciones absolutas / incrementales
+#   M3 S<rps> / M4 S<rps>        Arranca el husillo en sentido horario / antihorario
+#   M5                           Para el husillo
+#   S<rps>                       Cambia la velocidad del husillo en marcha
+#   M100 N<vueltas> [S<rps>] [L<espiras por capa>] [P<pasos guiado por vuelta>]
+#                                Bobina un número de vueltas (se planifica al leer la línea)
+#   M2 / M30                     Fin de programa
+
+PARAMETROS_BOBINADO = {"N": "vueltas", "S": "rps", "L": "espiras_por_capa", "P": "pasos_traverse_por_vuelta"}
+
+
+class Comando:
+    """
+    Una línea del programa ya interpretada.
+    """
+    __slots__ = ("codigo", "parametros", "linea")
+
+    def __init__(self, codigo, parametros, linea):
+        """
+        :param codigo: Código de la orden ('G1', 'M3'...).
+        :param parametros: Diccionario letra -> valor numérico.
+        :param linea: Número de línea en el programa.
+        """
+        self.codigo = codigo
+        self.parametros = parametros
+        self.linea = linea
+
+    def __repr__(self):
+        return f"Comando({self.codigo}, {self.parametros}, linea={self.linea})"
+
+
+def parsear_linea(texto, numero=0):
+    """
+    Interpreta una línea del programa.
+    :param texto: Texto de la línea.
+    :param numero: Número de línea (para los mensajes de error).
+    :return: Comando, o None si la línea está vacía o es un comentario.
+    """
+    # Quitar comentarios
+    texto = texto.split(";", 1)[0]
+    while "(" in texto:
+        inicio = texto.index("(")
+        fin = texto.find(")", inicio)
+        if fin < 0:
+            raise ValueError(f"Línea {numero}: comentario sin cerrar.")
+        texto = texto[:inicio] + " " + texto[fin + 1:]
+
+    palabras = texto.upper().split()
+    if not palabras:
+        return None
+
+    codigo = None
+    parametros = {}
+    for palabra in palabras:
+        letra, valor = palabra[0], palabra[1:]
+        if letra in "GM" and codigo is None:
+            try:
+                codigo = letra + str(int(valor))
+            except ValueError:
+                raise ValueError(f"Línea {numero}: orden no válida '{palabra}'.")
+            continue
+        if not letra.isalpha() or not valor:
+            raise ValueError(f"Línea {numero}: palabra no válida '{palabra}'.")
+        try:
+            parametros[letra] = float(valor)
+        except ValueError:
+            raise ValueError(f"Línea {numero}: valor no válido en '{palabra}'.")
+
+    if codigo is None:
+        if list(parametros) == ["S"]:
+            codigo = "S"  # Cambio de velocidad del husillo
+        else:
+            raise ValueError(f"Línea {numero}: falta el código G o M.")
+    return Comando(codigo, parametros, numero)
+
+
+def abrir_fuente(ruta):
+    """
+    Abre el origen del programa: un fichero, '-' para la entrada estándar
+    o 'tcp://host:puerto' para leerlo de un socket.
+    :return: Objeto iterable por líneas.
+    """
+    if ruta == "-":
+        return sys.stdin
+    if ruta.startswith("tcp://"):
+        host, puerto = ruta[len("tcp://"):].rsplit(":", 1)
+        conexion = socket.create_connection((host, int(puerto)))
+        return conexion.makefile("r", encoding="utf-8")
+    return open(ruta, "r", encoding="utf-8")
+
+
+class LectorStream:
+    """
+    Lee las líneas del programa en un hilo y las deja interpretadas en un
+    buffer acotado. Si el buffer está lleno el lector espera, así la memoria
+    no crece con la longitud del programa.
+    """
+    def __init__(self, fuente, capacidad=256):
+        """
+        :param fuente: Objeto iterable por líneas (fichero, socket.makefile...).
+        :param capacidad: Número máximo de comandos en el buffer.
+        """
+        self.fuente = fuente
+        self.buffer = queue.Queue(maxsize=capacidad)
+        self.error = None
+        self.running = True
+        self.hilo = Thread(target=self._leer)
+        self.hilo.daemon = True
+        self.hilo.start()
+
+    def _leer(self):
+        try:
+            for numero, texto in enumerate(self.fuente, start=1):
+                if not self.running:
+                    return
+                comando = parsear_linea(texto, numero)
+                if comando is not None:
+                    self._poner(comando)
+        except Exception as e:
+            self.error = e
+        self._poner(None)
+
+    def _poner(self, comando):
+        # Espera por tramos para poder abandonar si se detiene la lectura con el buffer lleno
+        while self.running:
+            try:
+                self.buffer.put(comando, timeout=0.05)
+                return
+            except queue.Full:
+                pass
+
+    def detener(self):
+        """
+        Deja de leer y vacía el buffer. Si la fuente está esperando datos
+        (entrada estándar, socket), el hilo termina al llegar la siguiente línea.
+        """
+        self.running = False
+        while True:
+            try:
+                self.buffer.get_nowait()
+            except queue.Empty:
+                break
+        self.hilo.join(timeout=0.1)
+
+    def comandos(self):
+        """
+        Generador con los comandos en orden de lectura.
+        """
+        while True:
+            comando = self.buffer.get()
+            if comando is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield comando
+
+
+class Interprete:
+    """
+    Pasa los comandos a la cola de movimientos del guiado. Las órdenes del
+    husillo y los bobinados se encolan como acciones en el mismo orden, de
+    modo que el programa se planifica por delante de la ejecución.
+    """
+    def __init__(self, cola, husillo=None, planificar=None, bobinar=None):
+        """
+        :param cola: Cola de movimientos del guiado (ColaMovimientos).
+        :param husillo: Objeto con arrancar(rps, horario), cambiar_velocidad(rps) y parar().
+        :param planificar: Función receta -> plan para las órdenes M100.
+        :param bobinar: Función (plan, receta) que ejecuta un bobinado.
+        """
+        self.cola = cola
+        self.husillo = husillo
+        self.planificar = planificar
+        self.bobinar = bobinar
+        self.absoluto = True
+        self.posicion = cola.ultimo_destino
+        self.rps = 0.0
+        self.comandos_procesados = 0
+        self.fin = False
+
+    def ejecutar_comando(self, comando):
+        """
+        Encola un comando ya interpretado.
+        """
+        codigo = comando.codigo
+        p = comando.parametros
+
+        if codigo in ("G0", "G1"):
+            if "X" in p:
+                destino = p["X"] if self.absoluto else self.posicion + p["X"]
+                self.posicion = int(round(destino))
+                velocidad = p.get("F")
+                if codigo == "G1" and velocidad is None:
+                    raise ValueError(f"Línea {comando.linea}: G1 necesita F.")
+                self.cola.agregar(self.posicion, velocidad=velocidad)
+        elif codigo == "G4":
+            segundos = p["P"] / 1000 if "P" in p else p.get("S", 0.0)
+            self.cola.agregar_pausa(segundos)
+        elif codigo == "G90":
+            self.absoluto = True
+        elif codigo == "G91":
+            self.absoluto = False
+        elif codigo in ("M3", "M4"):
+            self.rps = p.get("S", self.rps)
+            if self.rps <= 0:
+                raise ValueError(f"Línea {comando.linea}: falta la velocidad S del husillo.")
+            horario = codigo == "M3"
+            rps = self.rps
+            self._accion_husillo(lambda: self.husillo.arrancar(rps, horario))
+        elif codigo == "M5":
+            self._accion_husillo(lambda: self.husillo.parar())
+        elif codigo == "S":
+            self.rps = p["S"]
+            rps = self.rps
+            self._accion_husillo(lambda: self.husillo.cambiar_velocidad(rps))
+        elif codigo == "M100":
+            if "N" not in p:
+                raise ValueError(f"Línea {comando.linea}: M100 necesita N (vueltas).")
+            if self.planificar is None or self.bobinar is None:
+                raise ValueError(f"Línea {comando.linea}: M100 necesita las funciones planificar y bobinar.")
+            receta = {PARAMETROS_BOBINADO[letra]: valor for letra, valor in p.items() if letra in PARAMETROS_BOBINADO}
+            receta["vueltas"] = int(receta["vueltas"])
+            if "rps" not in receta and self.rps > 0:
+                receta["rps"] = self.rps
+            # El plan se calcula ahora, mucho antes de que el ejecutor llegue a esta orden
+            plan = self.planificar(receta)
+            self.cola.agregar_accion(lambda: self.bobinar(plan, receta))
+        elif codigo in ("M2", "M30"):
+            self.fin = True
+        else:
+            raise ValueError(f"Línea {comando.linea}: orden no soportada {codigo}.")
+        self.comandos_procesados += 1
+
+    def _accion_husillo(self, accion):
+        if self.husillo is None:
+            raise ValueError("No hay husillo configurado.")
+        self.cola.agregar_accion(accion)
+
+    def procesar(self, fuente, capacidad=256):
+        """
+        Lee, interpreta y encola un programa completo en streaming.
+        :param fuente: Objeto iterable por líneas (ver abrir_fuente).
+        :param capacidad: Tamaño del buffer de comandos interpretados.
+        """
+        lector = LectorStream(fuente, capacidad)
+        try:
+            for comando in lector.comandos():
+                self.ejecutar_comando(comando)
+                if self.fin:
+                    break
+        finally:
+            # Fin de programa o error antes del final: el lector no debe quedarse bloqueado
+            lector.detener()
+
+
+# Benchmark: comandos/segundo de lectura + planificación y memoria con un programa de 100k líneas
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Posicionador"))
+    import cola_movimientos
+    import threading
+
+    class ColaSoloPlanificacion(cola_movimientos.ColaMovimientos):
+        """Toma los segmentos ya planificados sin generar pasos, para medir lectura + planificación."""
+        def _ejecutar(self):
+            while True:
+                with self.condicion:
+                    while not self.pendientes and self.running:
+                        self.condicion.wait()
+                    if not self.running:
+                        return
+                    segmento = self.pendientes.pop(0)
+                    self.v_actual = segmento.v_salida
+                    self.condicion.notify_all()
+                if segmento.accion is not None:
+                    segmento.accion()
+
+    class GPIONulo:
+        LOW, HIGH = 0, 1
+
+        def output(self, pin, valor):
+            pass
+
+    class MotorNulo:
+        step_pin, dir_pin = 17, 27
+
+    class HusilloNulo:
+        def arrancar(self, rps, horario):
+            pass
+
+        def cambiar_velocidad(self, rps):
+            pass
+
+        def parar(self):
+            pass
+
+    def escribir_programa(ruta, lineas):
+        with open(ruta, "w") as fichero:
+            fichero.write("G90 ; programa de prueba\nM3 S10\n")
+            for i in range(lineas - 3):
+                if i % 50 == 49:
+                    fichero.write("S12 (cambio de velocidad)\n")
+                else:
+                    fichero.write(f"G1 X{(i % 20) * 4 + (i // 20) % 3} F2000\n")
+            fichero.write("M5\n")
+
+    def medir(ruta, memoria=False):
+        cola = ColaSoloPlanificacion(MotorNulo(), v_max=2000, acel_max=50000, capacidad=64, gpio=GPIONulo())
+        cola.iniciar()
+        interprete = Interprete(cola, husillo=HusilloNulo())
+        if memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        with open(ruta) as fuente:
+            interprete.procesar(fuente)
+        cola.esperar()
+        duracion = time.perf_counter() - inicio
+        pico = 0
+        if memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        cola.detener()
+        return interprete.comandos_procesados, duracion, pico
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for lineas in (10000, 100000):
+            ruta = os.path.join(directorio, f"programa_{lineas}.gcode")
+            escribir_programa(ruta, lineas)
+            comandos, duracion, _ = medir(ruta)
+            _, _, pico = medir(ruta, memoria=True)
+            print(f"{lineas} líneas ({os.path.getsize(ruta) / 1024:.0f} KiB): {comandos / duracion:.0f} comandos/s, "
+                  f"memoria máxima {pico / 1024:.0f} KiB")
+
+    # Solo lectura e interpretación, sin planificar
+    texto = "G1 X120 F2000 ; movimiento\n"
+    inicio = time.perf_counter()
+    for i in range(100000):
+        parsear_linea(texto, i)
+    print(f"Interpretación de líneas: {100000 / (time.perf_counter() - inicio):.0f} líneas/s")
+
+    # Comprobaciones: F en G0, parada anticipada sin dejar el lector bloqueado y M100 sin planificador
+    class ColaRegistro:
+        ultimo_destino = 0
+
+        def __init__(self):
+            self.movimientos = []
+
+        def agregar(self, destino, velocidad=None):
+            self.movimientos.append((destino, velocidad))
+
+    cola = ColaRegistro()
+    interprete = Interprete(cola)
+    interprete.procesar(["G0 X10 F500\n", "G0 X20\n", "M2\n"] + ["G1 X5 F100\n"] * 5000, capacidad=8)
+    print(f"Movimientos con G0: {cola.movimientos}")
+    assert cola.movimientos == [(10, 500.0), (20, None)]
+
+    hilos = threading.active_count()
+    for programa in (["M30\n"] + ["G0 X1\n"] * 1000, ["G0 X1\n", "G7\n"] + ["G0 X1\n"] * 1000):
+        try:
+            Interprete(ColaRegistro()).procesar(programa, capacidad=4)
+        except ValueError as e:
+            print(f"Programa con error: {e}")
+    time.sleep(0.2)
+    print(f"Hilos lectores vivos tras parar antes del final: {threading.active_count() - hilos}")
+    assert threading.active_count() == hilos
+
+    try:
+        Interprete(ColaRegistro()).procesar(["M100 N100\n"])
+        raise AssertionError("M100 sin planificador debería fallar")
+    except ValueError as e:
+        print(f"M100 sin planificador: {e}")
@@ -0,0 +1,422 @@
+import bisect
+import math
+import os
+import socketserver
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+TIPO_OPENMETRICS = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Límites por defecto de los histogramas de tiempo (s): de 10 µs a 1 s
+LIMITES_TIEMPO = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01,
+                  0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+def _formato(valor):
+    if valor == math.inf:
+        return "+Inf"
+    if valor == int(valor) and abs(valor) < 1e15:
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas)
+    if extra is not None:
+        pares.append(extra)
+    if not pares:
+        return ""
+    texto = ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares)
+    return "{" + texto + "}"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Contador:
+    """
+    Contador que solo crece (pasos, vueltas, bobinas, fallos). inc() suma en
+    el acumulador del hilo que lo llama, sin bloqueos.
+    """
+    tipo = "counter"
+
+    def __init__(self, registro, nombre, ayuda, etiquetas, funcion=None):
+        self.registro = registro
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.funcion = funcion
+        self._hueco = None if funcion else registro._reservar(1)
+        self._local = registro._local
+
+    def inc(self, n=1):
+        try:
+            self._local.acumulador[self._hueco] += n
+        except AttributeError:
+            self.registro._acumulador()[self._hueco] += n
+
+    def valor(self):
+        if self.funcion:
+            return self.funcion()
+        return self.registro._sumar(self._hueco, 1)[0]
+
+    def muestras(self):
+        yield self.nombre + "_total", _etiquetas(self.etiquetas), self.valor()
+
+
+class Indicador:
+    """
+    Valor instantáneo (RPS, tensión, posición). Se guarda el último valor
+    escrito por cualquier hilo, o se calcula al leerlo con funcion.
+    """
+    tipo = "gauge"
+
+    def __init__(self, registro, nombre, ayuda, etiquetas, funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.funcion = funcion
+        self._valor = 0.0
+
+    def set(self, valor):
+        self._valor = valor
+
+    def valor(self):
+        return self.funcion() if self.funcion else self._valor
+
+    def muestras(self):
+        yield self.nombre, _etiquetas(self.etiquetas), self.valor()
+
+
+class Histograma:
+    """
+    Histograma con límites fijos (jitter de los pasos, latencia de órdenes).
+    Cada hilo cuenta en sus propios huecos: uno por cubeta, la suma y el total.
+    """
+    tipo = "histogram"
+
+    def __init__(self, registro, nombre, ayuda, etiquetas, limites=LIMITES_TIEMPO):
+        if list(limites) != sorted(limites):
+            raise ValueError("Los límites del histograma deben estar ordenados.")
+        self.registro = registro
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.limites = tuple(limites)
+        self._n = len(self.limites) + 1
+        self._hueco = registro._reservar(self._n + 2)
+        self._suma = self._hueco + self._n
+        self._local = registro._local
+
+    def observar(self, valor):
+        try:
+            acumulador = self._local.acumulador
+        except AttributeError:
+            acumulador = self.registro._acumulador()
+        acumulador[self._hueco + bisect.bisect_left(self.limites, valor)] += 1
+        suma = self._suma
+        acumulador[suma] += valor
+        acumulador[suma + 1] += 1
+
+    def valores(self):
+        """
+        :return: (cuentas por cubeta, suma, número de observaciones).
+        """
+        sumas = self.registro._sumar(self._hueco, self._n + 2)
+        return sumas[:self._n], sumas[self._n], sumas[self._n + 1]
+
+    def muestras(self):
+        cuentas, suma, total = self.valores()
+        acumulado = 0
+        for limite, cuenta in zip(self.limites + (math.inf,), cuentas):
+            acumulado += cuenta
+            yield self.nombre + "_bucket", _etiquetas(self.etiquetas, ("le", _formato(limite))), acumulado
+        yield self.nombre + "_sum", _etiquetas(self.etiquetas), suma
+        yield self.nombre + "_count", _etiquetas(self.etiquetas), total
+
+
+class Registro:
+    """
+    Registro de métricas. Cada hilo que escribe tiene su propio acumulador
+    (un array('d') con un hueco por valor), así que contar no necesita
+    bloqueos y los hilos no se estorban; al leer (exposicion()) se suman los
+    acumuladores de todos los hilos. Las métricas con funcion se calculan al
+    leer y no cuestan nada en el bucle de pasos.
+    """
+    def __init__(self, capacidad=1024):
+        """
+        :param capacidad: Huecos de cada acumulador (1 por contador, cubetas + 2 por histograma).
+        """
+        self.capacidad = capacidad
+        self.metricas = []
+        self._huecos = 0
+        self._acumuladores = []
+        self._local = threading.local()
+        self._bloqueo = threading.Lock()
+
+    def _reservar(self, n):
+        with self._bloqueo:
+            if self._huecos + n > self.capacidad:
+                raise ValueError(f"El registro de métricas está lleno ({self.capacidad} huecos).")
+            hueco = self._huecos
+            self._huecos += n
+            return hueco
+
+    def _acumulador(self):
+        try:
+            return self._local.acumulador
+        except AttributeError:
+            acumulador = array("d", bytes(8 * self.capacidad))
+            with self._bloqueo:
+                self._acumuladores.append(acumulador)
+            self._local.acumulador = acumulador
+            return acumulador
+
+    def _sumar(self, hueco, n):
+        sumas = [0.0] * n
+        with self._bloqueo:
+            acumuladores = list(self._acumuladores)
+        for acumulador in acumuladores:
+            for i in range(n):
+                sumas[i] += acumulador[hueco + i]
+        return sumas
+
+    def _agregar(self, metrica):
+        if not metrica.nombre.replace("_", "").isalnum() or metrica.nombre[0].isdigit():
+            raise ValueError(f"Nombre de métrica no válido: {metrica.nombre}")
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=None, funcion=None):
+        """
+        :param nombre: Nombre sin el sufijo _total.
+        :param ayuda: Texto de ayuda.
+        :param etiquetas: Diccionario de etiquetas fijas de la serie.
+        :param funcion: Función sin argumentos que devuelve el valor al leerlo (en vez de inc()).
+        """
+        return self._agregar(Contador(self, nombre, ayuda, tuple((etiquetas or {}).items()), funcion))
+
+    def indicador(self, nombre, ayuda, etiquetas=None, funcion=None):
+        return self._agregar(Indicador(self, nombre, ayuda, tuple((etiquetas or {}).items()), funcion))
+
+    def histograma(self, nombre, ayuda, etiquetas=None, limites=LIMITES_TIEMPO):
+        return self._agregar(Histograma(self, nombre, ayuda, tuple((etiquetas or {}).items()), limites))
+
+    def exposicion(self):
+        """
+        Texto en formato OpenMetrics con todas las métricas. Las series con el
+        mismo nombre y distintas etiquetas se agrupan bajo una sola cabecera.
+        """
+        familias = {}
+        for metrica in self.metricas:
+            familias.setdefault(metrica.nombre, []).append(metrica)
+        lineas = []
+        for nombre, metricas in familias.items():
+            lineas.append(f"# TYPE {nombre} {metricas[0].tipo}")
+            lineas.append(f"# HELP {nombre} {metricas[0].ayuda}")
+            for metrica in metricas:
+                for serie, etiquetas, valor in metrica.muestras():
+                    lineas.append(f"{serie}{etiquetas} {_formato(valor)}")
+        lineas.append("# EOF\n")
+        return "\n".join(lineas)
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        cuerpo = self.server.registro.exposicion().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", TIPO_OPENMETRICS)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+        self.server.lecturas += 1
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, formato, *args):
+        pass
+
+
+class _ServidorTCP(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ServidorUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+class ServidorMetricas:
+    """
+    Servidor HTTP de las métricas (GET /metrics) en un puerto de localhost o
+    en un socket Unix. Atiende en su propio hilo; leer las métricas no toca
+    el bucle de pasos, solo suma los acumuladores.
+    """
+    def __init__(self, registro, puerto=9464, direccion="127.0.0.1", ruta_unix=None):
+        """
+        :param registro: Registro con las métricas.
+        :param puerto: Puerto TCP (0 para uno libre; ver self.puerto).
+        :param direccion: Dirección de escucha (por defecto solo localhost).
+        :param ruta_unix: Ruta de un socket Unix; si se indica no se abre puerto TCP.
+        """
+        self.ruta_unix = ruta_unix
+        if ruta_unix is not None:
+            if os.path.exists(ruta_unix):
+                os.remove(ruta_unix)
+            self.servidor = _ServidorUnix(ruta_unix, _ManejadorMetricas)
+            self.puerto = None
+        else:
+            self.servidor = _ServidorTCP((direccion, puerto), _ManejadorMetricas)
+            self.puerto = self.servidor.server_address[1]
+        self.servidor.registro = registro
+        self.servidor.lecturas = 0
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self._hilo.start()
+
+    @property
+    def lecturas(self):
+        return self.servidor.lecturas
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        if self.ruta_unix is not None and os.path.exists(self.ruta_unix):
+            os.remove(self.ruta_unix)
+
+
+def registrar_ejecutor(registro, ejecutor, steps_per_revolution=200):
+    """
+    Métricas de un EjecutorBobinado. Pasos, vueltas, capa y retraso máximo se
+    leen del ejecutor al consultar; el jitter de cada paso se cuenta en un
+    histograma desde ejecutar_continuo.
+    :return: Histograma del retraso de los pasos.
+    """
+    registro.contador("bobinadora_pasos", "Pasos dados por eje.", {"eje": "husillo"},
+                      funcion=lambda: ejecutor.pasos_husillo)
+    registro.contador("bobinadora_pasos", "Pasos dados por eje.", {"eje": "guiado"},
+                      funcion=lambda: ejecutor.pasos_traverse)
+    registro.contador("bobinadora_vueltas", "Vueltas del husillo.",
+                      funcion=lambda: ejecutor.pasos_husillo // steps_per_revolution)
+    registro.indicador("bobinadora_capa", "Capa en curso.", funcion=lambda: ejecutor.capa)
+    registro.indicador("bobinadora_retraso_max_segundos", "Mayor retraso de un paso en la marcha en curso.",
+                       funcion=lambda: ejecutor.retraso_max)
+    ejecutor.histograma_retraso = registro.histograma("bobinadora_retraso_paso_segundos",
+                                                      "Retraso de cada paso respecto a su instante planificado.")
+    return ejecutor.histograma_retraso
+
+
+def registrar_cola(registro, cola):
+    """
+    Métricas de una ColaTrabajos: bobinas terminadas y fallos de planificación.
+    """
+    registro.contador("bobinadora_bobinas", "Bobinas terminadas.", funcion=lambda: len(cola.registros))
+    registro.contador("bobinadora_fallos", "Trabajos que no se pudieron planificar.",
+                      funcion=lambda: cola.errores)
+
+
+# Consultas muy frecuentes mientras un motor simulado va a toda velocidad
+if __name__ == "__main__":
+    import http.client
+    import socket
+    import tempfile
+    from ejecutor import EjecutorBobinado
+    from plan_continuo import PlanContinuo
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    class GPIONulo:
+        BCM, OUT, LOW, HIGH = 11, 0, 0, 1
+
+        def setmode(self, modo):
+            pass
+
+        def setup(self, pin, modo):
+            pass
+
+        def output(self, canal, valor):
+            pass
+
+    class ConexionUnix(http.client.HTTPConnection):
+        def __init__(self, ruta):
+            super().__init__("localhost")
+            self.ruta = ruta
+
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(self.ruta)
+
+    # Coste de contar en el hilo que escribe
+    registro = Registro()
+    contador = registro.contador("prueba", "Prueba.")
+    histograma = registro.histograma("prueba_latencia_segundos", "Prueba.")
+    n = 200000
+    inicio = time.perf_counter()
+    for _ in range(n):
+        contador.inc()
+    t_inc = (time.perf_counter() - inicio) / n
+    inicio = time.perf_counter()
+    for i in range(n):
+        histograma.observar(0.0001)
+    t_obs = (time.perf_counter() - inicio) / n
+    print(f"Contador.inc() {t_inc * 1e9:.0f} ns, Histograma.observar() {t_obs * 1e9:.0f} ns")
+
+    def marcha(registro, segundos=5.0):
+        plan = PlanContinuo(200, 30.0, rps_inicial=1.0, acel=60.0).iniciar()
+        ejecutor = EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=GPIONulo())
+        if registro is not None:
+            registrar_ejecutor(registro, ejecutor)
+            registro.indicador("bobinadora_rps", "Velocidad del husillo.", funcion=lambda: plan._v)
+        threading.Timer(segundos, plan.detener).start()
+        ejecutor.ejecutar_continuo(plan, pasos_traverse_por_vuelta=8, pasos_traverse_por_capa=400)
+        return ejecutor
+
+    def consultar(conexion, parar, tiempos):
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            conexion.request("GET", "/metrics")
+            conexion.getresponse().read()
+            tiempos.append(time.perf_counter() - inicio)
+
+    # 30 RPS (6000 pasos/s) sin métricas, con métricas sin consultas y con consultas continuas
+    ejecutor = marcha(None)
+    print(f"Sin métricas:             retraso máximo de paso {ejecutor.retraso_max * 1e6:5.0f} µs")
+    ejecutor = marcha(Registro())
+    print(f"Con métricas:             retraso máximo de paso {ejecutor.retraso_max * 1e6:5.0f} µs")
+
+    for nombre in ("TCP", "Unix"):
+        registro = Registro()
+        if nombre == "TCP":
+            servidor = ServidorMetricas(registro, puerto=0)
+            conexion = http.client.HTTPConnection("127.0.0.1", servidor.puerto)
+        else:
+            ruta = os.path.join(tempfile.mkdtemp(), "metricas.sock")
+            servidor = ServidorMetricas(registro, ruta_unix=ruta)
+            conexion = ConexionUnix(ruta)
+        parar = threading.Event()
+        tiempos = []
+        hilo = threading.Thread(target=consultar, args=(conexion, parar, tiempos), daemon=True)
+        hilo.start()
+        ejecutor = marcha(registro)
+        parar.set()
+        hilo.join()
+        tiempos.sort()
+        print(f"Consultas por {nombre:4s}:       retraso máximo de paso {ejecutor.retraso_max * 1e6:5.0f} µs, "
+              f"{servidor.lecturas / 5.0:.0f} consultas/s, mediana {tiempos[len(tiempos) // 2] * 1e3:.2f} ms")
+        conexion.close()
+        servidor.cerrar()
+    print(registro.exposicion())
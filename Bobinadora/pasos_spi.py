@@ -0,0 +1,279 @@
+import itertools
+import math
+import queue
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _empaquetar_python(posiciones, n_bits):
+    """
+    Pone a 1 los bits indicados en un buffer de n_bits (MSB primero, como sale por SPI).
+    :return: (bytearray, posiciones que caen fuera del buffer, relativas a su final).
+    """
+    buffer = bytearray(n_bits >> 3)
+    resto = []
+    for b in posiciones:
+        if b < n_bits:
+            buffer[b >> 3] |= 0x80 >> (b & 7)
+        else:
+            resto.append(b - n_bits)
+    return buffer, resto
+
+
+def _empaquetar_numpy(posiciones, n_bits):
+    posiciones = numpy.asarray(posiciones, dtype=numpy.int64)
+    dentro = posiciones < n_bits
+    bits = numpy.zeros(n_bits, dtype=numpy.uint8)
+    bits[posiciones[dentro]] = 1
+    return numpy.packbits(bits).tobytes(), (posiciones[~dentro] - n_bits).tolist()
+
+
+class GeneradorSPI:
+    """
+    Genera el tren de pulsos STEP como un flujo de bits por MOSI a una
+    frecuencia de reloj SPI fija: cada bit es una ranura de tiempo y un 1 es
+    STEP en alto. El controlador SPI saca los bits con DMA a ritmo exacto y
+    Python solo tiene que mantener llena la cola de transferencias (un hilo
+    codifica el siguiente bloque mientras se envía el anterior). DIR se
+    pone por GPIO antes del movimiento. Entre dos transferencias el reloj
+    SPI se para unos µs; con bloques grandes (spidev.bufsiz) el hueco es raro
+    y solo retrasa los pasos siguientes, no los pierde.
+    """
+    def __init__(self, spi=None, bus=0, dispositivo=0, frecuencia=1000000, ancho_pulso=2e-6,
+                 bytes_transferencia=4096, usar_numpy=None):
+        """
+        :param spi: Objeto spidev ya abierto (por defecto se abre uno).
+        :param frecuencia: Reloj SPI en Hz (resolución temporal = 1 / frecuencia).
+        :param ancho_pulso: Ancho mínimo del pulso STEP (s); el A4988 pide 1 µs, el DRV8825 1,9 µs.
+        :param bytes_transferencia: Tamaño de cada transferencia (máximo spidev.bufsiz, 4096 por defecto).
+        :param usar_numpy: Empaquetar con NumPy (por defecto, si está instalado).
+        """
+        if spi is None:
+            import spidev
+            spi = spidev.SpiDev()
+            spi.open(bus, dispositivo)
+        spi.max_speed_hz = frecuencia
+        spi.mode = 0
+        self.spi = spi
+        self.frecuencia = frecuencia
+        self.bits_pulso = max(1, math.ceil(ancho_pulso * frecuencia - 1e-9))
+        self.bytes_transferencia = bytes_transferencia
+        if usar_numpy is None:
+            usar_numpy = numpy is not None
+        if usar_numpy and numpy is None:
+            raise RuntimeError("NumPy no está instalado.")
+        self._empaquetar = _empaquetar_numpy if usar_numpy else _empaquetar_python
+        self.running = False
+
+    @property
+    def pasos_por_segundo_max(self):
+        """
+        Frecuencia de pasos máxima que permite el reloj SPI (pulso alto + mismo tiempo en bajo).
+        """
+        return self.frecuencia / (2 * self.bits_pulso)
+
+    def bloques(self, intervalos):
+        """
+        Codifica una secuencia de intervalos entre pasos en bloques de bytes.
+        :param intervalos: Intervalos en segundos (el primero es el tiempo hasta el primer paso).
+        :return: Generador de bloques de bytes_transferencia bytes (el último, relleno con ceros).
+        """
+        n_bits = self.bytes_transferencia * 8
+        minimo = 2 * self.bits_pulso
+        frecuencia = self.frecuencia
+        ancho = range(self.bits_pulso)
+        inicio = 0        # Bit absoluto en que empieza el bloque actual
+        anterior = None
+        pendientes = []   # Bits de pulsos que empezaron en el bloque anterior
+        posiciones = []
+        for t in itertools.accumulate(intervalos):
+            bit = int(t * frecuencia + 0.5)
+            if anterior is not None and bit - anterior < minimo:
+                raise ValueError(f"Intervalo de {(bit - anterior) / frecuencia * 1e6:.2f} µs demasiado corto para "
+                                 f"el reloj SPI (mínimo {minimo / frecuencia * 1e6:.2f} µs).")
+            anterior = bit
+            while bit >= inicio + n_bits:
+                buffer, pendientes = self._empaquetar(pendientes + posiciones, n_bits)
+                yield buffer
+                inicio += n_bits
+                posiciones = []
+            relativo = bit - inicio
+            posiciones.extend(relativo + j for j in ancho)
+        fin = max(pendientes + posiciones, default=-1) + 1  # Bit siguiente al último pulso
+        while pendientes or posiciones:
+            buffer, pendientes = self._empaquetar(pendientes + posiciones, n_bits)
+            posiciones = []
+            if not pendientes:
+                buffer = buffer[:(fin >> 3) + 1]  # Con un bit a 0 al final STEP queda en LOW
+            yield buffer
+            fin -= n_bits
+
+    def ejecutar(self, intervalos, cola=4):
+        """
+        Envía el tren de pulsos. Un hilo codifica los bloques por delante y
+        este hilo los entrega al driver SPI (writebytes2 suelta el GIL).
+        :param intervalos: Intervalos entre pasos (s).
+        :param cola: Bloques codificados por delante como máximo.
+        :return: Tiempo empleado (s).
+        """
+        bloques = queue.Queue(maxsize=cola)
+        error = []
+
+        def codificar():
+            try:
+                for bloque in self.bloques(intervalos):
+                    if not self.running:
+                        break
+                    bloques.put(bloque)
+            except Exception as e:
+                error.append(e)
+            bloques.put(None)
+
+        self.running = True
+        inicio = time.perf_counter()
+        hilo = threading.Thread(target=codificar, daemon=True)
+        hilo.start()
+        while True:
+            bloque = bloques.get()
+            if bloque is None or not self.running:
+                break
+            self.spi.writebytes2(bloque)
+        self.running = False
+        # Con detener() el codificador puede estar bloqueado en put() con la cola llena
+        while hilo.is_alive():
+            try:
+                bloques.get(timeout=0.01)
+            except queue.Empty:
+                pass
+        hilo.join()
+        if error:
+            raise error[0]
+        return time.perf_counter() - inicio
+
+    def detener(self):
+        """
+        Deja de enviar después del bloque en curso (sin rampa).
+        """
+        self.running = False
+
+
+class SpiDevSimulado:
+    """
+    spidev simulado: guarda lo enviado y lo decodifica en flancos de STEP
+    para comprobar el tren de pulsos. Con tiempo_real=True cada
+    transferencia tarda lo que tardaría a max_speed_hz.
+    """
+    def __init__(self, tiempo_real=False, guardar=True):
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self.bits_per_word = 8
+        self.tiempo_real = tiempo_real
+        self.guardar = guardar
+        self.transferencias = []
+        self.bytes = 0
+        # Transiciones dentro de un byte según el bit anterior: (desplazamiento, nivel)
+        self._tabla = {}
+        for anterior in (0, 1):
+            for byte in range(256):
+                cambios = []
+                nivel = anterior
+                for i in range(8):
+                    bit = (byte >> (7 - i)) & 1
+                    if bit != nivel:
+                        cambios.append((i, bit))
+                        nivel = bit
+                self._tabla[anterior, byte] = cambios
+
+    def open(self, bus, dispositivo):
+        pass
+
+    def close(self):
+        pass
+
+    def writebytes2(self, datos):
+        datos = bytes(datos)
+        self.bytes += len(datos)
+        if self.guardar:
+            self.transferencias.append(datos)
+        if self.tiempo_real:
+            time.sleep(len(datos) * 8 / self.max_speed_hz)
+
+    def xfer3(self, datos):
+        self.writebytes2(datos)
+        return [0] * len(datos)
+
+    def flancos(self, pin=0):
+        """
+        Decodifica lo enviado.
+        :param pin: Pin que se pone en las tuplas (para compararlas con las de captura.py).
+        :return: Generador de (t_ns, pin, nivel).
+        """
+        periodo_ns = 1e9 / self.max_speed_hz
+        nivel = 0
+        bit = 0
+        tabla = self._tabla
+        for datos in self.transferencias:
+            for byte in datos:
+                if byte == 0 and nivel == 0 or byte == 0xFF and nivel == 1:
+                    bit += 8
+                    continue
+                for desplazamiento, nuevo in tabla[nivel, byte]:
+                    yield int(round((bit + desplazamiento) * periodo_ns)), pin, nuevo
+                nivel = (byte & 1)
+                bit += 8
+
+
+# Comprobación del tren de pulsos, velocidad de codificación y carga de CPU
+if __name__ == "__main__":
+    import planificador
+    from array import array
+    from captura import comparar_con_plan
+
+    print(f"[INFO] Empaquetado con {'NumPy' if numpy is not None else 'Python (NumPy no instalado)'}")
+
+    # 1. Bobina de 20 vueltas con rampa: los flancos decodificados contra el plan
+    plan = planificador.compilar_plan({"vueltas": 20, "rps": 5.0}, {"steps_per_revolution": 200})
+    spi = SpiDevSimulado()
+    generador = GeneradorSPI(spi, frecuencia=1000000, ancho_pulso=2e-6)
+    generador.ejecutar(plan.husillo)
+    resultado = comparar_con_plan(spi.flancos(23), 23, plan.husillo)
+    print(f"Rampa + crucero a 1 MHz: {resultado['pasos']} pasos decodificados, faltan {resultado['faltan']}, "
+          f"error máximo {resultado['error_max_ns']:.0f} ns (medio bit = 500 ns)")
+
+    # 2. Velocidad de codificación: pasos/s que Python puede preparar
+    for frecuencia, rps, spr in [(1000000, 30.0, 200), (4000000, 10.0, 3200)]:
+        intervalos = array("d", [1 / (rps * spr)]) * int(rps * spr * 2)  # 2 s de crucero
+        generador = GeneradorSPI(SpiDevSimulado(guardar=False), frecuencia=frecuencia, ancho_pulso=2e-6,
+                                 bytes_transferencia=65536)
+        cpu = time.process_time()
+        for _ in generador.bloques(intervalos):
+            pass
+        cpu = time.process_time() - cpu
+        pasos_s = len(intervalos) / cpu
+        print(f"SPI a {frecuencia / 1e6:.0f} MHz, {rps * spr:.0f} pasos/s: codifica {pasos_s:,.0f} pasos/s "
+              f"(máximo por el reloj SPI {generador.pasos_por_segundo_max:,.0f} pasos/s), "
+              f"CPU para tiempo real {rps * spr / pasos_s * 100:.0f}% de un núcleo")
+
+    # 3. Envío en tiempo real (la transferencia tarda lo que tardaría en el bus)
+    spi = SpiDevSimulado(tiempo_real=True, guardar=False)
+    generador = GeneradorSPI(spi, frecuencia=1000000, bytes_transferencia=65536)
+    intervalos = array("d", [1 / 6000]) * 18000  # 30 RPS con 200 pasos/vuelta, 3 s
+    cpu = time.process_time()
+    real = generador.ejecutar(intervalos)
+    cpu = time.process_time() - cpu
+    print(f"Envío de 3 s a 6000 pasos/s: {real:.2f} s, CPU {cpu / real * 100:.0f}% de un núcleo "
+          f"({spi.bytes} bytes por SPI)")
+
+    # 4. detener() a mitad de un envío largo: tiene que volver tras el bloque en curso
+    spi = SpiDevSimulado(tiempo_real=True, guardar=False)
+    generador = GeneradorSPI(spi, frecuencia=1000000, bytes_transferencia=4096)
+    intervalos = array("d", [1 / 6000]) * 600000  # 100 s
+    threading.Timer(0.2, generador.detener).start()
+    real = generador.ejecutar(intervalos, cola=2)
+    assert real < 1.0, f"detener() tardó {real:.2f} s en parar el envío"
+    print(f"detener() a los 0.2 s de un envío de 100 s: parado en {real:.3f} s ({spi.bytes} bytes enviados)")
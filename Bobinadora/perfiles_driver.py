@@ -0,0 +1,146 @@
+import os
+import time
+
+
+# Tiempos mínimos de cada driver en modo STEP/DIR (s), de sus hojas de datos:
+#   alto_min / bajo_min: ancho mínimo del pulso STEP en HIGH y en LOW
+#   preparacion_dir: DIR (y MSx) estable antes del flanco de subida de STEP
+#   retencion_dir: DIR estable después del flanco de subida de STEP
+#   asentamiento_micropasos: tras cambiar MSx, antes del siguiente paso
+#   frecuencia_max: frecuencia de pasos máxima que admite el driver (Hz)
+PERFILES_DRIVER = {
+    "A4988": {
+        "alto_min": 1.0e-6,
+        "bajo_min": 1.0e-6,
+        "preparacion_dir": 200e-9,
+        "retencion_dir": 200e-9,
+        "asentamiento_micropasos": 200e-9,
+        "frecuencia_max": 500e3,
+    },
+    "DRV8825": {
+        "alto_min": 1.9e-6,
+        "bajo_min": 1.9e-6,
+        "preparacion_dir": 650e-9,
+        "retencion_dir": 650e-9,
+        "asentamiento_micropasos": 650e-9,
+        "frecuencia_max": 250e3,
+    },
+    # TMC2208/TMC2209 en modo STEP/DIR: los pulsos se filtran a unos 100 ns
+    "TMC22xx": {
+        "alto_min": 100e-9,
+        "bajo_min": 100e-9,
+        "preparacion_dir": 20e-9,
+        "retencion_dir": 20e-9,
+        "asentamiento_micropasos": 1e-6,  # Valor prudente: MS1/MS2 no tienen tiempo publicado
+        "frecuencia_max": 5e6,
+    },
+}
+PERFILES_DRIVER["TMC2208"] = PERFILES_DRIVER["TMC22xx"]
+PERFILES_DRIVER["TMC2209"] = PERFILES_DRIVER["TMC22xx"]
+
+
+def perfil_driver(nombre):
+    """
+    :param nombre: "A4988", "DRV8825", "TMC2208", "TMC2209" o "TMC22xx".
+    :return: Diccionario con los tiempos del driver.
+    """
+    try:
+        return PERFILES_DRIVER[nombre]
+    except KeyError:
+        raise ValueError(f"Driver desconocido: {nombre}. Disponibles: {', '.join(sorted(PERFILES_DRIVER))}")
+
+
+def intervalo_minimo(perfil):
+    """
+    Intervalo mínimo entre pasos que admite el driver (s).
+    """
+    return max(perfil["alto_min"] + perfil["bajo_min"], 1 / perfil["frecuencia_max"])
+
+
+def pausa_activa(segundos, reloj=time):
+    """
+    Espera corta sin dormir (time.sleep no baja de ~50 µs). Con un reloj
+    virtual simplemente avanza el tiempo.
+    """
+    if getattr(reloj, "virtual", False):
+        reloj.sleep(segundos)
+        return
+    perf_counter = reloj.perf_counter
+    fin = perf_counter() + segundos
+    while perf_counter() < fin:
+        pass
+
+
+def cambiar_micropasos(gpio, ms_pins, niveles, perfil, reloj=time):
+    """
+    Cambia los pines MSx y espera el tiempo de asentamiento del driver
+    antes de devolver el control (el siguiente paso ya usa la nueva resolución).
+    :param ms_pins: Pines (MS1, MS2, MS3).
+    :param niveles: Niveles de cada pin.
+    """
+    for pin, nivel in zip(ms_pins, niveles):
+        gpio.output(pin, nivel)
+    pausa_activa(perfil["asentamiento_micropasos"], reloj)
+
+
+# Ancho de los pulsos con cada perfil, pasos/s máximos y CPU libre con un backend rápido
+if __name__ == "__main__":
+    from array import array
+    from ejecutor import EjecutorBobinado
+    from gpio_registros import GPIORegistros, crear_fichero_registros
+    from planificador import PlanBobinado
+    from simulador import EjeStepDir, GPIOVirtual, RelojVirtual
+
+    def plan_constante(n, intervalo):
+        return PlanBobinado(array("d", [intervalo]) * n, array("d"), {"pasos_traverse_por_capa": 0})
+
+    # 1. Tiempo virtual: cada output() cuesta 150 ns (como escribir en los registros); anchos medidos
+    print("Pulsos medidos con output() de 150 ns (tiempo virtual):")
+    for nombre in ("sin perfil", "A4988", "DRV8825", "TMC22xx"):
+        perfil = None if nombre == "sin perfil" else perfil_driver(nombre)
+        reloj = RelojVirtual()
+        gpio = GPIOVirtual(reloj, coste_ns=150, traza=True)
+        husillo = EjeStepDir(gpio, 23, 24)
+        guiado = EjeStepDir(gpio, 5, 6)
+        ejecutor = EjecutorBobinado(husillo, guiado, gpio=gpio, reloj=reloj, driver=perfil)
+        gpio.flancos.clear()
+        ejecutor.ejecutar(plan_constante(1000, 20e-6))
+        subidas = {}
+        altos = []
+        for t_ns, pin, nivel in gpio.flancos:
+            if pin == 23 and nivel:
+                subidas[pin] = t_ns
+            elif pin == 23:
+                altos.append(t_ns - subidas[pin])
+        minimo = perfil["alto_min"] * 1e9 if perfil else 0
+        print(f"  {nombre:10s} HIGH mínimo {min(altos):5d} ns (el driver pide {minimo:5.0f} ns), "
+              f"{husillo.pulsos} pasos")
+
+    # 2. Tiempo real con los registros mapeados: con el plan al intervalo mínimo del driver el bucle
+    #    nunca espera, así que el tiempo por paso es lo que ocupa la CPU cada pulso
+    dispositivo = "/dev/gpiomem" if os.path.exists("/dev/gpiomem") else crear_fichero_registros()
+    gpio = GPIORegistros(dispositivo)
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    print("Backend de registros, tiempo real:")
+    n = 200000
+    for nombre in ("sin perfil", "A4988", "DRV8825", "TMC22xx"):
+        perfil = None if nombre == "sin perfil" else perfil_driver(nombre)
+        ejecutor = EjecutorBobinado(Pines(23, 24), Pines(17, 27), gpio=gpio, driver=perfil)
+        intervalo = intervalo_minimo(perfil) if perfil else 1e-7
+        inicio = time.perf_counter()
+        ejecutor.ejecutar(plan_constante(n, intervalo))
+        por_paso = (time.perf_counter() - inicio) / n
+        maximo_driver = f"{1 / intervalo_minimo(perfil) / 1e3:6.0f}k" if perfil else "      -"
+        print(f"  {nombre:10s} {1 / por_paso / 1e3:6.1f}k pasos/s como mucho (driver {maximo_driver}), "
+              f"{por_paso * 1e6:5.2f} µs por paso; a 10 kHz queda libre el "
+              f"{max(0.0, 1 - por_paso * 10e3) * 100:.0f}% del periodo")
+    print("  Con pulsos de medio periodo (BipolarMotor.move) el hilo duerme dos veces por paso y cada sleep "
+          "se pasa ~60 µs: no llega a 10 kHz.")
+    gpio.cleanup()
+    if dispositivo != "/dev/gpiomem":
+        os.remove(dispositivo)
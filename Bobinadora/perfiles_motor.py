@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import time
+
+
+# Versión del formato del fichero de perfil
+FORMATO_PERFIL = 1
+
+# Perfiles ya leídos: ruta -> (mtime_ns, tamaño, perfil)
+_cache_perfiles = {}
+
+
+def cargar_perfil(ruta):
+    """
+    Lee un perfil de motor. El resultado se guarda en memoria y solo se
+    vuelve a leer el fichero si cambia su fecha o su tamaño, así arrancar
+    un driver cuesta un stat() en lugar de leer y decodificar el JSON.
+    :param ruta: Ruta del fichero JSON.
+    :return: Diccionario con el perfil.
+    """
+    estado = os.stat(ruta)
+    guardado = _cache_perfiles.get(ruta)
+    if guardado is not None and guardado[0] == estado.st_mtime_ns and guardado[1] == estado.st_size:
+        return guardado[2]
+
+    with open(ruta) as fichero:
+        perfil = json.load(fichero)
+    if perfil.get("formato") != FORMATO_PERFIL:
+        raise ValueError(f"Formato de perfil no soportado en {ruta}: {perfil.get('formato')}")
+    _cache_perfiles[ruta] = (estado.st_mtime_ns, estado.st_size, perfil)
+    return perfil
+
+
+def guardar_perfil(perfil, ruta):
+    """
+    Escribe un perfil de forma atómica. Si ya existe uno para el mismo motor
+    se incrementa la versión.
+    :param perfil: Diccionario con el perfil (sin versión).
+    :param ruta: Ruta del fichero JSON.
+    :return: Perfil guardado, con formato, versión y fecha.
+    """
+    version = 1
+    if os.path.exists(ruta):
+        try:
+            anterior = cargar_perfil(ruta)
+            if anterior.get("motor") == perfil.get("motor"):
+                version = anterior.get("version", 0) + 1
+        except (ValueError, OSError):
+            pass
+
+    perfil = dict(perfil, formato=FORMATO_PERFIL, version=version,
+                  fecha=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, temporal = tempfile.mkstemp(dir=directorio, suffix=".tmp")
+    with os.fdopen(fd, "w") as fichero:
+        json.dump(perfil, fichero, indent=2)
+    os.replace(temporal, ruta)
+    return perfil
+
+
+def modo_mas_rapido(perfil):
+    """
+    Devuelve el nombre del modo con mayor velocidad segura.
+    """
+    return max(perfil["modos"], key=lambda nombre: perfil["modos"][nombre]["rps_max"])
+
+
+def parametros_motor(perfil, modo=None, margen=0.9):
+    """
+    Construye el diccionario de parámetros del motor para el planificador a
+    partir de un perfil.
+    :param perfil: Perfil cargado con cargar_perfil().
+    :param modo: Nombre del modo (por defecto el más rápido).
+    :param margen: Fracción de los límites medidos que se usa.
+    :return: Diccionario con steps_per_revolution, rps_max, acel_max y resonancias.
+    """
+    if modo is None:
+        modo = modo_mas_rapido(perfil)
+    datos = perfil["modos"][modo]
+    motor = {
+        "steps_per_revolution": datos["steps_per_revolution"],
+        "rps_max": datos["rps_max"] * margen,
+        "acel_max": datos["acel_max"] * margen,
+    }
+    if datos.get("resonancias"):
+        motor["resonancias"] = datos["resonancias"]
+    return motor
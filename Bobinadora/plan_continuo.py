@@ -0,0 +1,247 @@
+import math
+import threading
+import time
+from array import array
+
+
+class PlanContinuo:
+    """
+    Plan por tramos para marchas continuas sin fin (como BipolarMotor.move o
+    nema_sexto.move_continuous). Un hilo planificador llena tramos de tamaño
+    fijo con los intervalos entre pasos en un anillo de buffers preasignados
+    y el ejecutor los consume; si el anillo está lleno el planificador
+    espera (contrapresión). Un cambio de velocidad descarta solo los tramos
+    que aún no se han entregado y la rampa sigue desde la velocidad con que
+    termina el tramo en curso. La memoria no depende de la duración de la marcha.
+    """
+    def __init__(self, steps_per_revolution, rps, rps_inicial=0.1, acel=50.0, pasos_tramo=256, tramos=4):
+        """
+        :param steps_per_revolution: Pasos por revolución.
+        :param rps: Velocidad de crucero inicial (rev/s).
+        :param rps_inicial: Velocidad de arranque y de parada (rev/s).
+        :param acel: Aceleración de las rampas (rev/s²).
+        :param pasos_tramo: Pasos por tramo. Un cambio de velocidad empieza a notarse, como mucho,
+            al terminar el tramo en curso.
+        :param tramos: Número de buffers del anillo (al menos 2: uno en uso y otro preparado).
+        """
+        if tramos < 2:
+            raise ValueError("Hacen falta al menos 2 tramos.")
+        if rps <= 0 or rps_inicial <= 0:
+            raise ValueError("Las velocidades deben ser mayores que 0.")
+        self.steps_per_revolution = steps_per_revolution
+        self.rps_inicial = rps_inicial
+        self.acel = acel
+        self.pasos_tramo = pasos_tramo
+        self.tramos = tramos
+
+        self._buffers = [array("d", bytes(8 * pasos_tramo)) for _ in range(tramos)]
+        self._vistas = [memoryview(b) for b in self._buffers]
+        self._longitud = [0] * tramos
+        self._v_final = [0.0] * tramos
+        self._crucero = array("d")  # Tramo de crucero ya calculado, se copia de una vez
+
+        self._cond = threading.Condition()
+        self._objetivo = rps
+        self._v = rps_inicial
+        self._generacion = 0
+        self._escritos = 0
+        self._entregados = 0
+        self._parar = False
+        self._fin = None  # Número de tramos que tiene el plan cuando se pide la parada
+        self._hilo = None
+
+        self.hambre = 0
+        self.espera_hambre = 0.0
+        self.minimo_preparados = None
+        self.invalidados = 0
+
+    def _llenar(self, buffer, v, objetivo, parar):
+        """
+        Llena un tramo desde la velocidad v hacia el objetivo con aceleración constante.
+        :return: (pasos escritos, velocidad final, True si el motor ha llegado a parar).
+        """
+        spr = self.steps_per_revolution
+        n = self.pasos_tramo
+        if v == objetivo and not parar:
+            if len(self._crucero) != n or self._crucero[0] != 1 / (objetivo * spr):
+                self._crucero = array("d", [1 / (objetivo * spr)]) * n
+            buffer[:] = self._crucero
+            return n, v, False
+        incremento = 2 * self.acel / spr  # Cambio de v² por paso
+        minimo = self.rps_inicial
+        destino = minimo if parar else objetivo
+        v2 = v * v
+        for i in range(n):
+            if v < destino:
+                v2 = min(destino * destino, v2 + incremento)
+            elif v > destino:
+                v2 = max(destino * destino, v2 - incremento)
+            elif parar:
+                return i, v, True
+            v = math.sqrt(v2)
+            buffer[i] = 1 / (v * spr)
+        return n, v, False
+
+    def _planificar(self):
+        while True:
+            with self._cond:
+                while not self._parar and self._fin is None and self._escritos - self._entregados >= self.tramos - 1:
+                    self._cond.wait()
+                if self._parar or self._fin is not None:
+                    return
+                generacion = self._generacion
+                indice = self._escritos % self.tramos
+                v = self._v
+                objetivo = self._objetivo
+                parar = objetivo is None
+            n, v, parado = self._llenar(self._buffers[indice], v, objetivo, parar)
+            with self._cond:
+                if generacion != self._generacion:
+                    continue  # Se cambió la velocidad mientras se calculaba: el tramo no vale
+                self._longitud[indice] = n
+                self._v_final[indice] = v
+                self._v = v
+                if n:
+                    self._escritos += 1
+                if parado:
+                    self._fin = self._escritos
+                self._cond.notify_all()
+            # Ceder el GIL entre tramos: el ejecutor espera de forma activa y no debe retrasarse
+            time.sleep(0)
+
+    def iniciar(self):
+        """
+        Arranca el hilo planificador y espera a que el primer tramo esté listo.
+        """
+        self._hilo = threading.Thread(target=self._planificar, daemon=True)
+        self._hilo.start()
+        with self._cond:
+            while self._escritos == 0 and self._fin is None:
+                self._cond.wait()
+        return self
+
+    def siguiente_tramo(self):
+        """
+        Entrega el siguiente tramo y libera el anterior. Si no hay ninguno
+        preparado espera y lo cuenta como hambre del ejecutor.
+        :return: memoryview 'd' con los intervalos del tramo, o None al terminar.
+        """
+        with self._cond:
+            preparados = self._escritos - self._entregados
+            if preparados == 0 and self._fin is not None and self._entregados >= self._fin:
+                return None
+            if self.minimo_preparados is None or preparados < self.minimo_preparados:
+                self.minimo_preparados = preparados
+            if preparados == 0:
+                self.hambre += 1
+                inicio = time.perf_counter()
+                while self._escritos == self._entregados and not (self._fin is not None and self._entregados >= self._fin):
+                    self._cond.wait()
+                self.espera_hambre += time.perf_counter() - inicio
+                if self._escritos == self._entregados:
+                    return None
+            indice = self._entregados % self.tramos
+            self._entregados += 1
+            # El tramo entregado antes ya se ha ejecutado: su hueco queda libre
+            self._cond.notify_all()
+            return self._vistas[indice][:self._longitud[indice]]
+
+    def cambiar_velocidad(self, rps):
+        """
+        Cambia la velocidad de crucero. Los tramos preparados que no se han
+        entregado se descartan y se vuelven a planificar desde el final del tramo en curso.
+        También vale durante la rampa de parada: el motor vuelve a acelerar desde donde esté.
+        :return: False si el plan ya ha terminado (la parada ha llegado a rps_inicial).
+        """
+        if rps <= 0:
+            raise ValueError("La velocidad debe ser mayor que 0.")
+        return self._replanificar(rps)
+
+    def detener(self):
+        """
+        Pide una parada con rampa hasta rps_inicial; el plan termina al llegar.
+        """
+        self._replanificar(None)
+
+    def _replanificar(self, objetivo):
+        with self._cond:
+            if self._fin is not None:
+                return False
+            self.invalidados += self._escritos - self._entregados
+            self._escritos = self._entregados
+            self._generacion += 1
+            self._objetivo = objetivo
+            if self._entregados:
+                self._v = self._v_final[(self._entregados - 1) % self.tramos]
+            else:
+                self._v = self.rps_inicial
+            self._cond.notify_all()
+        return True
+
+    def cerrar(self):
+        """
+        Detiene el hilo planificador sin rampa (al abortar la marcha).
+        """
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        if self._hilo is not None:
+            self._hilo.join()
+
+
+# Marcha continua a 30 RPS en tiempo real con cambios de velocidad, y memoria en marchas largas simuladas
+if __name__ == "__main__":
+    import tracemalloc
+    from ejecutor import EjecutorBobinado
+    from simulador import GPIOVirtual, RelojVirtual
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    class GPIONulo:
+        BCM, OUT, LOW, HIGH = 11, 0, 0, 1
+
+        def setmode(self, modo):
+            pass
+
+        def setup(self, pin, modo):
+            pass
+
+        def output(self, canal, valor):
+            pass
+
+    # 1. Tiempo real: 30 RPS (6000 pasos/s), bajada a 20 RPS a los 4 s, vuelta a 30 a los 7 s, parada a los 10 s
+    plan = PlanContinuo(200, 30.0, rps_inicial=1.0, acel=40.0).iniciar()
+    ejecutor = EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=GPIONulo())
+    cambios = [(4.0, lambda: plan.cambiar_velocidad(20.0)), (7.0, lambda: plan.cambiar_velocidad(30.0)),
+               (10.0, plan.detener)]
+
+    def programador():
+        inicio = time.perf_counter()
+        for instante, accion in cambios:
+            time.sleep(max(0.0, inicio + instante - time.perf_counter()))
+            accion()
+
+    threading.Thread(target=programador, daemon=True).start()
+    duracion = ejecutor.ejecutar_continuo(plan, pasos_traverse_por_vuelta=8, pasos_traverse_por_capa=400)
+    print(f"Tiempo real: {ejecutor.pasos_husillo} pasos en {duracion:.2f} s, retraso máximo de paso "
+          f"{ejecutor.retraso_max * 1e6:.0f} µs")
+    print(f"  hambre del ejecutor: {plan.hambre} veces ({plan.espera_hambre * 1e3:.2f} ms), "
+          f"mínimo de tramos preparados {plan.minimo_preparados}, tramos invalidados {plan.invalidados}")
+
+    # 2. Memoria: la misma marcha simulada durante 1 y 5 minutos
+    for minutos in (1, 5):
+        reloj = RelojVirtual()
+        gpio = GPIOVirtual(reloj)
+        tracemalloc.start()
+        plan = PlanContinuo(200, 30.0, rps_inicial=1.0, acel=40.0).iniciar()
+        ejecutor = EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=gpio, reloj=reloj)
+        reloj.programar(minutos * 60.0, plan.detener)
+        inicio = time.perf_counter()
+        ejecutor.ejecutar_continuo(plan)
+        actual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"Simulado {minutos:2d} min: {ejecutor.pasos_husillo} pasos, pico de memoria {pico / 1024:.1f} KiB "
+              f"({time.perf_counter() - inicio:.1f} s reales)")
@@ -0,0 +1,387 @@
+import math
+from array import array
+from collections import deque
+from itertools import groupby
+
+import rampas
+import resonancia
+from rampas import rampa_aceleracion_constante, rampa_lineal
+
+
+# Versión del formato de plan. Si cambia la forma de calcular las rampas hay
+# que subirla para que los planes guardados en disco dejen de ser válidos.
+VERSION_PLAN = 4  # 2: resonancias, acel_max y rps_max del motor; 3: cruce de bandas a acel_max por defecto;
+                  # 4: tramos e intervalos mínimos en info
+
+# Valores por defecto de una receta de bobina
+RECETA_POR_DEFECTO = {
+    "vueltas": 100,                   # Vueltas totales de la bobina
+    "rps": 5.0,                       # Velocidad de crucero del husillo (rev/s)
+    "rps_inicial": 0.1,               # Velocidad de arranque (min_delay = 0.05 con 200 pasos)
+    "pasos_rampa": 800,               # Pasos para el cambio lineal, como en calculate_delays
+    "rampa": "lineal",                # Estrategia de rampa (rampas.RAMPAS)
+    "espiras_por_capa": 50,           # Vueltas por capa antes de invertir el guiado
+    "pasos_traverse_por_vuelta": 8,   # Pasos del guiado por cada vuelta del husillo (paso del hilo)
+}
+
+
+def completar_receta(receta):
+    """
+    Devuelve una copia de la receta con los valores por defecto rellenados.
+    :param receta: Diccionario con los parámetros de la bobina.
+    :return: Diccionario completo.
+    """
+    completa = dict(RECETA_POR_DEFECTO)
+    completa.update(receta)
+    if completa["vueltas"] <= 0:
+        raise ValueError("El número de vueltas debe ser mayor que 0.")
+    if completa["rps"] <= 0 or completa["rps_inicial"] <= 0:
+        raise ValueError("Las velocidades deben ser mayores que 0.")
+    return completa
+
+
+class PlanBobinado:
+    """
+    Plan de movimiento compilado para una bobina: intervalos entre pasos del
+    husillo y del guiado (traverse), en segundos.
+    """
+    def __init__(self, husillo, traverse, info, mapa=None):
+        """
+        :param husillo: Secuencia de intervalos del husillo (array o memoryview 'd').
+        :param traverse: Secuencia de intervalos del guiado (array o memoryview 'd').
+        :param info: Diccionario con metadatos del plan (duración, pasos por capa...).
+        :param mapa: mmap del que salen los intervalos, si el plan viene de la caché.
+        """
+        self.husillo = husillo
+        self.traverse = traverse
+        self.info = info
+        self._mapa = mapa
+
+    @property
+    def duracion(self):
+        return self.info["duracion"]
+
+    def cerrar(self):
+        """
+        Libera el mapeo en memoria si el plan viene de la caché.
+        """
+        if self._mapa is not None:
+            if isinstance(self.husillo, memoryview):
+                self.husillo.release()
+            if isinstance(self.traverse, memoryview):
+                self.traverse.release()
+            self._mapa.close()
+            self._mapa = None
+
+
+def compilar_plan(receta, motor):
+    """
+    Compila una receta en un plan de intervalos para husillo y guiado.
+    El husillo acelera con la rampa de la receta (lineal por defecto),
+    mantiene el crucero y decelera con la rampa invertida. Los pasos del
+    guiado se sincronizan con la posición del husillo.
+    :param receta: Diccionario con los parámetros de la bobina.
+    :param motor: Diccionario con los parámetros del motor (steps_per_revolution y,
+        opcionalmente, rps_max, acel_max en rev/s², resonancias [[rps_min, rps_max], ...]
+        y acel_cruce en rev/s²; ver perfiles_motor.parametros_motor).
+    :return: Instancia de PlanBobinado. Si la receta tiene velocidad_hilo, el
+        plan es de velocidad de hilo constante (compilar_plan_velocidad_hilo).
+    """
+    if "velocidad_hilo" in receta:
+        return compilar_plan_velocidad_hilo(receta, motor)
+    subida, crucero, total = rampa_subida(receta, motor)
+    bajada = array("d", reversed(subida))
+
+    husillo = array("d", subida)
+    husillo.extend(array("d", [crucero]) * (total - 2 * len(subida)))
+    husillo.extend(bajada)
+    return _completar_plan(husillo, completar_receta(receta), motor["steps_per_revolution"])
+
+
+def aceleracion_cruce(motor):
+    """
+    Aceleración con que se cruzan las bandas de resonancia (rev/s²). Solo se
+    cruza más deprisa que acel_max si el motor trae acel_cruce explícita;
+    sin ninguna de las dos se usan 200 rev/s².
+    """
+    return motor.get("acel_cruce", motor.get("acel_max", 200.0))
+
+
+def rampa_subida(receta, motor):
+    """
+    Rampa de arranque del husillo para una receta de rps fijas (la de bajada
+    es la misma invertida), sin compilar el plan entero.
+    :param receta: Diccionario con los parámetros de la bobina.
+    :param motor: Diccionario con los parámetros del motor (como en compilar_plan).
+    :return: (array('d') con los delays de la subida, delay de crucero, pasos totales del husillo).
+    """
+    rampa_fijada = "pasos_rampa" in receta or "rampa" in receta
+    receta = completar_receta(receta)
+    spr = motor["steps_per_revolution"]
+    total = int(receta["vueltas"] * spr)
+
+    # Nunca se mantiene el crucero dentro de una banda de resonancia
+    bandas = motor.get("resonancias", [])
+    rps = min(receta["rps"], motor.get("rps_max", receta["rps"]))
+    if bandas:
+        rps_pedida = rps
+        rps = resonancia.velocidad_segura(bandas, rps)
+        if rps > motor.get("rps_max", rps):
+            # El borde superior de la banda pasa de rps_max: se baja por debajo, como en rps_por_capa
+            rps = rps_pedida
+            banda = resonancia.banda_de(bandas, rps)
+            while banda is not None:
+                rps = banda[0] * 0.98
+                banda = resonancia.banda_de(bandas, rps)
+
+    min_delay = 1 / (spr * receta["rps_inicial"])
+    target_delay = 1 / (spr * rps)
+    if min_delay < target_delay:
+        min_delay = target_delay  # Evitar inconsistencias
+
+    if "acel_max" in motor and not rampa_fijada:
+        # Con la aceleración medida del motor se usa la rampa más corta que permite
+        subida = rampa_aceleracion_constante(min_delay, target_delay, motor["acel_max"], spr)
+        pasos_rampa = min(len(subida), total // 2)
+        del subida[pasos_rampa:]
+    else:
+        pasos_rampa = min(receta["pasos_rampa"], total // 2)
+        subida = rampas.rampa(receta["rampa"], min_delay, target_delay, pasos_rampa)
+    if bandas:
+        subida = resonancia.rampa_evitando_bandas(subida, spr, bandas, aceleracion_cruce(motor))
+        pasos_rampa = min(len(subida), total // 2)
+        del subida[pasos_rampa:]
+    crucero = subida[-1] if subida else target_delay
+    return subida, crucero, total
+
+
+def tramos_plan(husillo, spr):
+    """
+    Divide los intervalos del husillo en rampas (cada paso cambia de intervalo)
+    y cruceros (intervalos iguales). Los cruceros se cuentan con groupby, sin
+    recorrerlos paso a paso en Python, así que el coste depende de los pasos
+    de rampa y no de la duración de la bobina.
+    :param husillo: Intervalos del husillo.
+    :param spr: Pasos por revolución.
+    :return: Lista de tramos [paso inicial, instante inicial (s), es rampa, intervalo mínimo,
+        aceleración máxima (rev/s²)]. El primer paso del plan cuenta como crucero.
+    """
+    tramos = []
+    paso = 0
+    t = 0.0
+    anterior = 0.0
+    for intervalo, grupo in groupby(husillo):
+        n = deque(enumerate(grupo, 1), maxlen=1)[0][0]
+        crucero = 0  # Primer paso del grupo que es de crucero
+        if anterior:
+            # El primer paso del grupo cambia de intervalo: es de rampa
+            acel = abs(anterior - intervalo) / (anterior * intervalo * intervalo * spr)
+            if tramos and tramos[-1][2]:
+                rampa = tramos[-1]
+                rampa[3] = min(rampa[3], intervalo)
+                rampa[4] = max(rampa[4], acel)
+            else:
+                tramos.append([paso, t, True, intervalo, acel])
+            crucero = 1
+        if n > crucero:
+            tramos.append([paso + crucero, t + crucero * intervalo, False, intervalo, 0.0])
+        paso += n
+        t += n * intervalo
+        anterior = intervalo
+    return tramos
+
+
+def _completar_plan(husillo, receta, spr, inicio_husillo=0, inicio_traverse=0):
+    """
+    Calcula los intervalos del guiado sincronizados con el husillo y monta el plan.
+    Con inicio_husillo/inicio_traverse el plan empieza a media bobina (reanudación).
+    """
+    total = inicio_husillo + len(husillo)
+
+    # Tiempo acumulado al final de cada paso del husillo
+    acumulado = array("d", bytes(8 * len(husillo)))
+    t = 0.0
+    for i, delay in enumerate(husillo):
+        t += delay
+        acumulado[i] = t
+
+    # El paso j del guiado ocurre cuando el husillo completa j * spr / ptv pasos
+    ptv = receta["pasos_traverse_por_vuelta"]
+    total_traverse = int(receta["vueltas"] * ptv)
+    traverse = array("d")
+    anterior = 0.0
+    for j in range(inicio_traverse + 1, total_traverse + 1):
+        indice = min(math.ceil(j * spr / ptv) - 1, total - 1) - inicio_husillo
+        instante = acumulado[indice] if indice >= 0 else 0.0
+        traverse.append(instante - anterior)
+        anterior = instante
+
+    tramos = tramos_plan(husillo, spr)
+    info = {
+        "version": VERSION_PLAN,
+        "duracion": t,
+        "pasos_husillo": len(husillo),
+        "pasos_traverse": len(traverse),
+        "pasos_traverse_por_capa": int(receta["espiras_por_capa"] * ptv),
+        "steps_per_revolution": spr,
+        # Para el ejecutor: límites del override y comprobación del driver sin recorrer el plan
+        "tramos": tramos,
+        "intervalos_minimos": [min((tramo[3] for tramo in tramos), default=None), min(traverse, default=None)],
+    }
+    if inicio_husillo or inicio_traverse:
+        info["pasos_husillo_inicio"] = inicio_husillo
+        info["pasos_traverse_inicio"] = inicio_traverse
+    return PlanBobinado(husillo, traverse, info)
+
+
+def reanudar_plan(plan, receta, pasos_husillo, pasos_traverse):
+    """
+    Plan para terminar una bobina interrumpida desde la posición en que se
+    quedó, arrancando desde parado allí mismo. Cada paso va a la velocidad
+    más lenta entre la del plan original en ese punto y la de la rampa de
+    arranque del plan (su tramo inicial de delays decrecientes), así que
+    acelera con la misma rampa y luego sigue el plan original.
+    :param plan: Plan completo de la bobina (PlanBobinado).
+    :param receta: Receta de la bobina.
+    :param pasos_husillo: Pasos del husillo ya dados.
+    :param pasos_traverse: Pasos del guiado ya dados.
+    :return: PlanBobinado con info["pasos_husillo_inicio"] e info["pasos_traverse_inicio"].
+    """
+    receta = completar_receta(receta)
+    original = plan.husillo
+    total = len(original)
+    if not 0 <= pasos_husillo <= total:
+        raise ValueError(f"Posición del husillo fuera del plan: {pasos_husillo} de {total} pasos.")
+    restantes = total - pasos_husillo
+    fin_rampa = 1
+    while fin_rampa < total and original[fin_rampa] <= original[fin_rampa - 1]:
+        fin_rampa += 1
+    arranque = array("d", original[:min(fin_rampa, restantes)])
+    arranque.frombytes(bytes(8 * (restantes - len(arranque))))  # Después de la rampa no limita (delay 0)
+    husillo = array("d", map(max, original[pasos_husillo:], arranque))
+    return _completar_plan(husillo, receta, plan.info["steps_per_revolution"], pasos_husillo, pasos_traverse)
+
+
+def rps_por_capa(receta, motor):
+    """
+    Velocidad del husillo en cada capa para que el hilo entre a velocidad_hilo.
+    El diámetro de la capa k (desde 0) se mide en el centro del hilo:
+    diametro_nucleo + (2k + 1) * diametro_hilo. Nunca se supera la velocidad
+    de hilo pedida: con rps_max o una banda de resonancia se baja la velocidad.
+    :param receta: Receta completa con velocidad_hilo (m/min), diametro_nucleo y diametro_hilo (mm).
+    :param motor: Diccionario del motor (rps_max y resonancias opcionales).
+    :return: Lista con las rps de cada capa.
+    """
+    capas = math.ceil(receta["vueltas"] / receta["espiras_por_capa"])
+    bandas = motor.get("resonancias", [])
+    velocidades = []
+    for k in range(capas):
+        diametro = (receta["diametro_nucleo"] + (2 * k + 1) * receta["diametro_hilo"]) / 1000
+        rps = receta["velocidad_hilo"] / (60 * math.pi * diametro)
+        rps = min(rps, motor.get("rps_max", rps))
+        banda = resonancia.banda_de(bandas, rps)
+        while banda is not None:
+            rps = banda[0] * 0.98
+            banda = resonancia.banda_de(bandas, rps)
+        velocidades.append(rps)
+    return velocidades
+
+
+def compilar_plan_velocidad_hilo(receta, motor):
+    """
+    Compila una receta de velocidad de hilo constante: en lugar de unas rps
+    fijas, el husillo va más rápido en las capas interiores y frena al
+    crecer el diámetro de la bobina. Los cambios de velocidad entre capas
+    (y el arranque y la parada) son rampas de aceleración constante que
+    terminan justo en el cambio de capa. El guiado sigue sincronizado con el
+    husillo, así que su velocidad se ajusta sola en cada capa. La clave rps
+    de la receta no se usa.
+    :param receta: Receta con velocidad_hilo (m/min), diametro_nucleo (mm), diametro_hilo (mm)
+        y, opcionalmente, acel (rev/s²; por defecto la acel_max del motor o 20).
+    :param motor: Diccionario con los parámetros del motor (como en compilar_plan).
+    :return: Instancia de PlanBobinado; info["rps_por_capa"] tiene la velocidad de cada capa.
+    """
+    receta = completar_receta(receta)
+    for clave in ("velocidad_hilo", "diametro_nucleo", "diametro_hilo"):
+        if receta.get(clave, 0) <= 0:
+            raise ValueError(f"La receta de velocidad de hilo constante necesita {clave} mayor que 0.")
+    spr = motor["steps_per_revolution"]
+    total = int(receta["vueltas"] * spr)
+    acel = receta.get("acel", motor.get("acel_max", 20.0))
+    velocidades = rps_por_capa(receta, motor)
+
+    # v² objetivo de cada paso
+    pasos_capa = int(receta["espiras_por_capa"] * spr)
+    v2_pasos = array("d")
+    for rps in velocidades:
+        v2_pasos.extend(array("d", [rps * rps]) * pasos_capa)
+    del v2_pasos[total:]
+
+    # Hacia delante, límite de aceleración desde el arranque; hacia atrás,
+    # límite de frenada antes de cada capa más lenta y de la parada
+    incremento = 2 * acel / spr
+    inicial = receta["rps_inicial"] ** 2
+    v2 = inicial
+    for i in range(total):
+        v2 = min(v2_pasos[i], v2 + incremento)
+        v2_pasos[i] = v2
+    v2 = inicial
+    for i in range(total - 1, -1, -1):
+        v2 = min(v2_pasos[i], v2 + incremento)
+        v2_pasos[i] = v2
+
+    husillo = array("d", [1 / (math.sqrt(v2) * spr) for v2 in v2_pasos])
+    plan = _completar_plan(husillo, receta, spr)
+    plan.info["rps_por_capa"] = velocidades
+    return plan
+
+
+# Velocidad de hilo constante contra rps fijas con la misma velocidad máxima del hilo
+if __name__ == "__main__":
+    import time
+    from ejecutor import EjecutorBobinado
+    from simulador import EjeStepDir, GPIOVirtual, RelojVirtual
+
+    motor = {"steps_per_revolution": 200, "acel_max": 30.0, "rps_max": 40.0}
+    receta = {"vueltas": 1200, "espiras_por_capa": 30, "pasos_traverse_por_vuelta": 8,
+              "velocidad_hilo": 120.0, "diametro_nucleo": 15.0, "diametro_hilo": 0.35}
+
+    inicio = time.perf_counter()
+    plan_hilo = compilar_plan(receta, motor)
+    compilacion = time.perf_counter() - inicio
+    capas = plan_hilo.info["rps_por_capa"]
+
+    # Con rps fijas, la capa exterior marca la velocidad para no pasar de 120 m/min
+    fijo = dict(receta, rps=capas[-1])
+    del fijo["velocidad_hilo"]
+    plan_fijo = compilar_plan(fijo, motor)
+
+    diametro_exterior = receta["diametro_nucleo"] + (2 * len(capas) - 1) * receta["diametro_hilo"]
+    print(f"{len(capas)} capas, de {capas[0]:.1f} a {capas[-1]:.1f} RPS (diámetro del hilo de "
+          f"{receta['diametro_nucleo'] + receta['diametro_hilo']:.2f} a {diametro_exterior:.2f} mm), "
+          f"plan compilado en {compilacion * 1000:.0f} ms")
+
+    for nombre, plan in (("RPS fijas", plan_fijo), ("Velocidad de hilo constante", plan_hilo)):
+        reloj = RelojVirtual()
+        gpio = GPIOVirtual(reloj)
+        husillo = EjeStepDir(gpio, 23, 24, nombre="husillo")
+        guiado = EjeStepDir(gpio, 5, 6, nombre="guiado")
+        ejecutor = EjecutorBobinado(husillo, guiado, gpio=gpio, reloj=reloj)
+        duracion = ejecutor.ejecutar(plan)
+        print(f"{nombre:28s} {duracion / 60:6.2f} min simulados, {husillo.vueltas:.0f} vueltas, "
+              f"{ejecutor.capa} capas")
+    print(f"Ahorro de tiempo: {(1 - plan_hilo.duracion / plan_fijo.duracion) * 100:.1f}%")
+
+    # Un crucero pedido dentro de una banda cuyo borde superior pasa de rps_max se queda por debajo
+    limitado = {"steps_per_revolution": 800, "rps_max": 36.0, "resonancias": [[25.0, 40.0]]}
+    crucero = 1 / (min(compilar_plan({"vueltas": 2000, "rps": 35.0}, limitado).husillo) * 800)
+    print(f"Crucero pedido 35 RPS con banda [25, 40] y rps_max 36: {crucero:.2f} RPS")
+    assert crucero <= limitado["rps_max"]
+
+    # Sin acel_cruce explícita las bandas se cruzan a la acel_max del motor, no más deprisa
+    perfilado = {"steps_per_revolution": 200, "acel_max": 30.0, "resonancias": [[3.6, 4.4]]}
+    subida, _, _ = rampa_subida({"vueltas": 200, "rps": 12.0}, perfilado)
+    v2 = [(1 / (d * 200)) ** 2 for d in subida]
+    acel_cruce = max((b - a) * 200 / 2 for a, b in zip(v2, v2[1:]))  # Δ(v²) = 2·a / pasos_por_vuelta
+    print(f"Aceleración máxima de la subida con bandas y acel_max 30: {acel_cruce:.1f} rev/s²")
+    assert acel_cruce <= perfilado["acel_max"] * 1.001
@@ -0,0 +1,500 @@
+import random
+import threading
+import time
+from collections import deque
+
+from plan_continuo import PlanContinuo
+
+
+class EntradasFisicas:
+    """
+    Pulsadores, pedal y teclas de jog por interrupción (eventos de flanco
+    del GPIO) en lugar de leer órdenes de stdin. El antirrebote es por marcas
+    de tiempo, sin sleeps: el primer flanco fuera de la ventana de rebote se
+    acepta al momento (la latencia es la del aviso del GPIO) y los flancos
+    dentro de la ventana se ignoran; al cerrarse la ventana se lee el nivel
+    y, si no coincide con el aceptado (un pico de ruido), se corrige. Si el
+    backend tiene marcas de tiempo del kernel (GPIOGpiod.ultimo_flanco_ns) se
+    usan como instante del flanco.
+
+    Con intervalos entre pasos muy cortos el hilo de pasos espera de forma
+    activa sin soltar el GIL y el callback puede tardar más de 10 ms. Por eso
+    el bucle de pasos llama también a sondear() entre tramos: lee los niveles
+    y entrega la orden en su propio hilo. La ventana de antirrebote es la
+    misma para los dos caminos, así que un flanco solo se entrega una vez.
+    """
+    def __init__(self, gpio=None, reloj=time, histograma=None, max_latencias=10000):
+        """
+        :param gpio: Módulo GPIO (por defecto RPi.GPIO).
+        :param reloj: Objeto con monotonic_ns() (el mismo reloj que las marcas del GPIO).
+        :param histograma: metricas.Histograma opcional para la latencia de las órdenes.
+        :param max_latencias: Latencias (s) que se guardan en self.latencias.
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.reloj = reloj
+        self.histograma = histograma
+        self.latencias = deque(maxlen=max_latencias)
+        self.entradas = {}
+        self.flancos = 0
+        self.ignorados = 0
+        self.correcciones = 0
+        self.sondeadas = 0
+        self._marca_kernel = getattr(gpio, "ultimo_flanco_ns", None)
+        self._bloqueo = threading.Lock()
+        if gpio.getmode() is None:
+            gpio.setmode(gpio.BCM)
+
+    def agregar(self, nombre, pin, al_pulsar=None, al_soltar=None, activo_bajo=True, rebote=0.005):
+        """
+        :param nombre: Nombre de la entrada ("marcha", "paro", "pedal", "jog+"...).
+        :param pin: Pin BCM.
+        :param al_pulsar: Función(nombre) al pulsar.
+        :param al_soltar: Función(nombre) al soltar.
+        :param activo_bajo: Pulsador a masa con pull-up (pulsado = LOW).
+        :param rebote: Ventana de antirrebote (s).
+        """
+        gpio = self.gpio
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP if activo_bajo else gpio.PUD_DOWN)
+        self.entradas[pin] = {
+            "nombre": nombre,
+            "al_pulsar": al_pulsar,
+            "al_soltar": al_soltar,
+            "activo_bajo": activo_bajo,
+            "rebote_ns": int(rebote * 1e9),
+            "pulsado": (gpio.input(pin) == 0) == activo_bajo,
+            "fin_ventana": 0,
+            "sin_comprobar": False,  # Ventana abierta por sondear(), sin temporizador todavía
+        }
+        gpio.add_event_detect(pin, gpio.BOTH, callback=self._flanco)
+
+    def _flanco(self, pin):
+        entrada = self.entradas.get(pin)
+        if entrada is None:
+            return
+        ahora = self.reloj.monotonic_ns()
+        t_flanco = self._marca_kernel(pin) if self._marca_kernel else None
+        if t_flanco is None:
+            t_flanco = ahora
+        with self._bloqueo:
+            self.flancos += 1
+            if t_flanco < entrada["fin_ventana"]:
+                self.ignorados += 1
+                if not entrada["sin_comprobar"]:
+                    return
+                # El flanco ya lo entregó sondear(); el temporizador se crea aquí y no en el hilo de pasos
+                entrada["sin_comprobar"] = False
+                retraso = max(0, entrada["fin_ventana"] - ahora) / 1e9
+                self._programar(retraso, lambda: self._comprobar(pin))
+                return
+            entrada["fin_ventana"] = t_flanco + entrada["rebote_ns"]
+            entrada["pulsado"] = not entrada["pulsado"]
+            pulsado = entrada["pulsado"]
+        self._programar(entrada["rebote_ns"] / 1e9, lambda: self._comprobar(pin))
+        self._entregar(entrada, pulsado, t_flanco)
+
+    def sondear(self):
+        """
+        Lee el nivel de las entradas y entrega en este hilo los cambios que el hilo de
+        eventos aún no ha entregado. Se llama desde el bucle de pasos
+        (EjecutorBobinado.ejecutar_continuo con entre_tramos), así una orden llega como
+        mucho un tramo después del flanco aunque el hilo de eventos no consiga el GIL.
+        """
+        for pin, entrada in list(self.entradas.items()):
+            pulsado = (self.gpio.input(pin) == 0) == entrada["activo_bajo"]
+            if pulsado == entrada["pulsado"]:
+                continue
+            ahora = self.reloj.monotonic_ns()
+            with self._bloqueo:
+                if pulsado == entrada["pulsado"] or ahora < entrada["fin_ventana"]:
+                    continue
+                entrada["fin_ventana"] = ahora + entrada["rebote_ns"]
+                entrada["pulsado"] = pulsado
+                entrada["sin_comprobar"] = True
+                self.sondeadas += 1
+            self._entregar(entrada, pulsado, None)
+
+    def _programar(self, retraso, funcion):
+        if hasattr(self.reloj, "programar"):
+            self.reloj.programar(self.reloj.perf_counter() + retraso, funcion)  # RelojVirtual
+        else:
+            temporizador = threading.Timer(retraso, funcion)
+            temporizador.daemon = True
+            temporizador.start()
+
+    def _comprobar(self, pin):
+        """
+        Al cerrarse la ventana de rebote: el nivel ya es estable.
+        """
+        entrada = self.entradas.get(pin)
+        if entrada is None:
+            return
+        with self._bloqueo:
+            if self.reloj.monotonic_ns() < entrada["fin_ventana"]:
+                return  # Ha empezado otra ventana; la comprobará su temporizador
+            pulsado = (self.gpio.input(pin) == 0) == entrada["activo_bajo"]
+            if pulsado == entrada["pulsado"]:
+                return
+            entrada["pulsado"] = pulsado
+            self.correcciones += 1
+        self._entregar(entrada, pulsado, self.reloj.monotonic_ns())
+
+    def _entregar(self, entrada, pulsado, t_flanco):
+        # Latencia del flanco a la entrega de la orden (sin lo que tarde la propia orden). Con
+        # sondear() no se conoce el instante del flanco: esas órdenes no cuentan
+        if t_flanco is not None:
+            latencia = (self.reloj.monotonic_ns() - t_flanco) / 1e9
+            self.latencias.append(latencia)
+            if self.histograma is not None:
+                self.histograma.observar(latencia)
+        funcion = entrada["al_pulsar"] if pulsado else entrada["al_soltar"]
+        if funcion is not None:
+            funcion(entrada["nombre"])
+
+    def pulsado(self, nombre):
+        for entrada in self.entradas.values():
+            if entrada["nombre"] == nombre:
+                return entrada["pulsado"]
+        raise ValueError(f"No hay ninguna entrada llamada {nombre}.")
+
+    def cerrar(self):
+        for pin in list(self.entradas):
+            self.gpio.remove_event_detect(pin)
+        self.entradas.clear()
+
+
+class ControlMarcha:
+    """
+    Une las entradas físicas con el motor: marcha y paro, pedal (marcha
+    mientras se pisa) y jog en los dos sentidos (mientras se pulsa). El paro
+    pide al plan una rampa de frenada en el acto (PlanContinuo.detener), que
+    empieza al acabar el tramo en curso: con tramos cortos es cuestión de ms.
+    Una marcha o un jog pulsados durante la frenada no se pierden: en el mismo
+    sentido el plan vuelve a acelerar desde donde esté y, si cambia el sentido
+    (o el motor ya ha parado), la marcha nueva arranca al terminar la anterior.
+    """
+    def __init__(self, ejecutor, steps_per_revolution, rps=10.0, rps_jog=1.0, acel=20.0, rps_inicial=0.5,
+                 pasos_tramo=32):
+        """
+        :param ejecutor: EjecutorBobinado.
+        :param steps_per_revolution: Pasos por revolución del husillo.
+        :param rps: Velocidad de trabajo (marcha y pedal).
+        :param rps_jog: Velocidad del jog.
+        :param acel: Aceleración de las rampas (rev/s²).
+        :param pasos_tramo: Pasos por tramo del plan (cuanto menor, antes empieza la frenada).
+        """
+        self.ejecutor = ejecutor
+        self.steps_per_revolution = steps_per_revolution
+        self.rps = rps
+        self.rps_jog = rps_jog
+        self.acel = acel
+        self.rps_inicial = rps_inicial
+        self.pasos_tramo = pasos_tramo
+        self.plan = None
+        self.hilo = None
+        self.horario = True
+        self.parando = False
+        self.entradas = None
+        self._pendiente = None  # (rps, horario) pedido durante la frenada
+        self._bloqueo = threading.Lock()
+
+    @property
+    def en_marcha(self):
+        return self.hilo is not None and self.hilo.is_alive()
+
+    def _nuevo_plan(self, rps):
+        return PlanContinuo(self.steps_per_revolution, rps, rps_inicial=self.rps_inicial, acel=self.acel,
+                            pasos_tramo=self.pasos_tramo).iniciar()
+
+    def _arrancar(self, rps, horario=True):
+        with self._bloqueo:
+            if self.hilo is None:
+                self.plan = self._nuevo_plan(rps)
+                self.horario = horario
+                self.parando = False
+                self.hilo = threading.Thread(target=self._marchar, daemon=True)
+                self.hilo.start()
+            elif self.parando:
+                if horario == self.horario and self.plan.cambiar_velocidad(rps):
+                    self.parando = False
+                else:
+                    self._pendiente = (rps, horario)
+
+    def _marchar(self):
+        """
+        Hilo de la marcha: al terminar un plan arranca la marcha pedida durante la frenada, si la hay.
+        """
+        while True:
+            sondear = self.entradas.sondear if self.entradas is not None else None
+            self.ejecutor.ejecutar_continuo(self.plan, self.horario, entre_tramos=sondear)
+            with self._bloqueo:
+                if self._pendiente is None:
+                    self.hilo = None
+                    return
+                rps, self.horario = self._pendiente
+                self._pendiente = None
+                self.plan = self._nuevo_plan(rps)
+                self.parando = False
+
+    def marcha(self, nombre=None):
+        self._arrancar(self.rps)
+
+    def paro(self, nombre=None):
+        with self._bloqueo:
+            self._pendiente = None
+            if self.hilo is not None:
+                self.parando = True
+                self.plan.detener()
+
+    def jog_adelante(self, nombre=None):
+        self._arrancar(self.rps_jog, True)
+
+    def jog_atras(self, nombre=None):
+        self._arrancar(self.rps_jog, False)
+
+    def conectar(self, entradas, marcha=None, paro=None, pedal=None, jog_adelante=None, jog_atras=None, rebote=0.005):
+        """
+        Registra los pines que se indiquen en unas EntradasFisicas. El bucle de pasos las
+        sondea entre tramos.
+        """
+        self.entradas = entradas
+        if marcha is not None:
+            entradas.agregar("marcha", marcha, al_pulsar=self.marcha, rebote=rebote)
+        if paro is not None:
+            entradas.agregar("paro", paro, al_pulsar=self.paro, rebote=rebote)
+        if pedal is not None:
+            entradas.agregar("pedal", pedal, al_pulsar=self.marcha, al_soltar=self.paro, rebote=rebote)
+        if jog_adelante is not None:
+            entradas.agregar("jog+", jog_adelante, al_pulsar=self.jog_adelante, al_soltar=self.paro, rebote=rebote)
+        if jog_atras is not None:
+            entradas.agregar("jog-", jog_atras, al_pulsar=self.jog_atras, al_soltar=self.paro, rebote=rebote)
+
+    def esperar(self):
+        hilo = self.hilo
+        if hilo is not None:
+            hilo.join()
+
+
+class InterruptorConRebote:
+    """
+    Interruptor simulado con rebotes: al pulsar o soltar, el contacto cambia
+    varias veces en unos ms antes de quedarse en el nivel final.
+    """
+    def __init__(self, forzar, pin, activo_bajo=True, rebotes=(2, 8), duracion=0.002, semilla=None):
+        """
+        :param forzar: Función (pin, nivel) que cambia la entrada (GPIOVirtual.forzar_entrada,
+            GpiodSimulado.forzar_entrada).
+        :param rebotes: Mínimo y máximo de cambios extra en cada accionamiento.
+        :param duracion: Tiempo máximo de rebote (s).
+        """
+        self.forzar = forzar
+        self.pin = pin
+        self.activo_bajo = activo_bajo
+        self.rebotes = rebotes
+        self.duracion = duracion
+        self.aleatorio = random.Random(semilla)
+
+    def secuencia(self, pulsar):
+        """
+        :return: Lista de (instante relativo en s, nivel); el último es el nivel final.
+        """
+        final = (0 if self.activo_bajo else 1) if pulsar else (1 if self.activo_bajo else 0)
+        n = self.aleatorio.randint(*self.rebotes) // 2 * 2  # Cambios extra en pares: acaba en final
+        instantes = sorted(self.aleatorio.uniform(0, self.duracion) for _ in range(n))
+        cambios = [(0.0, final)]
+        for i, instante in enumerate(instantes):
+            cambios.append((instante, 1 - final if i % 2 == 0 else final))
+        return cambios
+
+    def programar(self, reloj, instante, pulsar):
+        """
+        Programa el accionamiento en un RelojVirtual.
+        """
+        for desplazamiento, nivel in self.secuencia(pulsar):
+            reloj.programar(instante + desplazamiento, lambda nivel=nivel: self.forzar(self.pin, nivel))
+
+    def accionar(self, pulsar):
+        """
+        Acciona el interruptor en tiempo real (bloquea lo que duran los rebotes).
+        :return: Instante del primer flanco (time.monotonic_ns).
+        """
+        inicio = None
+        t0 = time.perf_counter()
+        for desplazamiento, nivel in self.secuencia(pulsar):
+            while time.perf_counter() - t0 < desplazamiento:
+                time.sleep(0)  # Un contacto real no ocupa el GIL: los demás hilos siguen
+            self.forzar(self.pin, nivel)
+            if inicio is None:
+                inicio = time.monotonic_ns()
+        return inicio
+
+
+# Antirrebote con interruptores simulados y latencia de las órdenes con el motor en marcha
+if __name__ == "__main__":
+    from ejecutor import EjecutorBobinado
+    from gpio_gpiod import GPIOGpiod, GpiodSimulado
+    from simulador import GPIOVirtual, RelojVirtual
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    class GPIOPasos:
+        """Salidas sin hardware que guardan el instante de cada paso del husillo (monotonic_ns, como los flancos)."""
+        BCM, OUT, LOW, HIGH = 11, 0, 0, 1
+
+        def __init__(self, step_pin):
+            self.step_pin = step_pin
+            self.pasos = []
+
+        def setmode(self, modo):
+            pass
+
+        def setup(self, pin, modo):
+            pass
+
+        def output(self, canal, valor):
+            if canal == self.step_pin and valor:
+                self.pasos.append(time.monotonic_ns())
+
+    # 1. Antirrebote en tiempo virtual: 1000 pulsaciones con 2-8 rebotes de hasta 2 ms
+    reloj = RelojVirtual()
+    gpio = GPIOVirtual(reloj)
+    gpio.setmode(gpio.BCM)
+    entradas = EntradasFisicas(gpio, reloj)
+    cuentas = {"pulsar": 0, "soltar": 0}
+    entradas.agregar("marcha", 17, al_pulsar=lambda n: cuentas.__setitem__("pulsar", cuentas["pulsar"] + 1),
+                     al_soltar=lambda n: cuentas.__setitem__("soltar", cuentas["soltar"] + 1))
+    interruptor = InterruptorConRebote(gpio.forzar_entrada, 17, semilla=1)
+    for i in range(1000):
+        interruptor.programar(reloj, i * 0.1, True)
+        interruptor.programar(reloj, i * 0.1 + 0.04, False)
+    reloj.sleep(100.0)
+    flancos_bajada = (entradas.flancos + 1000) // 2
+    print(f"Virtual: 1000 pulsaciones, {entradas.flancos} flancos ({flancos_bajada} de bajada sin antirrebote) -> "
+          f"{cuentas['pulsar']} pulsaciones y {cuentas['soltar']} sueltas, {entradas.ignorados} ignorados, "
+          f"{entradas.correcciones} correcciones")
+
+    # 2. Tiempo real con el backend gpiod simulado (hilo de eventos con marcas de tiempo)
+    def montar(steps_per_revolution, rps, pasos_tramo):
+        chip = GpiodSimulado()
+        for pin in (17, 27, 22, 10):
+            chip.forzar_entrada(pin, 1)  # Pull-up: en reposo a HIGH
+        gpio = GPIOGpiod(gpiod=chip)
+        gpio.setmode(gpio.BCM)
+        salidas = GPIOPasos(23)
+        ejecutor = EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=salidas)
+        control = ControlMarcha(ejecutor, steps_per_revolution, rps=rps, rps_jog=2.0, acel=60.0, rps_inicial=1.0,
+                                pasos_tramo=pasos_tramo)
+        entradas = EntradasFisicas(gpio)
+        control.conectar(entradas, marcha=17, paro=27, jog_adelante=22, jog_atras=10)
+        return chip, gpio, salidas, control, entradas
+
+    def marchas_y_paros(chip, salidas, control, ciclos):
+        """
+        Latencia real: del primer flanco del pulsador al primer paso de la orden.
+        """
+        marcha = InterruptorConRebote(chip.forzar_entrada, 17, semilla=2)
+        paro = InterruptorConRebote(chip.forzar_entrada, 27, semilla=3)
+        crucero = 1 / (control.rps * control.steps_per_revolution)
+        arranques = []
+        frenadas = []
+        for ciclo in range(ciclos):
+            primero = len(salidas.pasos)
+            t_marcha = marcha.accionar(True)
+            time.sleep(0.05)
+            marcha.accionar(False)
+            time.sleep(1.0)  # Acelera y va a la velocidad de crucero
+            arranques.append((salidas.pasos[primero] - t_marcha) / 1e9)
+
+            # Índice del primer paso del primer tramo con intervalos mayores que el de crucero
+            plan = control.plan
+            entregar = plan.siguiente_tramo
+            frenada = []
+
+            def siguiente_tramo():
+                tramo = entregar()
+                if not frenada and tramo is not None and tramo[0] > crucero * (1 + 1e-9):
+                    frenada.append(len(salidas.pasos))
+                return tramo
+
+            plan.siguiente_tramo = siguiente_tramo
+            t_paro = paro.accionar(True)
+            time.sleep(0.05)
+            paro.accionar(False)
+            control.esperar()
+            frenadas.append((salidas.pasos[frenada[0]] - t_paro) / 1e9)
+        return arranques, frenadas
+
+    def resumen(valores):
+        valores = sorted(valores)
+        return f"mediana {valores[len(valores) // 2] * 1e3:.2f} ms, máxima {valores[-1] * 1e3:.2f} ms"
+
+    chip, gpio, salidas, control, entradas = montar(200, 30.0, 32)
+    retrasos_arranque, retrasos_frenada = marchas_y_paros(chip, salidas, control, 10)
+    marcha = InterruptorConRebote(chip.forzar_entrada, 17, semilla=6)
+    paro = InterruptorConRebote(chip.forzar_entrada, 27, semilla=7)
+    jog = InterruptorConRebote(chip.forzar_entrada, 22, semilla=4)
+    jog_atras = InterruptorConRebote(chip.forzar_entrada, 10, semilla=5)
+
+    # Marcha pulsada durante la frenada: el mismo plan vuelve a acelerar
+    marcha.accionar(True)
+    marcha.accionar(False)
+    time.sleep(1.0)
+    plan = control.plan
+    paro.accionar(True)
+    paro.accionar(False)
+    time.sleep(0.1)
+    marcha.accionar(True)
+    marcha.accionar(False)
+    time.sleep(1.0)
+    reacelera = control.en_marcha and control.plan is plan and not control.parando
+    paro.accionar(True)
+    paro.accionar(False)
+    control.esperar()
+
+    # Jog atrás durante la frenada: arranca en el otro sentido al parar y frena al soltarlo
+    marcha.accionar(True)
+    marcha.accionar(False)
+    time.sleep(1.0)
+    paro.accionar(True)
+    paro.accionar(False)
+    time.sleep(0.1)
+    jog_atras.accionar(True)
+    time.sleep(1.0)
+    invierte = control.en_marcha and not control.horario
+    jog_atras.accionar(False)
+    control.esperar()
+
+    jog.accionar(True)
+    time.sleep(0.3)
+    jog.accionar(False)
+    control.esperar()
+    gpio.cleanup()
+
+    tramo = control.pasos_tramo / (30.0 * 200)
+    latencias = list(entradas.latencias)
+    print(f"Tiempo real: {entradas.flancos} flancos, {entradas.ignorados} rebotes ignorados; "
+          f"{len(latencias)} órdenes por el hilo de eventos (flanco -> callback {resumen(latencias)}) "
+          f"y {entradas.sondeadas} por el sondeo entre tramos")
+    print(f"Paro -> primer paso de la frenada: {resumen(retrasos_frenada)}. La frenada empieza al acabar "
+          f"el tramo en curso: como mucho {control.pasos_tramo} pasos = {tramo * 1e3:.1f} ms a 30 RPS")
+    print(f"Marcha -> primer paso (motor parado; el primer intervalo a 1 RPS ya son 5 ms): "
+          f"{resumen(retrasos_arranque)}")
+    print(f"Marcha durante la frenada: {'vuelve a acelerar' if reacelera else 'se pierde'}; "
+          f"jog atrás durante la frenada: {'arranca hacia atrás al parar' if invierte else 'se pierde'}")
+    assert reacelera and invierte
+    assert max(retrasos_frenada) < tramo + 0.002
+
+    # 3. 1/16 de micropaso a 10 RPS: 31 µs entre pasos, el hilo de pasos no suelta el GIL
+    chip, gpio, salidas, control, entradas = montar(200 * 16, 10.0, 256)
+    retrasos_arranque, retrasos_frenada = marchas_y_paros(chip, salidas, control, 5)
+    gpio.cleanup()
+    tramo = control.pasos_tramo / (10.0 * 200 * 16)
+    latencias = list(entradas.latencias)
+    print(f"1/16 a 10 RPS: paro -> primer paso de la frenada {resumen(retrasos_frenada)} "
+          f"(tramos de {tramo * 1e3:.1f} ms); {entradas.sondeadas} órdenes por el sondeo entre tramos, "
+          f"{len(latencias)} por el hilo de eventos (flanco -> callback {resumen(latencias)})")
+    assert max(retrasos_frenada) < tramo + 0.002
@@ -0,0 +1,304 @@
+import mmap
+import os
+import struct
+import zlib
+
+import cache_planes
+import planificador
+
+
+# Disposición del fichero (192 bytes):
+#   0: cabecera (magia, versión)
+#  16: posición absoluta del husillo y del guiado (2 x int64), escrita en cada paso
+#  32: posición pendiente de cada eje (2 x int64), escrita antes del flanco de STEP
+#  64 y 128: dos ranuras con el registro completo; se escriben alternándose y
+#     llevan un CRC, así que un registro a medio escribir se descarta y vale el anterior
+CABECERA_PUNTO = struct.Struct("<4sI")
+MAGIA_PUNTO = b"BOBC"
+VERSION_PUNTO = 1
+POSICIONES = 16
+RANURA = struct.Struct("<Q20sqqii")  # secuencia, clave del plan, husillo, guiado, capa, horario
+CRC = struct.Struct("<I")
+RANURAS = (64, 128)
+TAMANO_PUNTO = 192
+
+
+class PuntoControl:
+    """
+    Punto de control de un bobinado en un fichero mapeado en memoria, para
+    reanudar en la vuelta exacta si el proceso muere. El ejecutor escribe la
+    posición absoluta de cada eje en cada paso (escrituras de 8 bytes en el
+    mapa, sin llamadas al sistema): antes del flanco de STEP como pendiente y
+    después como hecha. Si el proceso muere entre las dos, el paso se
+    resuelve al reanudar con el nivel del pin STEP, que sigue en alto si el
+    flanco salió. Cada `cada` pasos escribe también el registro
+    completo (posiciones, capa, sentido y clave del plan) en una de las dos
+    ranuras. Lo escrito en el mapa sobrevive a la muerte del proceso; para
+    sobrevivir a un corte de luz hay que llamar a sincronizar() de vez en cuando.
+    """
+    def __init__(self, ruta, cada=200):
+        """
+        :param ruta: Fichero del punto de control (se crea si no existe).
+        :param cada: Pasos del husillo entre registros completos (por defecto una vuelta a 200 pasos).
+        """
+        self.ruta = ruta
+        self.cada = cada
+        if not os.path.exists(ruta) or os.path.getsize(ruta) != TAMANO_PUNTO:
+            with open(ruta, "wb") as fichero:
+                fichero.write(CABECERA_PUNTO.pack(MAGIA_PUNTO, VERSION_PUNTO).ljust(TAMANO_PUNTO, b"\0"))
+        fd = os.open(ruta, os.O_RDWR)
+        try:
+            self._mapa = mmap.mmap(fd, TAMANO_PUNTO)
+        finally:
+            os.close(fd)
+        magia, version = CABECERA_PUNTO.unpack_from(self._mapa, 0)
+        if magia != MAGIA_PUNTO or version != VERSION_PUNTO:
+            self._mapa.close()
+            raise ValueError(f"{ruta} no es un punto de control válido.")
+        # Husillo, guiado, pendiente del husillo, pendiente del guiado
+        self.posiciones = memoryview(self._mapa)[POSICIONES:POSICIONES + 32].cast("q")
+        self.clave = b""
+        ultimo = self._ultimo_registro()
+        self._secuencia = ultimo[0] if ultimo else 0
+        if ultimo:
+            self.clave = ultimo[1]
+
+    def _leer_ranura(self, desplazamiento):
+        datos = self._mapa[desplazamiento:desplazamiento + RANURA.size]
+        (crc,) = CRC.unpack_from(self._mapa, desplazamiento + RANURA.size)
+        registro = RANURA.unpack(datos)
+        if registro[0] == 0 or zlib.crc32(datos) != crc:
+            return None
+        return registro
+
+    def _ultimo_registro(self):
+        registros = [r for r in map(self._leer_ranura, RANURAS) if r is not None]
+        return max(registros, default=None)
+
+    def iniciar(self, clave):
+        """
+        Empieza una bobina nueva: borra el estado anterior.
+        :param clave: Clave del plan (cache_planes.clave_plan), en hexadecimal.
+        """
+        self.clave = bytes.fromhex(clave)
+        for i in range(4):
+            self.posiciones[i] = 0
+        self._mapa[RANURAS[0]:TAMANO_PUNTO] = bytes(TAMANO_PUNTO - RANURAS[0])
+        self._secuencia = 0
+        self.guardar(0, 0, 0, True)
+
+    def guardar(self, pasos_husillo, pasos_traverse, capa, horario):
+        """
+        Escribe el registro completo en la ranura más antigua; el CRC va al final.
+        """
+        self._secuencia += 1
+        desplazamiento = RANURAS[self._secuencia & 1]
+        datos = RANURA.pack(self._secuencia, self.clave, pasos_husillo, pasos_traverse, capa, 1 if horario else 0)
+        self._mapa[desplazamiento:desplazamiento + RANURA.size] = datos
+        CRC.pack_into(self._mapa, desplazamiento + RANURA.size, zlib.crc32(datos))
+
+    def leer(self, niveles_step=None):
+        """
+        Estado para reanudar: el registro válido más reciente con las posiciones
+        de cada paso (que van por delante del registro).
+        :param niveles_step: (husillo, guiado) con el nivel actual de cada pin STEP. Un paso
+            pendiente se cuenta como hecho si su pin está en alto; sin niveles no se cuenta
+            y queda marcado en "pendiente".
+        :return: Diccionario, o None si no hay ningún registro válido.
+        """
+        registro = self._ultimo_registro()
+        if registro is None:
+            return None
+        secuencia, clave, husillo, traverse, capa, horario = registro
+        # Las posiciones de cada paso no pueden ir por detrás del registro (si lo hacen, el fichero está dañado)
+        pasos = [max(husillo, self.posiciones[0]), max(traverse, self.posiciones[1])]
+        pendiente = [False, False]
+        for eje in (0, 1):
+            if self.posiciones[2 + eje] == pasos[eje] + 1:
+                # Murió entre escribir la pendiente y confirmarla: el flanco salió si STEP sigue en alto
+                if niveles_step is None:
+                    pendiente[eje] = True
+                elif niveles_step[eje]:
+                    pasos[eje] += 1
+        return {
+            "secuencia": secuencia,
+            "clave": clave.hex(),
+            "pasos_husillo": pasos[0],
+            "pasos_traverse": pasos[1],
+            "pendiente": tuple(pendiente),
+            "capa": capa,
+            "horario": bool(horario),
+        }
+
+    def sincronizar(self):
+        """
+        Fuerza la escritura a disco (msync) para sobrevivir también a un corte de luz.
+        """
+        self._mapa.flush()
+
+    def cerrar(self):
+        self.posiciones.release()
+        self._mapa.close()
+
+
+def bobinar(punto, receta, motor, ejecutor, horario=True, cache=None):
+    """
+    Bobina desde el principio guardando el punto de control.
+    :param cache: CachePlanes opcional para obtener el plan.
+    :return: Tiempo empleado (s).
+    """
+    plan = cache.obtener_plan(receta, motor) if cache else planificador.compilar_plan(receta, motor)
+    punto.iniciar(cache_planes.clave_plan(receta, motor))
+    return ejecutor.ejecutar(plan, horario, punto_control=punto)
+
+
+def reanudar(punto, receta, motor, ejecutor, cache=None):
+    """
+    Termina una bobina interrumpida: reconstruye el plan desde la posición
+    guardada y arranca con rampa en ese mismo punto. Un paso que quedó a
+    medias se resuelve con el nivel de los pines STEP que encontró el
+    ejecutor al crearse (ejecutor.niveles_step).
+    :return: Tiempo empleado (s).
+    """
+    estado = punto.leer(ejecutor.niveles_step)
+    if estado is None:
+        raise RuntimeError(f"No hay ningún punto de control en {punto.ruta}.")
+    if estado["clave"] != cache_planes.clave_plan(receta, motor):
+        raise ValueError("El punto de control es de otra bobina (la receta o el motor no coinciden).")
+    plan = cache.obtener_plan(receta, motor) if cache else planificador.compilar_plan(receta, motor)
+    print(f"[INFO] Reanudando en el paso {estado['pasos_husillo']} de {len(plan.husillo)} "
+          f"(vuelta {estado['pasos_husillo'] / plan.info['steps_per_revolution']:.2f}, capa {estado['capa']})")
+    resto = planificador.reanudar_plan(plan, receta, estado["pasos_husillo"], estado["pasos_traverse"])
+    return ejecutor.ejecutar(resto, estado["horario"], punto_control=punto)
+
+
+# Muerte del proceso en instantes aleatorios y reanudación: la bobina debe acabar con las vueltas exactas
+if __name__ == "__main__":
+    import random
+    import signal
+    import subprocess
+    import sys
+    import tempfile
+    import time
+    from array import array
+    from ejecutor import EjecutorBobinado
+    from simulador import GPIOVirtual, RelojVirtual
+
+    RECETA = {"vueltas": 150, "rps": 20.0, "espiras_por_capa": 20, "pasos_traverse_por_vuelta": 8}
+    MOTOR = {"steps_per_revolution": 200, "acel_max": 40.0}
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    def maquina(ruta_mundo):
+        """
+        Ejecutor sobre GPIO virtual cuyos motores guardan su posición en un
+        fichero aparte: es la máquina real, que no se entera de que el proceso muere.
+        Cada eje guarda posición * 2 + nivel de STEP en una sola escritura, y el
+        nivel de los pines STEP se recupera al arrancar, como en la Raspberry.
+        """
+        reloj = RelojVirtual()
+        gpio = GPIOVirtual(reloj)
+        with open(ruta_mundo, "r+b") as fichero:
+            mapa = mmap.mmap(fichero.fileno(), 16)
+        mundo = memoryview(mapa).cast("q")  # Pasos del husillo, posición del guiado
+        gpio.niveles[23] = mundo[0] & 1
+        gpio.niveles[5] = mundo[1] & 1
+
+        def paso_husillo(pin, nivel, t_ns):
+            mundo[0] = ((mundo[0] >> 1) + nivel) * 2 + nivel
+
+        def paso_guiado(pin, nivel, t_ns):
+            avance = (1 if gpio.niveles[6] else -1) if nivel else 0
+            mundo[1] = ((mundo[1] >> 1) + avance) * 2 + nivel
+
+        gpio.observar(23, paso_husillo)
+        gpio.observar(5, paso_guiado)
+        ejecutor = EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=gpio, reloj=reloj)
+        return ejecutor, mundo
+
+    def leer_mundo(ruta_mundo):
+        with open(ruta_mundo, "rb") as fichero:
+            return tuple(valor >> 1 for valor in array("q", fichero.read(16)))
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--hijo":
+        directorio = sys.argv[2]
+        ejecutor, _ = maquina(os.path.join(directorio, "mundo"))
+        bobinar(PuntoControl(os.path.join(directorio, "punto")), RECETA, MOTOR, ejecutor)
+        sys.exit(0)
+
+    directorio = tempfile.mkdtemp(prefix="punto_")
+    ruta_mundo = os.path.join(directorio, "mundo")
+    ruta_punto = os.path.join(directorio, "punto")
+
+    # Referencia sin interrupciones y coste del punto de control en el bucle de pasos
+    with open(ruta_mundo, "wb") as fichero:
+        fichero.write(bytes(16))
+    ejecutor, _ = maquina(ruta_mundo)
+    plan = planificador.compilar_plan(RECETA, MOTOR)
+    inicio = time.perf_counter()
+    ejecutor.ejecutar(plan)
+    sin_punto = time.perf_counter() - inicio
+    referencia = leer_mundo(ruta_mundo)
+    with open(ruta_mundo, "wb") as fichero:
+        fichero.write(bytes(16))
+    ejecutor, _ = maquina(ruta_mundo)
+    punto = PuntoControl(ruta_punto)
+    inicio = time.perf_counter()
+    bobinar(punto, RECETA, MOTOR, ejecutor)
+    con_punto = time.perf_counter() - inicio
+    pasos = len(plan.husillo) + len(plan.traverse)
+    print(f"Referencia: {referencia[0]} pasos del husillo ({referencia[0] / 200:.0f} vueltas), guiado en "
+          f"{referencia[1]}; bucle de pasos {sin_punto / pasos * 1e6:.2f} µs/paso sin punto de control, "
+          f"{con_punto / pasos * 1e6:.2f} µs/paso con él (simulado)")
+
+    # Registro a medio escribir: se descarta y vale el anterior
+    punto.guardar(1000, 40, 2, True)
+    punto.guardar(1200, 48, 2, True)
+    desplazamiento = RANURAS[punto._secuencia & 1]
+    punto._mapa[desplazamiento + 8:desplazamiento + 12] = b"\xff\xff\xff\xff"  # Escritura cortada
+    estado = PuntoControl(ruta_punto).leer()
+    print(f"Ranura dañada: se lee la secuencia {estado['secuencia']} (la última válida) en vez de la {punto._secuencia}")
+    # Muerte entre la pendiente y la confirmación: decide el nivel del pin STEP
+    punto.posiciones[0] = 1200
+    punto.posiciones[2] = 1201
+    salio = punto.leer((1, 0))["pasos_husillo"]
+    no_salio = punto.leer((0, 0))["pasos_husillo"]
+    print(f"Paso a medias tras el 1200: {salio} con STEP en alto, {no_salio} con STEP en bajo")
+    assert (salio, no_salio) == (1201, 1200)
+    punto.cerrar()
+
+    # Muerte con SIGKILL en instantes aleatorios y reanudación
+    aleatorio = random.Random(7)
+    exactas = 0
+    pruebas = 12
+    for prueba in range(pruebas):
+        with open(ruta_mundo, "wb") as fichero:
+            fichero.write(bytes(16))
+        if os.path.exists(ruta_punto):
+            os.remove(ruta_punto)
+        hijo = subprocess.Popen([sys.executable, __file__, "--hijo", directorio])
+        while leer_mundo(ruta_mundo)[0] == 0 and hijo.poll() is None:
+            time.sleep(0.001)
+        time.sleep(aleatorio.uniform(0, con_punto))
+        hijo.send_signal(signal.SIGKILL)
+        hijo.wait()
+        antes = leer_mundo(ruta_mundo)
+        punto = PuntoControl(ruta_punto)
+        guardado = punto.leer()["pasos_husillo"]
+        ejecutor, _ = maquina(ruta_mundo)
+        reanudar(punto, RECETA, MOTOR, ejecutor)
+        punto.cerrar()
+        final = leer_mundo(ruta_mundo)
+        correcta = final == referencia
+        exactas += correcta
+        print(f"  muerte en el paso {antes[0]:5d} (punto de control {guardado:5d}): al final "
+              f"{final[0]} pasos = {final[0] / 200:.3f} vueltas, guiado en {final[1]} "
+              f"{'OK' if correcta else 'DIFERENTE'}")
+    print(f"{exactas} de {pruebas} bobinas reanudadas con los pasos exactos")
+    import shutil
+    shutil.rmtree(directorio)
+    if exactas != pruebas:
+        sys.exit(1)
@@ -0,0 +1,257 @@
+import os
+import tempfile
+import time
+
+
+def crear_sysfs_simulado(directorio=None, chip=0, canales=2):
+    """
+    Crea un árbol con la forma de /sys/class/pwm (pwmchipN con los canales ya
+    exportados) para probar CanalPWM sin la Raspberry.
+    :return: Directorio raíz, para pasarlo como raiz a CanalPWM.
+    """
+    raiz = directorio or tempfile.mkdtemp(prefix="pwm_")
+    base = os.path.join(raiz, f"pwmchip{chip}")
+    os.makedirs(base, exist_ok=True)
+    for nombre, valor in (("npwm", canales), ("export", ""), ("unexport", "")):
+        with open(os.path.join(base, nombre), "w") as fichero:
+            fichero.write(f"{valor}\n")
+    for canal in range(canales):
+        directorio_canal = os.path.join(base, f"pwm{canal}")
+        os.makedirs(directorio_canal, exist_ok=True)
+        for nombre, valor in (("period", 0), ("duty_cycle", 0), ("enable", 0), ("polarity", "normal")):
+            with open(os.path.join(directorio_canal, nombre), "w") as fichero:
+                fichero.write(f"{valor}\n")
+    return raiz
+
+
+def leer_valor(ruta):
+    with open(ruta) as fichero:
+        return fichero.read().split()[0]
+
+
+class CanalPWM:
+    """
+    Canal de PWM por hardware a través de /sys/class/pwm. El pin STEP tiene
+    que ser uno con PWM (GPIO 12/18 canal 0, 13/19 canal 1) activado con
+    dtoverlay=pwm (o pwm-2chan) en config.txt. Los ficheros de period y
+    duty_cycle se dejan abiertos para que cambiar la frecuencia sean dos escrituras.
+    """
+    def __init__(self, chip=0, canal=0, raiz="/sys/class/pwm"):
+        """
+        :param chip: Número de pwmchip.
+        :param canal: Canal dentro del chip.
+        :param raiz: Raíz del árbol sysfs (o la de crear_sysfs_simulado()).
+        """
+        base = os.path.join(raiz, f"pwmchip{chip}")
+        self.directorio = os.path.join(base, f"pwm{canal}")
+        if not os.path.isdir(self.directorio):
+            with open(os.path.join(base, "export"), "w") as fichero:
+                fichero.write(f"{canal}\n")
+            limite = time.monotonic() + 1.0
+            while not os.path.isdir(self.directorio):  # udev tarda en crear el directorio
+                if time.monotonic() > limite:
+                    raise RuntimeError(f"No se pudo exportar el canal PWM {canal} de pwmchip{chip}.")
+                time.sleep(0.01)
+        self._periodo_fd = os.open(os.path.join(self.directorio, "period"), os.O_WRONLY)
+        self._ciclo_fd = os.open(os.path.join(self.directorio, "duty_cycle"), os.O_WRONLY)
+        self._activo_fd = os.open(os.path.join(self.directorio, "enable"), os.O_WRONLY)
+        self.periodo_ns = int(leer_valor(os.path.join(self.directorio, "period")))
+        self.ciclo_ns = int(leer_valor(os.path.join(self.directorio, "duty_cycle")))
+        self.activo = False
+        self.escrituras = 0
+
+    def _escribir(self, fd, valor):
+        os.pwrite(fd, b"%d\n" % valor, 0)
+        self.escrituras += 1
+
+    def configurar(self, frecuencia, ciclo=0.5):
+        """
+        Cambia la frecuencia manteniendo el ciclo de trabajo. El kernel exige
+        duty_cycle <= period en todo momento, así que el orden de escritura
+        depende de si el periodo sube o baja.
+        :param frecuencia: Frecuencia en Hz (pasos/s).
+        :param ciclo: Fracción del periodo en HIGH.
+        :return: Frecuencia real, con el periodo redondeado a ns.
+        """
+        periodo = max(1, int(round(1e9 / frecuencia)))
+        ciclo_ns = max(1, int(periodo * ciclo))
+        if periodo < self.ciclo_ns:
+            self._escribir(self._ciclo_fd, ciclo_ns)
+            self._escribir(self._periodo_fd, periodo)
+        else:
+            self._escribir(self._periodo_fd, periodo)
+            self._escribir(self._ciclo_fd, ciclo_ns)
+        self.periodo_ns = periodo
+        self.ciclo_ns = ciclo_ns
+        return 1e9 / periodo
+
+    def activar(self):
+        self._escribir(self._activo_fd, 1)
+        self.activo = True
+
+    def desactivar(self):
+        self._escribir(self._activo_fd, 0)
+        self.activo = False
+
+    def cerrar(self):
+        if self.activo:
+            self.desactivar()
+        for fd in (self._periodo_fd, self._ciclo_fd, self._activo_fd):
+            os.close(fd)
+
+
+class MarchaPWM:
+    """
+    Movimiento de un número de pasos con el tren de pulsos generado por el
+    PWM por hardware. Python solo cambia la frecuencia cada
+    periodo_actualizacion durante las rampas (en crucero no hace nada) y
+    cuenta los pasos por tiempo y frecuencia. Al final apaga el PWM en el
+    instante calculado para el último paso (precisión de ±1 paso).
+    """
+    def __init__(self, canal, steps_per_revolution, reloj=time, periodo_actualizacion=0.01):
+        """
+        :param canal: CanalPWM conectado al pin STEP.
+        :param steps_per_revolution: Pasos por revolución.
+        :param reloj: Objeto con perf_counter() y sleep().
+        :param periodo_actualizacion: Tiempo entre cambios de frecuencia en las rampas (s).
+        """
+        self.canal = canal
+        self.steps_per_revolution = steps_per_revolution
+        self.reloj = reloj
+        self.periodo_actualizacion = periodo_actualizacion
+        self.pasos = 0.0
+        self.retraso_max = 0.0
+        self.actualizaciones = 0
+        self.running = False
+
+    def ejecutar(self, pasos_totales, rps, acel, rps_inicial=0.5):
+        """
+        :param pasos_totales: Pasos a dar.
+        :param rps: Velocidad de crucero (rev/s).
+        :param acel: Aceleración de las rampas (rev/s²).
+        :param rps_inicial: Velocidad de arranque y de parada (rev/s).
+        :return: Pasos dados (contados por tiempo y frecuencia).
+        """
+        if acel <= 0:
+            raise ValueError("La aceleración debe ser mayor que 0.")
+        if rps_inicial <= 0 or rps < rps_inicial:
+            raise ValueError("La velocidad inicial debe ser mayor que 0 y no superar la de crucero.")
+        spr = self.steps_per_revolution
+        reloj = self.reloj
+        dt = self.periodo_actualizacion
+        self.pasos = 0.0
+        self.retraso_max = 0.0
+        self.actualizaciones = 0
+        v = rps_inicial
+        frecuencia = self.canal.configurar(v * spr)
+        self.canal.activar()
+        self.running = True
+        t_cambio = reloj.perf_counter()
+        siguiente = t_cambio
+        while self.running:
+            # Pasos dados desde el último cambio, con el tiempo real (la actualización puede llegar tarde)
+            ahora = reloj.perf_counter()
+            self.pasos += frecuencia * (ahora - t_cambio)
+            t_cambio = ahora
+            restantes = pasos_totales - self.pasos
+            # Pasos necesarios para frenar desde v hasta rps_inicial
+            frenada = (v * v - rps_inicial * rps_inicial) / (2 * acel) * spr
+            if restantes <= frenada:
+                v_nueva = max(rps_inicial, v - acel * dt)
+            else:
+                v_nueva = min(rps, v + acel * dt)
+            if v_nueva != v:
+                v = v_nueva
+                frecuencia = self.canal.configurar(v * spr)
+                self.actualizaciones += 1
+            if restantes <= frecuencia * dt:
+                # Último tramo: apagar justo después del último paso
+                self._esperar_hasta(ahora + max(0.0, restantes) / frecuencia)
+                break
+            siguiente += dt
+            self._esperar_hasta(siguiente)
+        self.canal.desactivar()
+        self.pasos += frecuencia * (reloj.perf_counter() - t_cambio)
+        self.running = False
+        return int(round(self.pasos))
+
+    def _esperar_hasta(self, instante):
+        restante = instante - self.reloj.perf_counter()
+        if restante > 0:
+            self.reloj.sleep(restante)
+        retraso = self.reloj.perf_counter() - instante
+        if retraso > self.retraso_max:
+            self.retraso_max = retraso
+
+    def detener(self):
+        self.running = False
+
+
+# Crucero por hardware contra crucero por software: uso de CPU y jitter
+if __name__ == "__main__":
+    import shutil
+    import threading
+    from ejecutor import EjecutorBobinado
+    from plan_continuo import PlanContinuo
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    class GPIONulo:
+        BCM, OUT, LOW, HIGH = 11, 0, 0, 1
+
+        def setmode(self, modo):
+            pass
+
+        def setup(self, pin, modo):
+            pass
+
+        def output(self, canal, valor):
+            pass
+
+    spr, rps, acel, segundos = 200, 30.0, 40.0, 8.0
+
+    # Software: el ejecutor genera cada paso (espera activa por debajo de 200 µs)
+    plan = PlanContinuo(spr, rps, rps_inicial=0.5, acel=acel).iniciar()
+    ejecutor = EjecutorBobinado(Pines(18, 24), Pines(5, 6), gpio=GPIONulo())
+    cpu = time.process_time()
+    inicio = time.perf_counter()
+    threading.Timer(segundos - rps / acel, plan.detener).start()
+    ejecutor.ejecutar_continuo(plan)
+    real = time.perf_counter() - inicio
+    cpu = time.process_time() - cpu
+    print(f"Software: {ejecutor.pasos_husillo} pasos en {real:.2f} s, CPU {cpu / real * 100:.0f}% de un núcleo, "
+          f"retraso máximo de paso {ejecutor.retraso_max * 1e6:.0f} µs")
+
+    # Hardware (árbol sysfs simulado si no hay /sys/class/pwm/pwmchip0)
+    if os.path.isdir("/sys/class/pwm/pwmchip0"):
+        raiz = "/sys/class/pwm"
+    else:
+        raiz = crear_sysfs_simulado()
+        print(f"[INFO] Sin /sys/class/pwm: árbol simulado en {raiz}")
+    canal = CanalPWM(raiz=raiz)
+    marcha = MarchaPWM(canal, spr)
+    pasos = ejecutor.pasos_husillo
+    cpu = time.process_time()
+    inicio = time.perf_counter()
+    dados = marcha.ejecutar(pasos, rps, acel, rps_inicial=0.5)
+    real = time.perf_counter() - inicio
+    cpu = time.process_time() - cpu
+    print(f"Hardware: {dados} pasos en {real:.2f} s, CPU {cpu / real * 100:.1f}% de un núcleo, "
+          f"{marcha.actualizaciones} cambios de frecuencia ({canal.escrituras} escrituras en sysfs), "
+          f"retraso máximo de actualización {marcha.retraso_max * 1e6:.0f} µs")
+    print("  En crucero el tren de pulsos lo genera el periférico PWM: el jitter de los pasos es el de su reloj, "
+          "no el del planificador de Linux.")
+    directorio = os.path.join(raiz, "pwmchip0", "pwm0")
+    print(f"  Estado final del canal: period={leer_valor(os.path.join(directorio, 'period'))} ns, "
+          f"enable={leer_valor(os.path.join(directorio, 'enable'))}")
+    try:
+        marcha.ejecutar(pasos, rps, 0)
+        raise AssertionError("acel=0 debería rechazarse")
+    except ValueError as e:
+        print(f"  Con acel=0: {e}")
+    canal.cerrar()
+    if raiz != "/sys/class/pwm":
+        shutil.rmtree(raiz)
@@ -0,0 +1,194 @@
+import math
+from array import array
+
+
+def rampa_lineal(min_delay, target_delay, steps):
+    """
+    Calcula los delays de una rampa lineal, igual que BipolarMotor.calculate_delays.
+    :param min_delay: Delay inicial (velocidad lenta).
+    :param target_delay: Delay final (velocidad objetivo).
+    :param steps: Número de pasos de la rampa.
+    :return: array('d') con los delays.
+    """
+    delays = array("d")
+    if steps <= 0:
+        return delays
+    if steps == 1:
+        delays.append(target_delay)
+        return delays
+    incremento = (target_delay - min_delay) / (steps - 1)
+    for i in range(steps):
+        delays.append(min_delay + i * incremento)
+    return delays
+
+
+def rampa_aceleracion_constante(min_delay, target_delay, acel, steps_per_revolution):
+    """
+    Calcula los delays de una rampa con aceleración constante (v² crece
+    linealmente con los pasos). Es la rampa más corta para una aceleración máxima dada.
+    :param min_delay: Delay inicial (velocidad lenta).
+    :param target_delay: Delay final (velocidad objetivo).
+    :param acel: Aceleración en rev/s².
+    :param steps_per_revolution: Pasos por revolución.
+    :return: array('d') con los delays.
+    """
+    delays = array("d")
+    v2 = (1 / (min_delay * steps_per_revolution)) ** 2
+    v_objetivo = 1 / (target_delay * steps_per_revolution)
+    incremento = 2 * acel / steps_per_revolution
+    while True:
+        v2 += incremento
+        v = math.sqrt(v2)
+        if v >= v_objetivo:
+            delays.append(target_delay)
+            return delays
+        delays.append(1 / (v * steps_per_revolution))
+
+
+def _rampa_por_progreso(retardo, min_delay, target_delay, steps):
+    """
+    Rampa de steps delays que empieza en min_delay y acaba en target_delay,
+    con retardo(x, min_delay, target_delay) para el progreso x entre 0 y 1.
+    """
+    if steps <= 1:
+        return array("d", [target_delay] * max(steps, 0))
+    ultimo = steps - 1
+    return array("d", [retardo(i / ultimo, min_delay, target_delay) for i in range(steps)])
+
+
+def _cuadratica(x, min_delay, target_delay):
+    return min_delay - x * x * (min_delay - target_delay)
+
+
+# nema_sexto: k = 10 / pasos y punto de inflexión en la mitad; normalizada para empezar y acabar en los extremos
+_SIGMOIDE_0 = 1 / (1 + math.exp(5))
+_SIGMOIDE_ESCALA = 1 / (1 / (1 + math.exp(-5)) - _SIGMOIDE_0)
+
+
+def _sigmoide(x, min_delay, target_delay):
+    progreso = (1 / (1 + math.exp(-10 * (x - 0.5))) - _SIGMOIDE_0) * _SIGMOIDE_ESCALA
+    return min_delay - progreso * (min_delay - target_delay)
+
+
+def rampa_cuadratica(min_delay, target_delay, steps):
+    """
+    Delay que baja con el cuadrado del progreso, como nema_quinto.move_continuous.
+    """
+    return _rampa_por_progreso(_cuadratica, min_delay, target_delay, steps)
+
+
+def rampa_sigmoide(min_delay, target_delay, steps):
+    """
+    Delay con forma de sigmoide, como nema_sexto y StepperMotor.move.
+    """
+    return _rampa_por_progreso(_sigmoide, min_delay, target_delay, steps)
+
+
+def rampa_logaritmica(min_delay, target_delay, steps):
+    """
+    Velocidad (no delay) que sube con log(1 + paso), como StepperMotor.set_speed.
+    """
+    v0 = 1 / min_delay
+    v1 = 1 / target_delay
+    escala = 1 / math.log(steps) if steps > 1 else 0.0
+    return _rampa_por_progreso(lambda x, a, b: 1 / (v0 + math.log(1 + x * (steps - 1)) * escala * (v1 - v0)),
+                               min_delay, target_delay, steps)
+
+
+def rampa_v2_lineal(min_delay, target_delay, steps):
+    """
+    Aceleración constante repartida en steps pasos (v² lineal con el paso):
+    la misma forma que rampa_aceleracion_constante, con la longitud fijada.
+    """
+    a = 1 / (min_delay * min_delay)
+    b = 1 / (target_delay * target_delay) - a
+    return _rampa_por_progreso(lambda x, _, __: 1 / math.sqrt(a + x * b), min_delay, target_delay, steps)
+
+
+# Estrategias de rampa: nombre -> función (min_delay, target_delay, pasos) -> array('d').
+# La receta elige una con "rampa"; la lineal es la de siempre (BipolarMotor y nema_fourth).
+RAMPAS = {
+    "lineal": rampa_lineal,
+    "cuadratica": rampa_cuadratica,
+    "sigmoide": rampa_sigmoide,
+    "logaritmica": rampa_logaritmica,
+    "v2_lineal": rampa_v2_lineal,
+}
+
+
+def registrar_rampa(nombre, funcion):
+    """
+    Añade una estrategia de rampa.
+    :param funcion: Función (min_delay, target_delay, pasos) -> array('d') que empieza
+        en min_delay y acaba en target_delay.
+    """
+    RAMPAS[nombre] = funcion
+
+
+def rampa(nombre, min_delay, target_delay, pasos):
+    """
+    :param nombre: Estrategia registrada en RAMPAS.
+    :return: array('d') con los delays de la rampa.
+    """
+    try:
+        funcion = RAMPAS[nombre]
+    except KeyError:
+        raise ValueError(f"Rampa desconocida: {nombre}. Disponibles: {', '.join(sorted(RAMPAS))}")
+    return funcion(min_delay, target_delay, pasos)
+
+
+def metricas_rampa(delays, steps_per_revolution):
+    """
+    :return: (tiempo hasta la velocidad objetivo en s, aceleración máxima en rev/s²).
+    """
+    acel_max = 0.0
+    anterior = 0.0
+    for delay in delays:
+        v = 1 / (delay * steps_per_revolution)
+        acel = (v - anterior) / delay
+        if acel > acel_max and anterior:
+            acel_max = acel
+        anterior = v
+    return sum(delays), acel_max
+
+
+# Comparación de las rampas del repositorio: tiempo hasta el crucero, aceleración
+# máxima, coste de cálculo por paso y riesgo de perder pasos con el motor simulado
+if __name__ == "__main__":
+    import time
+    from caracterizacion import MotorSimuladoPar
+
+    spr = 200
+    rps = 12.0
+    min_delay = 1 / (spr * 0.25)
+    target_delay = 1 / (spr * rps)
+    pasos = 800
+    motores = {
+        "nominal": MotorSimuladoPar(),
+        "inercia x2": MotorSimuladoPar(inercia=4e-5),
+        "carga x3": MotorSimuladoPar(par_carga=0.09),
+    }
+    print(f"Rampas de {pasos} pasos de 0.25 a {rps} RPS ({spr} pasos/vuelta); motor de caracterizacion.py:")
+    print(f"  {'rampa':22s} {'tiempo':>8s} {'acel. máx':>11s} {'ns/paso':>8s} {'margen par':>10s}  pierde pasos con")
+    resultados = []
+    for nombre in RAMPAS:
+        delays = rampa(nombre, min_delay, target_delay, pasos)
+        repeticiones = 20
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            rampa(nombre, min_delay, target_delay, pasos)
+        ns_paso = (time.perf_counter() - inicio) / (repeticiones * pasos) * 1e9
+        duracion, acel_max = metricas_rampa(delays, spr)
+        margen = motores["nominal"].margen_par(delays)
+        # El crucero sigue medio segundo para ver también si se queda en la velocidad final
+        crucero = array("d", [target_delay]) * int(0.5 / target_delay)
+        fallos = [nombre_motor for nombre_motor, m in motores.items() if m.ejecutar(delays + crucero) is not None]
+        resultados.append((nombre, duracion, fallos))
+        print(f"  {nombre:22s} {duracion:7.3f}s {acel_max:8.1f}/s² {ns_paso:8.0f} {margen * 100:9.0f}%  "
+              f"{', '.join(fallos) or '-'}")
+    seguras = [(duracion, nombre) for nombre, duracion, fallos in resultados if not fallos]
+    if seguras:
+        duracion, nombre = min(seguras)
+        print(f"La más rápida sin perder pasos con ningún motor: {nombre} ({duracion:.3f} s)")
+    else:
+        print("Ninguna rampa de 800 pasos es segura con todos los motores.")
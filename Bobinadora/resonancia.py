@@ -0,0 +1,236 @@
+import json
+import math
+import random
+from array import array
+
+
+def banda_de(bandas, rps):
+    """
+    Devuelve la banda de resonancia que contiene la velocidad, o None.
+    :param bandas: Lista de bandas (rps_min, rps_max).
+    :param rps: Velocidad en revoluciones por segundo.
+    """
+    for banda in bandas:
+        if banda[0] < rps < banda[1]:
+            return banda
+    return None
+
+
+def velocidad_segura(bandas, rps, margen=0.02):
+    """
+    Mueve una velocidad de crucero fuera de las bandas de resonancia, al borde más cercano.
+    :param bandas: Lista de bandas (rps_min, rps_max).
+    :param rps: Velocidad pedida.
+    :param margen: Separación relativa respecto al borde de la banda.
+    :return: Velocidad segura más cercana.
+    """
+    for _ in range(len(bandas) + 1):
+        banda = banda_de(bandas, rps)
+        if banda is None:
+            return rps
+        abajo, arriba = banda[0] * (1 - margen), banda[1] * (1 + margen)
+        rps = abajo if rps - abajo <= arriba - rps else arriba
+    return rps
+
+
+def rampa_evitando_bandas(delays, steps_per_revolution, bandas, acel_cruce):
+    """
+    Modifica una rampa de subida para que atraviese las bandas de resonancia
+    con la aceleración de cruce en vez de la de la rampa. Los pasos de la
+    rampa original que caen dentro de una banda se sustituyen por el cruce.
+    :param delays: Delays de la rampa de subida (velocidad creciente).
+    :param steps_per_revolution: Pasos por revolución.
+    :param bandas: Lista de bandas (rps_min, rps_max).
+    :param acel_cruce: Aceleración al cruzar una banda (rev/s²).
+    :return: array('d') con la nueva rampa.
+    """
+    if acel_cruce <= 0:
+        raise ValueError("La aceleración de cruce debe ser mayor que 0.")
+    resultado = array("d")
+    incremento = 2 * acel_cruce / steps_per_revolution  # Aumento de v² por paso
+    i = 0
+    n = len(delays)
+    v_final = 1 / (delays[-1] * steps_per_revolution) if n else 0.0
+    while i < n:
+        v = 1 / (delays[i] * steps_per_revolution)
+        banda = banda_de(bandas, v)
+        if banda is None:
+            resultado.append(delays[i])
+            i += 1
+            continue
+        # Cruce rápido hasta el borde superior de la banda (sin pasar de la velocidad final,
+        # por si la banda no tiene borde superior), desde el último paso ya dado
+        if resultado:
+            v = 1 / (resultado[-1] * steps_per_revolution)
+        arriba = min(banda[1], v_final)
+        while v < arriba:
+            v = min(arriba, math.sqrt(v * v + incremento))
+            resultado.append(1 / (v * steps_per_revolution))
+        # Saltar los pasos de la rampa original que quedaban dentro de la banda
+        while i < n and 1 / (delays[i] * steps_per_revolution) <= arriba:
+            i += 1
+    return resultado
+
+
+def barrido(probar, rps_min, rps_max, paso):
+    """
+    Busca las bandas de resonancia probando velocidades de crucero crecientes.
+    :param probar: Función (rps, bandas) -> True si el motor pierde pasos a esa velocidad.
+        bandas son las zonas de fallo encontradas hasta ahora (incluida la que está
+        abierta), para que la rampa de la prueba las cruce deprisa.
+    :param rps_min: Velocidad inicial del barrido.
+    :param rps_max: Velocidad final del barrido.
+    :param paso: Incremento de velocidad entre pruebas.
+    :return: (bandas, rps_limite). bandas es la lista (última velocidad buena, siguiente
+        velocidad buena) de las zonas de fallo cerradas. Si el motor sigue fallando al final
+        del barrido, esa zona no es una resonancia sino el límite de velocidad: rps_limite es
+        la última velocidad buena antes de ella (None si no hay zona abierta).
+    """
+    bandas = []
+    ultima_buena = rps_min
+    inicio_fallo = None
+    n = int(round((rps_max - rps_min) / paso))
+    for k in range(n + 1):
+        rps = rps_min + k * paso
+        conocidas = bandas + ([(inicio_fallo, rps)] if inicio_fallo is not None else [])
+        if probar(rps, conocidas):
+            if inicio_fallo is None:
+                inicio_fallo = ultima_buena
+        else:
+            if inicio_fallo is not None:
+                bandas.append((round(inicio_fallo, 6), round(rps, 6)))
+                inicio_fallo = None
+            ultima_buena = rps
+    rps_limite = round(inicio_fallo, 6) if inicio_fallo is not None else None
+    return bandas, rps_limite
+
+
+class MapaResonancia:
+    """
+    Bandas de resonancia por motor y resolución de microstepping. Se pueden
+    medir con barrido() o escribir a mano en el fichero JSON.
+    """
+    def __init__(self, bandas=None):
+        """
+        :param bandas: Diccionario clave -> lista de bandas (rps_min, rps_max).
+        """
+        self.bandas = bandas or {}
+
+    @staticmethod
+    def clave(motor, microsteps):
+        return f"{motor}/{microsteps}"
+
+    def bandas_de(self, motor, microsteps):
+        return self.bandas.get(self.clave(motor, microsteps), [])
+
+    def agregar_banda(self, motor, microsteps, rps_min, rps_max):
+        """
+        Añade una banda, uniéndola con las que se solapen.
+        """
+        bandas = self.bandas_de(motor, microsteps) + [(rps_min, rps_max)]
+        bandas.sort()
+        unidas = [bandas[0]]
+        for a, b in bandas[1:]:
+            if a <= unidas[-1][1]:
+                unidas[-1] = (unidas[-1][0], max(unidas[-1][1], b))
+            else:
+                unidas.append((a, b))
+        self.bandas[self.clave(motor, microsteps)] = unidas
+
+    def velocidad_segura(self, motor, microsteps, rps):
+        return velocidad_segura(self.bandas_de(motor, microsteps), rps)
+
+    def guardar(self, ruta):
+        with open(ruta, "w") as fichero:
+            datos = {clave: [list(b) for b in bandas] for clave, bandas in self.bandas.items()}
+            json.dump(datos, fichero, indent=2, allow_nan=False)  # JSON estándar, sin Infinity
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta) as fichero:
+            datos = json.load(fichero)
+        return cls({clave: [tuple(b) for b in bandas] for clave, bandas in datos.items()})
+
+
+class MotorSimuladoResonancia:
+    """
+    Motor simulado con par reducido en unas bandas de velocidad. Si el motor
+    permanece dentro de una banda más de t_critico seguidos, la oscilación
+    crece hasta que pierde pasos. Por encima de rps_max pierde pasos siempre.
+    """
+    def __init__(self, steps_per_revolution, bandas, t_critico=0.05, rps_max=25.0):
+        """
+        :param steps_per_revolution: Pasos (o micropasos) por revolución.
+        :param bandas: Lista de bandas (rps_min, rps_max) con par reducido.
+        :param t_critico: Tiempo máximo seguido dentro de una banda (s).
+        :param rps_max: Velocidad a partir de la cual el par no alcanza.
+        """
+        self.steps_per_revolution = steps_per_revolution
+        self.bandas = bandas
+        self.t_critico = t_critico
+        self.rps_max = rps_max
+
+    def ejecutar(self, intervalos):
+        """
+        Recorre una secuencia de intervalos entre pasos.
+        :return: Índice del paso en que se pierde el sincronismo, o None si no se pierde.
+        """
+        en_banda = 0.0
+        for i, intervalo in enumerate(intervalos):
+            rps = 1 / (intervalo * self.steps_per_revolution)
+            if rps > self.rps_max:
+                return i
+            if banda_de(self.bandas, rps) is not None:
+                en_banda += intervalo
+                if en_banda > self.t_critico:
+                    return i
+            else:
+                en_banda = 0.0
+        return None
+
+    def probar(self, rps, bandas=None, duracion=0.5):
+        """
+        Prueba de crucero para el barrido (sin rampa): True si pierde pasos.
+        """
+        intervalo = 1 / (rps * self.steps_per_revolution)
+        pasos = int(duracion / intervalo)
+        return self.ejecutar(array("d", [intervalo]) * pasos) is not None
+
+
+# Validación con un motor simulado con par reducido en dos bandas
+if __name__ == "__main__":
+    import planificador
+
+    spr = 200 * 16  # NEMA17 con 1/16 de micropaso, como nema_sexto
+    reales = [(3.6, 4.4), (7.2, 7.9)]
+    simulado = MotorSimuladoResonancia(spr, reales, rps_max=20.0)
+
+    mapa = MapaResonancia()
+    medidas, rps_limite = barrido(simulado.probar, 0.5, 22.0, 0.1)
+    for a, b in medidas:
+        mapa.agregar_banda("nema17", 16, a, b)
+    bandas = mapa.bandas_de("nema17", 16)
+    print(f"Bandas medidas: {bandas}, velocidad máxima {rps_limite} RPS")
+
+    motor_sin_mapa = {"steps_per_revolution": spr}
+    motor_con_mapa = {"steps_per_revolution": spr, "resonancias": [list(b) for b in bandas], "acel_cruce": 200.0}
+
+    aleatorio = random.Random(3)
+    objetivos = [round(aleatorio.uniform(1.0, 19.0), 2) for _ in range(200)]
+    for nombre, motor in [("rampa lineal", motor_sin_mapa), ("rampa con mapa", motor_con_mapa)]:
+        perdidas = 0
+        cruceros = []
+        for rps in objetivos:
+            receta = {"vueltas": 20, "rps": rps, "rps_inicial": 0.5, "pasos_rampa": 3200}
+            plan = planificador.compilar_plan(receta, motor)
+            if simulado.ejecutar(plan.husillo) is not None:
+                perdidas += 1
+            else:
+                cruceros.append(1 / (min(plan.husillo) * spr))
+        media = sum(cruceros) / len(cruceros) if cruceros else 0.0
+        print(f"{nombre}: {perdidas}/{len(objetivos)} bobinados con pérdida de pasos, "
+              f"crucero medio de los buenos {media:.2f} RPS")
+
+    # El crucero pedido dentro de una banda se mueve al borde más cercano
+    for rps in (4.1, 7.3, 10.0):
+        print(f"Crucero pedido {rps} RPS -> {mapa.velocidad_segura('nema17', 16, rps):.2f} RPS")
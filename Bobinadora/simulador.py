@@ -0,0 +1,466 @@
+import heapq
+import importlib.util
+import math
+import os
+import sys
+import time
+import types
+
+
+class RelojVirtual:
+    """
+    Reloj de simulación por eventos discretos. Sustituye al módulo time en
+    las clases de motor: sleep() no espera, avanza el tiempo virtual y
+    ejecuta los eventos programados que vencen por el camino. El tiempo se
+    guarda en nanosegundos enteros para que las trazas sean exactas y la
+    simulación sea determinista.
+    Solo un hilo debe dormir sobre el reloj a la vez.
+    """
+    virtual = True
+
+    def __init__(self, inicio=0.0):
+        """
+        :param inicio: Instante inicial (s).
+        """
+        self.t_ns = int(round(inicio * 1e9))
+        self.eventos = []
+        self._secuencia = 0
+
+    def time(self):
+        return self.t_ns / 1e9
+
+    perf_counter = time
+    monotonic = time
+
+    def time_ns(self):
+        return self.t_ns
+
+    perf_counter_ns = time_ns
+    monotonic_ns = time_ns
+
+    def sleep(self, segundos):
+        if segundos < 0:
+            raise ValueError("sleep length must be non-negative")
+        destino = self.t_ns + int(segundos * 1e9 + 0.5)
+        eventos = self.eventos
+        while eventos and eventos[0][0] <= destino:
+            instante, _, funcion = heapq.heappop(eventos)
+            if instante > self.t_ns:
+                self.t_ns = instante
+            funcion()
+        if destino > self.t_ns:
+            self.t_ns = destino
+
+    def avanzar_ns(self, nanosegundos):
+        """
+        Avanza el reloj sin ejecutar eventos (coste de una llamada a GPIO, por ejemplo).
+        """
+        self.t_ns += nanosegundos
+
+    def programar(self, instante, funcion):
+        """
+        Programa una función para un instante absoluto del tiempo virtual.
+        Se ejecuta dentro del sleep() que cruce ese instante; si lanza una
+        excepción (KeyboardInterrupt para parar un bucle infinito, por ejemplo)
+        sale por ese sleep().
+        :param instante: Instante en segundos.
+        :param funcion: Función sin argumentos.
+        """
+        self._secuencia += 1
+        heapq.heappush(self.eventos, (int(round(instante * 1e9)), self._secuencia, funcion))
+
+    def programar_dentro_de(self, segundos, funcion):
+        self.programar(self.time() + segundos, funcion)
+
+    def __getattr__(self, nombre):
+        # strftime, localtime... se toman del módulo time real
+        return getattr(time, nombre)
+
+
+class GPIOVirtual:
+    """
+    Sustituto de RPi.GPIO con los mismos nombres y constantes. Guarda el
+    nivel de cada pin y avisa a los observadores (modelos de eje) en cada
+    cambio con el instante del reloj virtual.
+    """
+    BOARD, BCM = 10, 11
+    OUT, IN = 0, 1
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self, reloj, coste_ns=0, traza=False):
+        """
+        :param reloj: RelojVirtual que da el instante de cada flanco.
+        :param coste_ns: Tiempo virtual que consume cada llamada a output() (ns).
+        :param traza: Si es True, guarda todos los flancos en self.flancos como (t_ns, pin, nivel).
+        """
+        self.reloj = reloj
+        self.coste_ns = coste_ns
+        self.modo = None
+        self.modos = {}
+        self.niveles = {}
+        self.observadores = {}
+        self.detecciones = {}
+        self.detectados = set()
+        self.cambios = 0
+        self.flancos = [] if traza else None
+
+    def setmode(self, modo):
+        self.modo = modo
+
+    def getmode(self):
+        return self.modo
+
+    def setwarnings(self, activar):
+        pass
+
+    def setup(self, canal, modo, pull_up_down=PUD_OFF, initial=-1):
+        if self.modo is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)")
+        for pin in canal if isinstance(canal, (list, tuple)) else (canal,):
+            self.modos[pin] = modo
+            if modo == self.IN:
+                self.niveles[pin] = 1 if pull_up_down == self.PUD_UP else 0
+            elif initial != -1:
+                self._cambiar(pin, 1 if initial else 0)
+            else:
+                self.niveles.setdefault(pin, 0)
+
+    def output(self, canal, valor):
+        if isinstance(canal, (list, tuple)):
+            valores = valor if isinstance(valor, (list, tuple)) else [valor] * len(canal)
+            for pin, v in zip(canal, valores):
+                self.output(pin, v)
+            return
+        if self.modos.get(canal) != self.OUT:
+            raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+        nivel = 1 if valor else 0
+        if self.niveles.get(canal) != nivel:
+            self._cambiar(canal, nivel)
+        if self.coste_ns:
+            self.reloj.t_ns += self.coste_ns
+
+    def _cambiar(self, pin, nivel):
+        self.niveles[pin] = nivel
+        self.cambios += 1
+        t_ns = self.reloj.t_ns
+        if self.flancos is not None:
+            self.flancos.append((t_ns, pin, nivel))
+        for funcion in self.observadores.get(pin, ()):
+            funcion(pin, nivel, t_ns)
+        deteccion = self.detecciones.get(pin)
+        if deteccion is not None:
+            flanco, callbacks = deteccion
+            if flanco == self.BOTH or (flanco == self.RISING) == (nivel == 1):
+                self.detectados.add(pin)
+                for callback in callbacks:
+                    callback(pin)
+
+    def input(self, pin):
+        if pin not in self.modos:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        return self.niveles.get(pin, 0)
+
+    def cleanup(self, canal=None):
+        pines = list(self.modos) if canal is None else (canal if isinstance(canal, (list, tuple)) else [canal])
+        for pin in pines:
+            self.modos.pop(pin, None)
+            self.detecciones.pop(pin, None)
+
+    def add_event_detect(self, pin, flanco, callback=None, bouncetime=None):
+        if pin in self.detecciones:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self.detecciones[pin] = (flanco, [callback] if callback else [])
+
+    def add_event_callback(self, pin, callback):
+        self.detecciones[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        self.detecciones.pop(pin, None)
+
+    def event_detected(self, pin):
+        if pin in self.detectados:
+            self.detectados.discard(pin)
+            return True
+        return False
+
+    # Extensiones de la simulación
+    def observar(self, pin, funcion):
+        """
+        Registra funcion(pin, nivel, t_ns) para cada cambio de nivel del pin.
+        """
+        self.observadores.setdefault(pin, []).append(funcion)
+
+    def forzar_entrada(self, pin, nivel):
+        """
+        Cambia el nivel de una entrada desde fuera (un pulsador o un final de carrera).
+        """
+        if self.niveles.get(pin) != nivel:
+            self._cambiar(pin, nivel)
+
+    class PWM:
+        def __init__(self, pin, frecuencia):
+            self.pin = pin
+            self.frecuencia = frecuencia
+            self.ciclo = 0.0
+
+        def start(self, ciclo):
+            self.ciclo = ciclo
+
+        def ChangeDutyCycle(self, ciclo):
+            self.ciclo = ciclo
+
+        def ChangeFrequency(self, frecuencia):
+            self.frecuencia = frecuencia
+
+        def stop(self):
+            self.ciclo = 0.0
+
+
+class EjeStepDir:
+    """
+    Modelo de un motor bipolar con driver STEP/DIR (A4988/DRV8825). Cada
+    flanco de subida de STEP avanza el traductor del driver según la
+    resolución de los pines MS y el sentido de DIR. La posición se guarda
+    en 1/16 de paso, así que la fase eléctrica es exacta al mezclar
+    resoluciones (un ciclo eléctrico son 4 pasos completos = 64 dieciseisavos).
+    """
+    # Resolución según (MS1, MS2, MS3), tabla del A4988
+    RESOLUCIONES = {(0, 0, 0): 1, (1, 0, 0): 2, (0, 1, 0): 4, (1, 1, 0): 8, (1, 1, 1): 16}
+
+    def __init__(self, gpio, step_pin, dir_pin, ms_pins=None, steps_per_revolution=200, dir_positivo=1,
+                 mm_por_vuelta=None, nombre="eje"):
+        """
+        :param gpio: GPIOVirtual al que está conectado.
+        :param ms_pins: Pines (MS1, MS2, MS3), o None si la resolución es fija a paso completo.
+        :param steps_per_revolution: Pasos completos por vuelta del motor.
+        :param dir_positivo: Nivel de DIR que hace avanzar la posición.
+        :param mm_por_vuelta: Avance lineal por vuelta (guiado), si aplica.
+        """
+        self.gpio = gpio
+        self.step_pin = step_pin
+        self.dir_pin = dir_pin
+        self.ms_pins = ms_pins
+        self.steps_per_revolution = steps_per_revolution
+        self.dir_positivo = dir_positivo
+        self.mm_por_vuelta = mm_por_vuelta
+        self.nombre = nombre
+        self.posicion_16 = 0
+        self.pulsos = 0
+        self.inversiones = 0
+        self.ultimo_sentido = 0
+        self.ultimo_paso_ns = None
+        self.intervalo_min_ns = None
+        gpio.observar(step_pin, self._flanco)
+
+    def resolucion(self):
+        if self.ms_pins is None:
+            return 1
+        niveles = self.gpio.niveles
+        clave = tuple(niveles.get(pin, 0) for pin in self.ms_pins)
+        if clave not in self.RESOLUCIONES:
+            raise RuntimeError(f"[{self.nombre}] Combinación MS no válida: {clave}")
+        return self.RESOLUCIONES[clave]
+
+    def _flanco(self, pin, nivel, t_ns):
+        if not nivel:
+            return
+        sentido = 1 if self.gpio.niveles.get(self.dir_pin, 0) == self.dir_positivo else -1
+        if sentido != self.ultimo_sentido:
+            if self.ultimo_sentido:
+                self.inversiones += 1
+            self.ultimo_sentido = sentido
+        self.posicion_16 += sentido * (16 // self.resolucion())
+        self.pulsos += 1
+        if self.ultimo_paso_ns is not None:
+            intervalo = t_ns - self.ultimo_paso_ns
+            if self.intervalo_min_ns is None or intervalo < self.intervalo_min_ns:
+                self.intervalo_min_ns = intervalo
+        self.ultimo_paso_ns = t_ns
+
+    @property
+    def vueltas(self):
+        return self.posicion_16 / (16 * self.steps_per_revolution)
+
+    @property
+    def posicion_mm(self):
+        return self.vueltas * self.mm_por_vuelta if self.mm_por_vuelta else None
+
+    def fase_electrica(self):
+        """
+        Devuelve el ángulo eléctrico (grados) y las corrientes relativas de las bobinas A y B.
+        """
+        fase = self.posicion_16 % 64
+        angulo = fase * 2 * math.pi / 64
+        return fase * 360 / 64, round(math.cos(angulo), 4), round(math.sin(angulo), 4)
+
+
+class MotorUnipolarVirtual:
+    """
+    Modelo del 28BYJ-48 con ULN2003 (Stepper_Motor). Decodifica el patrón
+    de las cuatro bobinas en la secuencia de medio paso de 8 estados; el
+    avance es la diferencia de fase entre dos patrones válidos consecutivos.
+    Un salto de media vuelta eléctrica (4 estados) es ambiguo y se cuenta
+    como paso perdido.
+    """
+    SECUENCIA = [(1, 0, 0, 0), (1, 1, 0, 0), (0, 1, 0, 0), (0, 1, 1, 0),
+                 (0, 0, 1, 0), (0, 0, 1, 1), (0, 0, 0, 1), (1, 0, 0, 1)]
+
+    def __init__(self, gpio, pins, steps_per_revolution=2048, nombre="28byj48"):
+        """
+        :param pins: Los cuatro pines de las bobinas, en el orden de la secuencia.
+        :param steps_per_revolution: Estados de la secuencia por vuelta del eje de salida.
+        """
+        self.gpio = gpio
+        self.pins = list(pins)
+        self.steps_per_revolution = steps_per_revolution
+        self.nombre = nombre
+        self.indices = {patron: i for i, patron in enumerate(self.SECUENCIA)}
+        self.fase = None
+        self.posicion = 0
+        self.perdidos = 0
+        for pin in self.pins:
+            gpio.observar(pin, self._flanco)
+
+    def _flanco(self, pin, nivel, t_ns):
+        niveles = self.gpio.niveles
+        indice = self.indices.get(tuple(niveles.get(p, 0) for p in self.pins))
+        if indice is None:
+            return  # Patrón intermedio o bobinas apagadas: el rotor no cambia
+        if self.fase is not None:
+            delta = (indice - self.fase) % 8
+            if delta == 4:
+                self.perdidos += 1
+            elif delta:
+                self.posicion += delta if delta < 4 else delta - 8
+        self.fase = indice
+
+    @property
+    def vueltas(self):
+        return self.posicion / self.steps_per_revolution
+
+
+class _ModuloSMBus(types.ModuleType):
+    """
+    smbus vacío para que las clases que importan la LCD se puedan cargar.
+    """
+    class SMBus:
+        def __init__(self, bus_id=1):
+            pass
+
+        def write_byte(self, direccion, valor):
+            pass
+
+
+def instalar(reloj=None, gpio=None):
+    """
+    Registra el GPIO virtual como RPi.GPIO (y un smbus vacío) en sys.modules,
+    para que los módulos del repositorio se importen sin la Raspberry.
+    :return: (reloj, gpio).
+    """
+    reloj = reloj or RelojVirtual()
+    gpio = gpio or GPIOVirtual(reloj)
+    paquete = types.ModuleType("RPi")
+    paquete.GPIO = gpio
+    sys.modules["RPi"] = paquete
+    sys.modules["RPi.GPIO"] = gpio
+    sys.modules.setdefault("smbus", _ModuloSMBus("smbus"))
+    return reloj, gpio
+
+
+def cargar_script(ruta, reloj, gpio, nombre=None):
+    """
+    Carga un script del repositorio (sin ejecutar su bloque __main__) con el
+    reloj y el GPIO virtuales inyectados en sus variables globales time y GPIO.
+    :param ruta: Ruta del fichero .py.
+    :param nombre: Nombre del módulo (por defecto, el del fichero con prefijo 'sim_').
+    :return: Módulo cargado.
+    """
+    instalar(reloj, gpio)
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    clases = os.path.join(carpeta, "..", "Clases")
+    for directorio in (carpeta, clases):
+        if directorio not in sys.path:
+            sys.path.insert(0, directorio)
+    nombre = nombre or "sim_" + os.path.splitext(os.path.basename(ruta))[0]
+    especificacion = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(especificacion)
+    especificacion.loader.exec_module(modulo)
+    modulo.time = reloj
+    modulo.GPIO = gpio
+    return modulo
+
+
+# Bobinado de 2 horas simulado con el ejecutor real y clases del repositorio con el reloj virtual
+if __name__ == "__main__":
+    import planificador
+    from ejecutor import EjecutorBobinado
+
+    class Pines:
+        def __init__(self, step_pin, dir_pin):
+            self.step_pin = step_pin
+            self.dir_pin = dir_pin
+
+    raiz = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+    # 1. Bobina completa: 14400 vueltas a 2 RPS, 2 horas de máquina
+    receta = {"vueltas": 14400, "rps": 2.0, "espiras_por_capa": 120, "pasos_traverse_por_vuelta": 8}
+    plan = planificador.compilar_plan(receta, {"steps_per_revolution": 200})
+    reloj = RelojVirtual()
+    gpio = GPIOVirtual(reloj)
+    husillo = EjeStepDir(gpio, 23, 24, nombre="husillo")
+    traverse = EjeStepDir(gpio, 5, 6, steps_per_revolution=200, mm_por_vuelta=2.0, nombre="guiado")
+
+    # Comprobación de cada flanco contra el instante exacto del plan
+    esperado = [0.0, 0]
+    error_max = [0]
+
+    def comprobar(pin, nivel, t_ns):
+        if nivel:
+            esperado[0] += plan.husillo[esperado[1]]
+            esperado[1] += 1
+            error_max[0] = max(error_max[0], abs(t_ns - round(esperado[0] * 1e9)))
+
+    gpio.observar(23, comprobar)
+    ejecutor = EjecutorBobinado(Pines(23, 24), Pines(5, 6), gpio=gpio, reloj=reloj)
+    inicio = time.perf_counter()
+    duracion = ejecutor.ejecutar(plan)
+    real = time.perf_counter() - inicio
+    print(f"Bobina de {receta['vueltas']} vueltas: {duracion / 3600:.2f} h de máquina simuladas en {real:.1f} s "
+          f"(x{duracion / real:.0f})")
+    print(f"  husillo {husillo.vueltas:.3f} vueltas, guiado {traverse.pulsos} pasos en {ejecutor.capa} capas, "
+          f"posición final {traverse.posicion_mm:.3f} mm, error máximo de flanco {error_max[0]} ns")
+    print(f"  fase eléctrica del husillo al terminar: {husillo.fase_electrica()}")
+
+    # 2. Clases del repositorio con el reloj virtual inyectado
+    reloj, gpio = instalar(RelojVirtual(), None)
+    bipolar = cargar_script(os.path.join(raiz, "StepperMotor_bipolar", "BipolarMotor.py"), reloj, gpio)
+    motor = bipolar.StepperMotor(23, 24, 200, 5.0)
+    eje = EjeStepDir(gpio, 23, 24, nombre="BipolarMotor")
+    reloj.programar(60.0, motor.stop)
+    inicio = time.perf_counter()
+    motor.move("fw", 5.0)
+    print(f"BipolarMotor.move 60 s a 5 RPS: {eje.vueltas:.2f} vueltas, {motor.state_changes} pasos "
+          f"en {time.perf_counter() - inicio:.2f} s reales")
+
+    reloj, gpio = instalar(RelojVirtual(), None)
+    sexto = cargar_script(os.path.join(raiz, "StepperMotor_bipolar", "nema_sexto.py"), reloj, gpio)
+    nema = sexto.Nema17Motor(17, 27, 22, 10, 9)
+    eje = EjeStepDir(gpio, 17, 27, ms_pins=(22, 10, 9), nombre="nema_sexto")
+
+    def interrumpir():
+        raise KeyboardInterrupt
+
+    reloj.programar(30.0, interrumpir)
+    nema.move_continuous(direction=True, target_rps=2, acceleration_steps=4000)
+    print(f"nema_sexto.move_continuous 30 s: {nema.state_changes} pulsos = {eje.vueltas:.3f} vueltas reales "
+          f"(microstepping dinámico), fase {eje.fase_electrica()[0]:.1f}°")
+
+    reloj, gpio = instalar(RelojVirtual(), None)
+    unipolar = cargar_script(os.path.join(raiz, "Stepper_Motor", "StepperMotor.py"), reloj, gpio)
+    pasos = unipolar.StepperMotor([4, 17, 27, 22], unipolar.StepperSequences(), speed=0.25)
+    rotor = MotorUnipolarVirtual(gpio, [4, 17, 27, 22])
+    pasos.move("forward", 20)
+    print(f"StepperMotor (28BYJ-48) 20 s: {pasos.state_changes} estados, rotor {rotor.vueltas:.3f} vueltas, "
+          f"{rotor.perdidos} pasos ambiguos, t virtual {reloj.time():.2f} s")
@@ -0,0 +1,335 @@
+import math
+import random
+import time
+from threading import Thread
+
+
+class SensorHX711:
+    """
+    Lee una célula de carga a través de un ADC HX711 (protocolo por bit-banging).
+    Con el pin RATE a nivel alto el HX711 entrega 80 muestras por segundo.
+    """
+    def __init__(self, dout_pin, sck_pin, escala=1.0, tara=0, gpio=None):
+        """
+        :param dout_pin: Pin GPIO conectado a DOUT del HX711.
+        :param sck_pin: Pin GPIO conectado a PD_SCK del HX711.
+        :param escala: Cuentas del ADC por gramo.
+        :param tara: Lectura cruda con el hilo sin tensión.
+        :param gpio: Módulo GPIO a usar (por defecto RPi.GPIO).
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.dout_pin = dout_pin
+        self.sck_pin = sck_pin
+        self.escala = escala
+        self.tara = tara
+
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.sck_pin, self.gpio.OUT)
+        self.gpio.setup(self.dout_pin, self.gpio.IN)
+        self.gpio.output(self.sck_pin, self.gpio.LOW)
+
+    def listo(self):
+        """
+        El HX711 baja DOUT cuando tiene una conversión disponible.
+        """
+        return self.gpio.input(self.dout_pin) == 0
+
+    def leer_crudo(self):
+        """
+        Lee los 24 bits de la conversión (canal A, ganancia 128).
+        :return: Valor con signo del ADC, o None si no hay conversión lista.
+        """
+        if not self.listo():
+            return None
+        valor = 0
+        for _ in range(24):
+            self.gpio.output(self.sck_pin, self.gpio.HIGH)
+            valor = (valor << 1) | self.gpio.input(self.dout_pin)
+            self.gpio.output(self.sck_pin, self.gpio.LOW)
+        # Pulso 25: selecciona canal A con ganancia 128 para la siguiente conversión
+        self.gpio.output(self.sck_pin, self.gpio.HIGH)
+        self.gpio.output(self.sck_pin, self.gpio.LOW)
+        if valor & 0x800000:
+            valor -= 0x1000000  # Complemento a dos
+        return valor
+
+    def calibrar_tara(self, muestras=10):
+        """
+        Toma la lectura actual como cero de tensión.
+        """
+        lecturas = []
+        while len(lecturas) < muestras:
+            valor = self.leer_crudo()
+            if valor is not None:
+                lecturas.append(valor)
+        self.tara = sum(lecturas) / len(lecturas)
+
+    def leer(self):
+        """
+        Devuelve la tensión del hilo en gramos, o None si no hay lectura nueva.
+        """
+        valor = self.leer_crudo()
+        if valor is None:
+            return None
+        return (valor - self.tara) / self.escala
+
+
+class SensorPotenciometro:
+    """
+    Lee la posición del brazo compensador (dancer) con un potenciómetro
+    conectado a un ADC MCP3008 por SPI. Permite muestrear a varios kHz.
+    """
+    def __init__(self, canal, gramos_por_cuenta, cuenta_reposo=0, bus=0, dispositivo=0, spi=None):
+        """
+        :param canal: Canal del MCP3008 (0-7).
+        :param gramos_por_cuenta: Tensión del hilo por cada cuenta del ADC (rigidez del muelle).
+        :param cuenta_reposo: Lectura del ADC con el hilo sin tensión.
+        :param bus: Bus SPI.
+        :param dispositivo: Chip select del bus SPI.
+        :param spi: Objeto spidev ya abierto (por defecto se abre uno).
+        """
+        if spi is None:
+            import spidev
+            spi = spidev.SpiDev()
+            spi.open(bus, dispositivo)
+            spi.max_speed_hz = 1350000
+        self.spi = spi
+        self.canal = canal
+        self.gramos_por_cuenta = gramos_por_cuenta
+        self.cuenta_reposo = cuenta_reposo
+
+    def leer_crudo(self):
+        """
+        Lee el valor de 10 bits del canal configurado.
+        """
+        respuesta = self.spi.xfer2([1, (8 + self.canal) << 4, 0])
+        return ((respuesta[1] & 3) << 8) | respuesta[2]
+
+    def leer(self):
+        """
+        Devuelve la tensión del hilo en gramos.
+        """
+        return (self.leer_crudo() - self.cuenta_reposo) * self.gramos_por_cuenta
+
+
+class ModeloTensionSimulado:
+    """
+    Modelo simulado de la tensión del hilo. La tensión sube con la velocidad
+    (rozamiento) y con la aceleración (inercia de la bobina de origen), y
+    aparecen tirones aleatorios cuando el hilo se engancha.
+    """
+    def __init__(self, base=15.0, k_velocidad=1.2, k_aceleracion=1.5, constante_tiempo=0.02,
+                 tirones_por_minuto=6, amplitud_tiron=20.0, duracion_tiron=0.3, semilla=1):
+        """
+        :param base: Tensión con el husillo parado (g).
+        :param k_velocidad: Gramos por cada rev/s.
+        :param k_aceleracion: Gramos por cada rev/s².
+        :param constante_tiempo: Retardo de primer orden de la tensión (s).
+        :param tirones_por_minuto: Frecuencia media de enganchones del hilo.
+        :param amplitud_tiron: Tensión extra durante un enganchón (g).
+        :param duracion_tiron: Duración de un enganchón (s).
+        :param semilla: Semilla del generador aleatorio (simulación reproducible).
+        """
+        self.base = base
+        self.k_velocidad = k_velocidad
+        self.k_aceleracion = k_aceleracion
+        self.constante_tiempo = constante_tiempo
+        self.tirones_por_minuto = tirones_por_minuto
+        self.amplitud_tiron = amplitud_tiron
+        self.duracion_tiron = duracion_tiron
+        self.aleatorio = random.Random(semilla)
+        self.tension = base
+        self.rps = 0.0
+        self.fin_tiron = 0.0
+        self.tiempo = 0.0
+
+    def actualizar(self, rps, dt):
+        """
+        Avanza el modelo dt segundos con el husillo girando a rps.
+        :return: Tensión actual (g).
+        """
+        aceleracion = (rps - self.rps) / dt
+        self.rps = rps
+        self.tiempo += dt
+
+        if self.aleatorio.random() < self.tirones_por_minuto * dt / 60:
+            self.fin_tiron = self.tiempo + self.duracion_tiron
+        tiron = self.amplitud_tiron if self.tiempo < self.fin_tiron else 0.0
+
+        objetivo = self.base + self.k_velocidad * rps + self.k_aceleracion * aceleracion + tiron
+        alfa = 1 - math.exp(-dt / self.constante_tiempo)
+        self.tension += alfa * (objetivo - self.tension)
+        return self.tension
+
+    def leer(self):
+        """
+        Misma interfaz que los sensores reales.
+        """
+        return self.tension
+
+
+class GobernadorTension:
+    """
+    Limita la velocidad y la aceleración del husillo según la tensión medida
+    del hilo. Por debajo de la tensión objetivo acelera con la aceleración
+    máxima; entre la objetivo y la máxima pasa proporcionalmente de la
+    aceleración máxima a la deceleración máxima (frena antes de llegar a la
+    máxima, porque la tensión va con retraso). Entre lecturas del sensor
+    (el HX711 da una cada 12,5 ms) se usa la última tensión medida y no se
+    acelera: solo se mantiene la velocidad o se frena.
+    """
+    def __init__(self, tension_max, tension_objetivo=None, rps_max=30.0, acel_max=10.0, decel_max=40.0):
+        """
+        :param tension_max: Tensión que no se debe superar (g).
+        :param tension_objetivo: Tensión a partir de la que se deja de acelerar a fondo (g).
+        :param rps_max: Velocidad máxima del husillo (rev/s).
+        :param acel_max: Aceleración máxima (rev/s²).
+        :param decel_max: Deceleración máxima (rev/s²).
+        """
+        self.tension_max = tension_max
+        self.tension_objetivo = tension_objetivo if tension_objetivo is not None else 0.8 * tension_max
+        self.rps_max = rps_max
+        self.acel_max = acel_max
+        self.decel_max = decel_max
+        self.rps = 0.0
+        self.tension = None  # Última lectura válida
+        self.running = False
+
+    def limitar(self, rps_pedida, tension, dt):
+        """
+        Calcula la velocidad a aplicar en este ciclo.
+        :param rps_pedida: Velocidad que pide el operador o la receta.
+        :param tension: Última tensión medida (g). None si no hay lectura nueva.
+        :param dt: Tiempo desde el ciclo anterior (s).
+        :return: Velocidad permitida (rev/s).
+        """
+        objetivo = min(rps_pedida, self.rps_max)
+
+        nueva = tension is not None
+        if nueva:
+            self.tension = tension
+        else:
+            tension = self.tension
+        if tension is None:
+            acel = 0.0  # Sin ninguna lectura todavía no se acelera
+        elif tension >= self.tension_max:
+            acel = -self.decel_max
+        elif tension > self.tension_objetivo:
+            margen = (self.tension_max - tension) / (self.tension_max - self.tension_objetivo)
+            acel = margen * (self.acel_max + self.decel_max) - self.decel_max
+        else:
+            acel = self.acel_max
+        if not nueva and acel > 0:
+            acel = 0.0  # Sin lectura nueva solo se mantiene o se frena
+
+        if self.rps > objetivo:
+            self.rps = max(objetivo, self.rps - self.decel_max * dt)
+        elif acel < 0:
+            self.rps = max(0.0, self.rps + acel * dt)
+        else:
+            self.rps = min(objetivo, self.rps + acel * dt)
+        return self.rps
+
+    def ejecutar(self, sensor, rps_pedida, aplicar_rps, periodo=0.001):
+        """
+        Bucle del gobernador: lee el sensor y aplica la velocidad permitida.
+        :param sensor: Objeto con método leer() que devuelve la tensión.
+        :param rps_pedida: Función sin argumentos que devuelve la velocidad pedida.
+        :param aplicar_rps: Función que recibe la velocidad a aplicar al husillo.
+        :param periodo: Periodo de muestreo (s).
+        """
+        self.running = True
+        anterior = time.perf_counter()
+        siguiente = anterior + periodo
+        while self.running:
+            ahora = time.perf_counter()
+            rps = self.limitar(rps_pedida(), sensor.leer(), ahora - anterior)
+            aplicar_rps(rps)
+            anterior = ahora
+            restante = siguiente - time.perf_counter()
+            if restante > 0:
+                time.sleep(restante)
+            siguiente += periodo
+
+    def iniciar(self, sensor, rps_pedida, aplicar_rps, periodo=0.001):
+        """
+        Inicia el bucle del gobernador en un hilo separado.
+        """
+        self.hilo = Thread(target=self.ejecutar, args=(sensor, rps_pedida, aplicar_rps, periodo))
+        self.hilo.daemon = True
+        self.hilo.start()
+
+    def detener(self):
+        self.running = False
+        if hasattr(self, 'hilo') and self.hilo.is_alive():
+            self.hilo.join()
+
+
+def simular_bobinado(vueltas, modelo, velocidad, dt=0.001):
+    """
+    Simula un bobinado completo.
+    :param vueltas: Vueltas a bobinar.
+    :param modelo: Instancia de ModeloTensionSimulado.
+    :param velocidad: Función (tensión, dt) -> rps a aplicar en este ciclo.
+    :param dt: Paso de simulación (s).
+    :return: (tiempo total en s, tensión máxima en g).
+    """
+    hechas = 0.0
+    tiempo = 0.0
+    tension_max = modelo.tension
+    while hechas < vueltas:
+        rps = velocidad(modelo.leer(), dt)
+        tension_max = max(tension_max, modelo.actualizar(rps, dt))
+        hechas += rps * dt
+        tiempo += dt
+    return tiempo, tension_max
+
+
+# Benchmark: velocidad fija segura contra gobernador de tensión
+if __name__ == "__main__":
+    vueltas = 3000
+    tension_max = 60.0
+
+    # Velocidad fija: la mayor que aguanta el peor caso (enganchón durante la rampa)
+    modelo = ModeloTensionSimulado()
+    acel_fija = 3.0
+    rps_fija = (tension_max - modelo.base - modelo.amplitud_tiron - modelo.k_aceleracion * acel_fija) / modelo.k_velocidad
+    estado = {"rps": 0.0}
+
+    def velocidad_fija(tension, dt):
+        estado["rps"] = min(rps_fija, estado["rps"] + acel_fija * dt)
+        return estado["rps"]
+
+    t_fija, pico_fija = simular_bobinado(vueltas, modelo, velocidad_fija)
+
+    modelo = ModeloTensionSimulado()
+    gobernador = GobernadorTension(tension_max, rps_max=30.0)
+    t_gob, pico_gob = simular_bobinado(vueltas, modelo, lambda tension, dt: gobernador.limitar(30.0, tension, dt))
+
+    print(f"Velocidad fija ({rps_fija:.1f} RPS): {vueltas / t_fija * 60:.0f} vueltas/min, "
+          f"tensión máxima {pico_fija:.1f} g")
+    print(f"Gobernador (hasta 30 RPS): {vueltas / t_gob * 60:.0f} vueltas/min, "
+          f"tensión máxima {pico_gob:.1f} g")
+    print(f"Mejora: {t_fija / t_gob:.2f}x")
+
+    # Con el HX711 a 80 SPS solo hay lectura nueva uno de cada 12 ciclos; el resto leer() da None
+    modelo = ModeloTensionSimulado()
+    gobernador_hx = GobernadorTension(tension_max, rps_max=30.0)
+    ciclo = {"n": 0}
+
+    def velocidad_hx711(tension, dt):
+        ciclo["n"] += 1
+        return gobernador_hx.limitar(30.0, tension if ciclo["n"] % 12 == 0 else None, dt)
+
+    t_hx, pico_hx = simular_bobinado(vueltas, modelo, velocidad_hx711)
+    print(f"Gobernador con lecturas a 80 SPS: {vueltas / t_hx * 60:.0f} vueltas/min, "
+          f"tensión máxima {pico_hx:.1f} g")
+
+    # Coste de un ciclo del gobernador
+    repeticiones = 100000
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        gobernador.limitar(30.0, 50.0, 0.001)
+    print(f"Coste por ciclo: {(time.perf_counter() - inicio) / repeticiones * 1e6:.2f} µs")
@@ -0,0 +1,468 @@
+import math
+import random
+import time
+from array import array
+
+# Registros del TMC2209 (hoja de datos, sección 5)
+GCONF = 0x00
+GSTAT = 0x01
+IFCNT = 0x02
+SLAVECONF = 0x03
+IOIN = 0x06
+IHOLD_IRUN = 0x10
+TPOWERDOWN = 0x11
+TSTEP = 0x12
+TPWMTHRS = 0x13
+TCOOLTHRS = 0x14
+VACTUAL = 0x22
+SGTHRS = 0x40
+SG_RESULT = 0x41
+COOLCONF = 0x42
+MSCNT = 0x6A
+CHOPCONF = 0x6C
+DRV_STATUS = 0x6F
+PWMCONF = 0x70
+
+# Bits de GCONF
+I_SCALE_ANALOG = 1 << 0
+EN_SPREADCYCLE = 1 << 2
+PDN_DISABLE = 1 << 6
+MSTEP_REG_SELECT = 1 << 7
+MULTISTEP_FILT = 1 << 8
+
+# Campos de CHOPCONF
+MRES_DESPLAZAMIENTO = 24
+MRES_MASCARA = 0xF << MRES_DESPLAZAMIENTO
+INTPOL = 1 << 28
+VSENSE = 1 << 17
+
+SINCRONISMO = 0x05
+FCLK = 12e6           # Reloj interno (Hz); TSTEP y los umbrales van en periodos de este reloj
+VFS = (0.325, 0.180)  # Tensión de fondo de escala de las resistencias de sensado con vsense = 0 / 1
+
+
+def _invertir(byte):
+    return int(f"{byte:08b}"[::-1], 2)
+
+
+# CRC8 del TMC (polinomio x^8 + x^2 + x + 1 con los bits de cada byte del menos al más
+# significativo): es el CRC-8 normal sobre los bytes invertidos, así cabe en dos tablas
+_INVERTIDO = bytes(_invertir(b) for b in range(256))
+_TABLA_CRC = bytearray(256)
+for _i in range(256):
+    _crc = _i
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x07) & 0xFF if _crc & 0x80 else (_crc << 1) & 0xFF
+    _TABLA_CRC[_i] = _crc
+
+
+def crc8(datos):
+    """
+    CRC de un datagrama UART del TMC2209 (sin el byte de CRC).
+    """
+    crc = 0
+    for byte in datos:
+        crc = _TABLA_CRC[crc ^ _INVERTIDO[byte]]
+    return crc
+
+
+def tstep_de(rps, steps_per_revolution):
+    """
+    Valor de TSTEP (y de TPWMTHRS/TCOOLTHRS) a una velocidad: tiempo entre
+    pasos de 1/256 en periodos de FCLK, independiente de los micropasos.
+    """
+    return min(0xFFFFF, int(FCLK / (rps * steps_per_revolution * 256)))
+
+
+class TMC2209:
+    """
+    Driver TMC2209 por su UART de un hilo (PDN_UART): micropasos de hasta
+    1/256 con interpolación y corriente se cambian con una escritura de
+    registro cada uno, sin pines MS ni potenciómetro. El driver guarda una
+    copia de los registros escritos (IHOLD_IRUN y los umbrales no se pueden
+    leer), así cambiar un campo no necesita leer antes. Con TX y RX unidos
+    por una resistencia el puerto recibe el eco de lo enviado, que se
+    descarta. Las lecturas no se pueden encadenar (el driver contesta por
+    el mismo hilo), así que leer_lote() y muestrear_carga() hacen una
+    transacción tras otra con las peticiones ya calculadas.
+    """
+    def __init__(self, serial=None, puerto="/dev/serial0", baudios=115200, direccion=0, eco=True,
+                 rsense=0.11, reintentos=2, timeout=0.05):
+        """
+        :param serial: Puerto ya abierto (pyserial o SerialTMC2209Simulado); por defecto se abre puerto.
+        :param direccion: Dirección del driver en el bus (MS1/MS2, de 0 a 3).
+        :param eco: El puerto recibe lo que envía (un hilo con TX y RX unidos).
+        :param rsense: Resistencias de sensado de la placa (Ω).
+        :param reintentos: Reintentos de una lectura con el CRC o la respuesta mal.
+        :param timeout: Tiempo máximo de espera de la respuesta (s).
+        """
+        if serial is None:
+            import serial as pyserial
+            serial = pyserial.Serial(puerto, baudios, timeout=timeout)
+        self.serial = serial
+        self.direccion = direccion
+        self.eco = eco
+        self.rsense = rsense
+        self.reintentos = reintentos
+        self._bytes_lectura = 12 if eco else 8
+        self._peticiones = {}
+        self.escrituras = 0
+        self.lecturas = 0
+        self.errores = 0
+        self.sgthrs = 0
+        # Valores de reinicio; GCONF y CHOPCONF se leen del driver
+        self.registros = {IHOLD_IRUN: 0x00011F10, TPOWERDOWN: 20, TPWMTHRS: 0, TCOOLTHRS: 0,
+                          SGTHRS: 0, PWMCONF: 0xC10D0024}
+        self.registros[GCONF] = self.leer(GCONF)
+        self.registros[CHOPCONF] = self.leer(CHOPCONF)
+
+    def _leer_exacto(self, n):
+        datos = self.serial.read(n)
+        if len(datos) != n:
+            raise RuntimeError(f"El TMC2209 (dirección {self.direccion}) no responde: {len(datos)} de {n} bytes.")
+        return datos
+
+    def escribir(self, registro, valor):
+        """
+        Escribe un registro de 32 bits (un datagrama de 8 bytes).
+        """
+        datagrama = bytearray((SINCRONISMO, self.direccion, registro | 0x80))
+        datagrama += (valor & 0xFFFFFFFF).to_bytes(4, "big")
+        datagrama.append(crc8(datagrama))
+        self.serial.write(datagrama)
+        if self.eco and self._leer_exacto(8) != datagrama:
+            raise RuntimeError("Colisión en el bus UART: el eco no coincide con lo enviado.")
+        self.registros[registro] = valor
+        self.escrituras += 1
+
+    def leer(self, registro):
+        """
+        Lee un registro (petición de 4 bytes y respuesta de 8), reintentando si el CRC falla.
+        """
+        peticion = self._peticiones.get(registro)
+        if peticion is None:
+            peticion = bytearray((SINCRONISMO, self.direccion, registro))
+            peticion.append(crc8(peticion))
+            peticion = self._peticiones[registro] = bytes(peticion)
+        for _ in range(self.reintentos + 1):
+            self.serial.write(peticion)
+            respuesta = self.serial.read(self._bytes_lectura)[-8:]
+            if (len(respuesta) == 8 and respuesta[0] == SINCRONISMO and respuesta[2] == registro
+                    and crc8(respuesta[:7]) == respuesta[7]):
+                self.lecturas += 1
+                return int.from_bytes(respuesta[3:7], "big")
+            self.errores += 1
+            self.serial.reset_input_buffer()
+        raise RuntimeError(f"Lectura del registro 0x{registro:02X} fallida tras {self.reintentos + 1} intentos.")
+
+    def leer_lote(self, registros):
+        """
+        :param registros: Direcciones de registro.
+        :return: Lista de valores, en el mismo orden.
+        """
+        leer = self.leer
+        return [leer(registro) for registro in registros]
+
+    def micropasos(self, resolucion, interpolacion=True):
+        """
+        Cambia la resolución con una escritura de CHOPCONF. Con interpolación
+        el driver reparte cada paso en 256 micropasos internos.
+        :param resolucion: 1, 2, 4, ..., 256 micropasos por paso.
+        """
+        if resolucion not in (1, 2, 4, 8, 16, 32, 64, 128, 256):
+            raise ValueError("Resolución no válida. Use una potencia de 2 entre 1 y 256.")
+        mres = 8 - int(math.log2(resolucion))
+        valor = self.registros[CHOPCONF] & ~(MRES_MASCARA | INTPOL) | mres << MRES_DESPLAZAMIENTO
+        if interpolacion:
+            valor |= INTPOL
+        self.escribir(CHOPCONF, valor)
+
+    def corriente(self, corriente_ma, retencion=0.5, retardo_retencion=1):
+        """
+        Corriente RMS de marcha y de reposo con una escritura de IHOLD_IRUN
+        (y otra de CHOPCONF solo si cambia la escala vsense).
+        :param corriente_ma: Corriente RMS de marcha (mA).
+        :param retencion: Fracción de la corriente de marcha con el motor parado.
+        :param retardo_retencion: IHOLDDELAY (0-15), rapidez de la bajada a la corriente de reposo.
+        :return: Corriente real (mA) con el escalón de 1/32.
+        """
+        for vsense in (1, 0):  # vsense = 1 da más resolución a corrientes bajas
+            cs = round(corriente_ma / 1000 * 32 * math.sqrt(2) * (self.rsense + 0.02) / VFS[vsense]) - 1
+            if cs <= 31:
+                break
+        if not 0 <= cs <= 31:
+            raise ValueError(f"Corriente fuera de rango para rsense = {self.rsense} Ω: {corriente_ma} mA.")
+        ihold = max(0, min(31, round((cs + 1) * retencion) - 1))
+        chopconf = self.registros[CHOPCONF] & ~VSENSE | (VSENSE if vsense else 0)
+        if chopconf != self.registros[CHOPCONF]:
+            self.escribir(CHOPCONF, chopconf)
+        self.escribir(IHOLD_IRUN, retardo_retencion << 16 | cs << 8 | ihold)
+        return (cs + 1) / 32 * VFS[vsense] / (self.rsense + 0.02) / math.sqrt(2) * 1000
+
+    def modo_chopper(self, stealthchop_hasta_rps=None, steps_per_revolution=200, spreadcycle=False):
+        """
+        StealthChop (silencioso) a baja velocidad y SpreadCycle (más par) por
+        encima del umbral: el driver cambia solo comparando TSTEP con TPWMTHRS.
+        :param stealthchop_hasta_rps: Velocidad de cambio (None: StealthChop siempre).
+        :param spreadcycle: SpreadCycle siempre (ignora el umbral).
+        """
+        gconf = self.registros[GCONF] & ~EN_SPREADCYCLE | (EN_SPREADCYCLE if spreadcycle else 0)
+        if gconf != self.registros[GCONF]:
+            self.escribir(GCONF, gconf)
+        umbral = tstep_de(stealthchop_hasta_rps, steps_per_revolution) if stealthchop_hasta_rps else 0
+        self.escribir(TPWMTHRS, umbral)
+
+    def stallguard(self, umbral, desde_rps, steps_per_revolution=200):
+        """
+        Activa la detección de atasco: con el motor por encima de desde_rps el
+        driver marca atasco (y sube DIAG) cuando SG_RESULT <= 2 * umbral.
+        StallGuard4 solo funciona en StealthChop.
+        :param umbral: SGTHRS (0-255); más alto, más sensible.
+        """
+        self.sgthrs = umbral
+        self.escribir(SGTHRS, umbral & 0xFF)
+        self.escribir(TCOOLTHRS, tstep_de(desde_rps, steps_per_revolution))
+
+    def carga(self):
+        """
+        :return: SG_RESULT (0-510): cuanto más bajo, más carga en el motor.
+        """
+        return self.leer(SG_RESULT) & 0x3FF
+
+    def muestrear_carga(self, n, intervalo=0.0, reloj=time):
+        """
+        Lee SG_RESULT n veces seguidas.
+        :param intervalo: Tiempo entre lecturas (s); 0 para leer tan rápido como permita el bus.
+        :return: array('H') con los valores.
+        """
+        valores = array("H", bytes(2 * n))
+        leer = self.leer
+        siguiente = reloj.perf_counter()
+        for i in range(n):
+            valores[i] = leer(SG_RESULT) & 0x3FF
+            if intervalo:
+                siguiente += intervalo
+                restante = siguiente - reloj.perf_counter()
+                if restante > 0:
+                    reloj.sleep(restante)
+        return valores
+
+    def atasco(self, valores):
+        """
+        :return: Índice del primer valor que indica atasco, o -1.
+        """
+        limite = 2 * self.sgthrs
+        for i, valor in enumerate(valores):
+            if valor <= limite:
+                return i
+        return -1
+
+    def configurar(self, micropasos=16, corriente_ma=800, retencion=0.5, stealthchop_hasta_rps=None,
+                   steps_per_revolution=200, interpolacion=True):
+        """
+        Configuración completa para controlar el driver por UART y comprobación
+        con el contador de escrituras (IFCNT) de que ha recibido todas.
+        :return: Número de escrituras hechas.
+        """
+        antes = self.leer(IFCNT)
+        escrituras = self.escrituras
+        gconf = (self.registros[GCONF] & ~I_SCALE_ANALOG) | PDN_DISABLE | MSTEP_REG_SELECT | MULTISTEP_FILT
+        self.escribir(GCONF, gconf)
+        self.micropasos(micropasos, interpolacion)
+        self.corriente(corriente_ma, retencion)
+        self.modo_chopper(stealthchop_hasta_rps, steps_per_revolution)
+        hechas = self.escrituras - escrituras
+        recibidas = (self.leer(IFCNT) - antes) & 0xFF
+        if recibidas != hechas:
+            raise RuntimeError(f"El TMC2209 ha recibido {recibidas} de {hechas} escrituras.")
+        return hechas
+
+
+def buscar_origen(driver, gpio, step_pin, dir_pin, sentido=0, rps=1.0, steps_per_revolution=200,
+                  micropasos=16, umbral=80, max_vueltas=20, reloj=time):
+    """
+    Origen sin final de carrera: avanza a velocidad constante leyendo
+    SG_RESULT entre pasos hasta que la carga indica que el eje ha llegado al
+    tope. Se ignora la primera vuelta (StallGuard no es fiable arrancando).
+    :param sentido: Nivel de DIR hacia el tope.
+    :param umbral: SGTHRS para la detección.
+    :return: Pasos dados hasta detectar el tope.
+    """
+    driver.micropasos(micropasos)
+    driver.modo_chopper(None)  # StallGuard4 necesita StealthChop
+    driver.stallguard(umbral, rps * 0.5, steps_per_revolution)
+    periodo = 1 / (rps * steps_per_revolution * micropasos)
+    # Una lectura ocupa el bus ~1 ms: se lee cada tantos pasos como quepan en ese tiempo
+    cada = max(1, math.ceil(0.0012 / periodo))
+    ignorar = steps_per_revolution * micropasos
+    limite = 2 * umbral
+    gpio.output(dir_pin, sentido)
+    perf_counter = reloj.perf_counter
+    siguiente = perf_counter()
+    for i in range(1, max_vueltas * steps_per_revolution * micropasos + 1):
+        siguiente += periodo
+        restante = siguiente - perf_counter()
+        if restante > 0:
+            reloj.sleep(restante)
+        gpio.output(step_pin, 1)
+        gpio.output(step_pin, 0)
+        if i % cada == 0 and i > ignorar and driver.carga() <= limite:
+            return i
+    raise RuntimeError(f"No se ha encontrado el tope en {max_vueltas} vueltas.")
+
+
+class SerialTMC2209Simulado:
+    """
+    Puerto serie con uno o varios TMC2209 detrás, con su mapa de registros:
+    decodifica los datagramas, comprueba el CRC, cuenta las escrituras en
+    IFCNT y contesta las lecturas con el eco de un hilo. Con un reloj, cada
+    transacción avanza el tiempo que tardaría en el bus.
+    """
+    ESCRIBIBLES = {GCONF, GSTAT, SLAVECONF, IHOLD_IRUN, TPOWERDOWN, TPWMTHRS, TCOOLTHRS, VACTUAL, SGTHRS,
+                   COOLCONF, CHOPCONF, PWMCONF}
+    LEGIBLES = {GCONF, GSTAT, IFCNT, IOIN, TSTEP, SG_RESULT, MSCNT, CHOPCONF, DRV_STATUS, PWMCONF}
+
+    def __init__(self, direcciones=(0,), eco=True, baudios=115200, reloj=None, carga=None, ruido=0.0, semilla=1):
+        """
+        :param carga: Función (dirección) -> SG_RESULT; por defecto 300 (sin carga).
+        :param ruido: Probabilidad de que una respuesta llegue con un bit cambiado.
+        """
+        self.eco = eco
+        self.baudrate = baudios
+        self.timeout = 0.05
+        self.reloj = reloj
+        self.carga = carga
+        self.ruido = ruido
+        self._azar = random.Random(semilla)
+        self.mapas = {d: {GCONF: 0x00000041, CHOPCONF: 0x10000053, PWMCONF: 0xC10D0024, IOIN: 0x21000000,
+                          TSTEP: 0xFFFFF, IFCNT: 0} for d in direcciones}
+        self._entrada = bytearray()
+        self._salida = bytearray()
+        self.bytes_bus = 0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return len(self._salida)
+
+    def reset_input_buffer(self):
+        self._salida.clear()
+
+    def write(self, datos):
+        datos = bytes(datos)
+        if self.eco:
+            self._salida += datos
+        self._entrada += datos
+        bytes_bus = len(datos) + self._procesar()
+        self.bytes_bus += bytes_bus
+        if self.reloj is not None:
+            # 10 bits por byte y SENDDELAY (8 bits) antes de cada respuesta
+            self.reloj.sleep(bytes_bus * 10 / self.baudrate)
+        return len(datos)
+
+    def read(self, n=1):
+        datos = bytes(self._salida[:n])
+        del self._salida[:n]
+        return datos
+
+    def _procesar(self):
+        entrada = self._entrada
+        respuestas = 0
+        while entrada:
+            if entrada[0] != SINCRONISMO:
+                del entrada[0]
+                continue
+            if len(entrada) < 3:
+                break
+            largo = 8 if entrada[2] & 0x80 else 4
+            if len(entrada) < largo:
+                break
+            datagrama = bytes(entrada[:largo])
+            del entrada[:largo]
+            mapa = self.mapas.get(datagrama[1])
+            if mapa is None or crc8(datagrama[:-1]) != datagrama[-1]:
+                continue
+            registro = datagrama[2] & 0x7F
+            if largo == 8:
+                if registro in self.ESCRIBIBLES:
+                    mapa[registro] = int.from_bytes(datagrama[3:7], "big")
+                    mapa[IFCNT] = (mapa[IFCNT] + 1) & 0xFF
+                continue
+            if registro == SG_RESULT:
+                valor = self.carga(datagrama[1]) if self.carga else 300
+            else:
+                valor = mapa.get(registro, 0) if registro in self.LEGIBLES else 0
+            respuesta = bytearray((SINCRONISMO, 0xFF, registro)) + (valor & 0xFFFFFFFF).to_bytes(4, "big")
+            respuesta.append(crc8(respuesta))
+            if self.ruido and self._azar.random() < self.ruido:
+                respuesta[self._azar.randrange(8)] ^= 1 << self._azar.randrange(8)
+            self._salida += respuesta
+            respuestas += 9  # 8 bytes de respuesta + SENDDELAY
+        return respuestas
+
+
+# Latencia de configuración, coste de leer la carga y origen sin final de carrera
+if __name__ == "__main__":
+    from simulador import EjeStepDir, GPIOVirtual, RelojVirtual
+
+    # 1. Configuración: escrituras, tiempo de bus a 115200 baudios y CPU por datagrama
+    reloj = RelojVirtual()
+    driver = TMC2209(SerialTMC2209Simulado(reloj=reloj))
+    t0 = reloj.perf_counter()
+    cpu = time.perf_counter()
+    escrituras = driver.configurar(micropasos=256, corriente_ma=900, stealthchop_hasta_rps=3.0)
+    cpu = time.perf_counter() - cpu
+    print(f"Configuración completa (1/256 con interpolación, 900 mA, StealthChop hasta 3 RPS): "
+          f"{escrituras} escrituras comprobadas con IFCNT, {(reloj.perf_counter() - t0) * 1e3:.2f} ms de bus, "
+          f"{cpu * 1e6:.0f} µs de CPU")
+    t0 = reloj.perf_counter()
+    cpu = time.perf_counter()
+    driver.micropasos(32)
+    cpu = time.perf_counter() - cpu
+    print(f"Cambio de micropasos: 1 escritura, {(reloj.perf_counter() - t0) * 1e3:.2f} ms de bus, "
+          f"{cpu * 1e6:.1f} µs de CPU (set_microstepping con el A4988: 3 output(), como mucho 1/16 "
+          f"y la corriente con el potenciómetro)")
+
+    # 2. Lectura de la carga: CPU por lectura y lecturas por segundo que permite el bus
+    n = 20000
+    driver = TMC2209(SerialTMC2209Simulado())
+    cpu = time.perf_counter()
+    driver.muestrear_carga(n)
+    cpu = (time.perf_counter() - cpu) / n
+    reloj = RelojVirtual()
+    driver_bus = TMC2209(SerialTMC2209Simulado(reloj=reloj))
+    t0 = reloj.perf_counter()
+    driver_bus.muestrear_carga(100)
+    bus = (reloj.perf_counter() - t0) / 100
+    print(f"Lectura de SG_RESULT: {cpu * 1e6:.1f} µs de CPU, {bus * 1e3:.2f} ms de bus -> como mucho "
+          f"{1 / bus:.0f} lecturas/s; a 100 lecturas/s la CPU ocupada es el {cpu * 100 * 100:.2f}%")
+    driver = TMC2209(SerialTMC2209Simulado(ruido=0.01, semilla=7))
+    driver.muestrear_carga(n)
+    print(f"Con un 1% de respuestas corruptas: {n} lecturas correctas, {driver.errores} reintentos por CRC")
+
+    # 3. Origen sin final de carrera: el tope está unas 3,5 vueltas hacia atrás
+    reloj = RelojVirtual()
+    gpio = GPIOVirtual(reloj)
+    eje = EjeStepDir(gpio, 20, 21, nombre="guiado")
+    gpio.setmode(gpio.BCM)
+    for pin in (20, 21):
+        gpio.setup(pin, gpio.OUT)
+    tope = -11107
+    azar = random.Random(3)
+
+    def carga(direccion):
+        micropaso = eje.posicion_16 // 16
+        if micropaso <= tope:  # Contra el tope: el motor se frena y la carga sube de golpe
+            return azar.randint(0, 40)
+        return azar.randint(260, 340)
+
+    driver = TMC2209(SerialTMC2209Simulado(reloj=reloj, carga=carga))
+    pasos = buscar_origen(driver, gpio, 20, 21, sentido=0, rps=2.0, micropasos=16, reloj=reloj)
+    print(f"Origen sin final de carrera a 2 RPS: tope detectado tras {pasos} micropasos "
+          f"({tope - eje.posicion_16 // 16} después del contacto), {reloj.perf_counter():.2f} s simulados, "
+          f"{driver.lecturas} lecturas de carga")
@@ -83,13 +83,15 @@ if __name__ == "__main__":
         movements = motor.generate_steps_matrix(positions)
         
 
-        # Ejecutar los movimientos en el vector
-        for steps, direction in movements:
+        # Ejecutar los movimientos en el vector, uno por ranura de 1 segundo
+        inicio = time.time()
+        for i, (steps, direction) in enumerate(movements):
             print(f"Moviendo {steps} pasos hacia {direction}...")
-            current_t = time.time()
             motor.move_steps(steps, direction)
-            elapsed_time = time.time() - current_t
-            time.sleep(1 - elapsed_time)  # Esperar el tiempo restante
+            # Esperar hasta el inicio absoluto de la siguiente ranura (si el movimiento se alarga, no se espera)
+            restante = inicio + (i + 1) - time.time()
+            if restante > 0:
+                time.sleep(restante)
             
 
     except KeyboardInterrupt:
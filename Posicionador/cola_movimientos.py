@@ -0,0 +1,370 @@
+import math
+import random
+import time
+from threading import Condition, Thread
+
+
+class Segmento:
+    """
+    Un movimiento del eje entre dos posiciones consecutivas.
+    """
+    def __init__(self, inicio, destino, v_crucero, instante=None):
+        """
+        :param inicio: Posición de partida (pasos).
+        :param destino: Posición objetivo (pasos).
+        :param v_crucero: Velocidad máxima del segmento (pasos/s).
+        :param instante: Segundos desde el arranque de la cola en que debe empezar (None = en cuanto se pueda).
+        """
+        self.inicio = inicio
+        self.destino = destino
+        self.longitud = abs(destino - inicio)
+        self.sentido = (destino > inicio) - (destino < inicio)
+        self.v_crucero = v_crucero
+        self.instante = instante
+        self.pausa = 0.0       # Espera al llegar a este segmento (s)
+        self.accion = None     # Función a llamar al llegar a este segmento
+        self.v_atras = -1.0    # Velocidad de entrada máxima según la pasada hacia atrás
+        self.v_entrada = 0.0
+        self.v_salida = 0.0
+
+
+def intervalos_segmento(longitud, v_entrada, v_salida, v_crucero, acel):
+    """
+    Genera los intervalos entre pasos de un segmento con perfil trapezoidal.
+    La velocidad en cada paso es la menor entre la rampa de subida desde
+    v_entrada, el crucero y la rampa de bajada hasta v_salida.
+    :param longitud: Número de pasos.
+    :param v_entrada: Velocidad al empezar (pasos/s).
+    :param v_salida: Velocidad al terminar (pasos/s).
+    :param v_crucero: Velocidad máxima (pasos/s).
+    :param acel: Aceleración máxima (pasos/s²).
+    """
+    v0 = v_entrada * v_entrada
+    v1 = v_salida * v_salida
+    for k in range(longitud):
+        # Velocidad en el punto medio del paso
+        s = k + 0.5
+        v = min(v_crucero, math.sqrt(v0 + 2 * acel * s), math.sqrt(v1 + 2 * acel * (longitud - s)))
+        yield 1 / v
+
+
+def planificar_segmentos(segmentos, v_inicial, acel):
+    """
+    Planificador con anticipación (look-ahead): calcula las velocidades de
+    entrada y salida de cada segmento para no parar entre movimientos salvo
+    cuando el eje invierte el sentido o el segmento tiene una hora fijada.
+    El último segmento conocido siempre termina en reposo.
+    Al añadir segmentos al final solo se recalcula la parte del plan que cambia.
+    :param segmentos: Lista de Segmento pendientes, en orden.
+    :param v_inicial: Velocidad del eje al empezar el primero.
+    :param acel: Aceleración máxima (pasos/s²).
+    """
+    n = len(segmentos)
+    if n == 0:
+        return
+
+    # Pasada hacia atrás: poder frenar a tiempo para la unión siguiente
+    v_salida = 0.0
+    inicio = 0
+    for i in range(n - 1, -1, -1):
+        seg = segmentos[i]
+        # Límite de velocidad en la unión con el segmento anterior
+        if i == 0:
+            union = v_inicial
+        else:
+            anterior = segmentos[i - 1]
+            if anterior.sentido != seg.sentido or seg.instante is not None:
+                union = 0.0
+            else:
+                union = min(anterior.v_crucero, seg.v_crucero)
+        v_atras = min(union, math.sqrt(v_salida * v_salida + 2 * acel * seg.longitud))
+        if i < n - 1 and v_atras == seg.v_atras:
+            inicio = i  # A partir de aquí hacia atrás el plan no cambia
+            break
+        seg.v_atras = v_atras
+        v_salida = v_atras
+
+    # Pasada hacia delante: no se puede acelerar más de lo que permite el segmento
+    v_entrada = v_inicial if inicio == 0 else segmentos[inicio - 1].v_salida
+    for i in range(inicio, n):
+        seg = segmentos[i]
+        seg.v_entrada = min(seg.v_atras, v_entrada)
+        siguiente = segmentos[i + 1].v_atras if i + 1 < n else 0.0
+        seg.v_salida = min(siguiente, math.sqrt(seg.v_entrada * seg.v_entrada + 2 * acel * seg.longitud))
+        v_entrada = seg.v_salida
+
+
+class ColaMovimientos:
+    """
+    Cola de movimientos continua para el eje del posicionador. Los objetivos
+    se añaden desde cualquier hilo mientras el eje se mueve; el planificador
+    enlaza los segmentos consecutivos y un hilo ejecutor genera los pasos
+    contra instantes absolutos, sin acumular retrasos.
+    """
+    def __init__(self, motor, v_max=1000, acel_max=20000, capacidad=32, gpio=None, reloj=time):
+        """
+        :param motor: Objeto con step_pin y dir_pin (por ejemplo Pos1.BipolarMotor).
+        :param v_max: Velocidad máxima por defecto (pasos/s).
+        :param acel_max: Aceleración máxima (pasos/s²).
+        :param capacidad: Máximo de segmentos pendientes; agregar() espera si la cola está llena.
+        :param gpio: Módulo GPIO a usar (por defecto RPi.GPIO).
+        :param reloj: Objeto con perf_counter() y sleep() (por defecto el módulo time).
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.motor = motor
+        self.v_max = v_max
+        self.acel_max = acel_max
+        self.capacidad = capacidad
+        self.reloj = reloj
+
+        self.pendientes = []
+        self.condicion = Condition()
+        self.ultimo_destino = 0
+        self.posicion = 0
+        self.v_actual = 0.0
+        self.sentido_actual = 0
+        self.ocupado = False
+        self.running = False
+        self.limites = None
+
+    def establecer_origen(self, posicion=0):
+        """
+        Fija la posición actual del eje (por ejemplo tras Homing.buscar_origen).
+        Solo se puede llamar con la cola vacía y el eje parado.
+        """
+        with self.condicion:
+            if self.pendientes or self.ocupado:
+                raise ValueError("No se puede fijar el origen con movimientos pendientes.")
+            self.posicion = posicion
+            self.ultimo_destino = posicion
+
+    def establecer_limites(self, minimo, maximo):
+        """
+        Activa los límites por software. Como el plan siempre puede frenar antes
+        del último objetivo conocido, el eje puede ir a velocidad máxima hasta
+        las pestañas del carrete sin pasarse.
+        :param minimo: Posición mínima permitida (pasos).
+        :param maximo: Posición máxima permitida (pasos).
+        """
+        if minimo > maximo:
+            raise ValueError("El límite mínimo es mayor que el máximo.")
+        self.limites = (minimo, maximo)
+
+    def agregar(self, destino, velocidad=None, instante=None):
+        """
+        Añade una posición objetivo al final de la cola.
+        :param destino: Posición absoluta (pasos).
+        :param velocidad: Velocidad máxima del movimiento (por defecto v_max).
+        :param instante: Segundos desde el arranque de la cola en que debe empezar el movimiento.
+        """
+        if self.limites is not None and not self.limites[0] <= destino <= self.limites[1]:
+            raise ValueError(f"Posición {destino} fuera de los límites {self.limites}.")
+        with self.condicion:
+            while len(self.pendientes) >= self.capacidad and self.running:
+                self.condicion.wait()
+            if destino == self.ultimo_destino and instante is None:
+                return  # Movimiento nulo: no hace falta pararse
+            segmento = Segmento(self.ultimo_destino, destino, min(velocidad or self.v_max, self.v_max), instante)
+            self.pendientes.append(segmento)
+            self.ultimo_destino = destino
+            planificar_segmentos(self.pendientes, self.v_actual, self.acel_max)
+            self.condicion.notify_all()
+
+    def _agregar_parada(self, pausa=0.0, accion=None):
+        """
+        Añade un segmento sin movimiento. Como no tiene sentido, el eje se para antes.
+        """
+        with self.condicion:
+            while len(self.pendientes) >= self.capacidad and self.running:
+                self.condicion.wait()
+            segmento = Segmento(self.ultimo_destino, self.ultimo_destino, self.v_max)
+            segmento.pausa = pausa
+            segmento.accion = accion
+            self.pendientes.append(segmento)
+            planificar_segmentos(self.pendientes, self.v_actual, self.acel_max)
+            self.condicion.notify_all()
+
+    def agregar_pausa(self, segundos):
+        """
+        Añade una espera con el eje parado.
+        :param segundos: Duración de la espera.
+        """
+        self._agregar_parada(pausa=segundos)
+
+    def agregar_accion(self, funcion):
+        """
+        Añade una acción que el ejecutor llama con el eje parado al llegar a ese punto
+        de la cola (arrancar el husillo, bobinar...).
+        :param funcion: Función sin argumentos.
+        """
+        self._agregar_parada(accion=funcion)
+
+    def iniciar(self):
+        """
+        Arranca el hilo ejecutor. Los instantes de los movimientos cuentan desde aquí.
+        """
+        self.running = True
+        self.t0 = self.reloj.perf_counter()
+        self.hilo = Thread(target=self._ejecutar)
+        self.hilo.daemon = True
+        self.hilo.start()
+
+    def esperar(self):
+        """
+        Espera a que se terminen todos los movimientos de la cola.
+        """
+        with self.condicion:
+            while (self.pendientes or self.ocupado) and self.running:
+                self.condicion.wait()
+
+    def detener(self):
+        """
+        Detiene el ejecutor y descarta los movimientos pendientes.
+        """
+        with self.condicion:
+            self.running = False
+            self.pendientes = []
+            self.condicion.notify_all()
+        if hasattr(self, 'hilo') and self.hilo.is_alive():
+            self.hilo.join()
+
+    def _ejecutar(self):
+        """
+        Bucle del ejecutor: toma el primer segmento con su plan ya fijado y lo recorre.
+        """
+        siguiente = self.reloj.perf_counter()
+        while True:
+            with self.condicion:
+                while not self.pendientes and self.running:
+                    self.condicion.wait()
+                if not self.running:
+                    return
+                segmento = self.pendientes.pop(0)
+                # Desde este momento la velocidad de salida queda fijada; coincide con
+                # la de entrada del siguiente, así que no hace falta replanificar
+                self.v_actual = segmento.v_salida
+                self.ocupado = True
+                self.condicion.notify_all()
+
+            if segmento.instante is not None:
+                # Ranura de tiempo: se espera al instante absoluto; si ya pasó se arranca en el acto
+                siguiente = max(siguiente, self.t0 + segmento.instante)
+            siguiente = max(siguiente, self.reloj.perf_counter()) if segmento.v_entrada == 0 else siguiente
+            if segmento.accion is not None:
+                segmento.accion()
+                siguiente = max(siguiente, self.reloj.perf_counter())
+            siguiente += segmento.pausa
+
+            if segmento.sentido and segmento.sentido != self.sentido_actual:
+                # Mismo convenio que Pos1: 1 (hacia posiciones mayores) = DIR bajo
+                self.gpio.output(self.motor.dir_pin, self.gpio.LOW if segmento.sentido > 0 else self.gpio.HIGH)
+                self.sentido_actual = segmento.sentido
+
+            for intervalo in intervalos_segmento(segmento.longitud, segmento.v_entrada, segmento.v_salida,
+                                                 segmento.v_crucero, self.acel_max):
+                if not self.running:
+                    return
+                restante = siguiente - self.reloj.perf_counter()
+                if restante > 0:
+                    self.reloj.sleep(restante)
+                self.gpio.output(self.motor.step_pin, self.gpio.HIGH)
+                self.gpio.output(self.motor.step_pin, self.gpio.LOW)
+                self.posicion += segmento.sentido
+                siguiente += intervalo
+
+            with self.condicion:
+                self.ocupado = False
+                self.condicion.notify_all()
+
+
+def duracion_movimientos(posiciones, v_max, acel, enlazar=True, instantes=None):
+    """
+    Calcula la duración de una secuencia de posiciones sin mover el eje.
+    :param posiciones: Lista de posiciones absolutas.
+    :param v_max: Velocidad máxima (pasos/s).
+    :param acel: Aceleración máxima (pasos/s²).
+    :param enlazar: False para parar en cada posición (sin anticipación).
+    :param instantes: Lista opcional de instantes de inicio de cada movimiento.
+    :return: Duración total (s).
+    """
+    segmentos = []
+    actual = 0
+    for i, destino in enumerate(posiciones):
+        instante = instantes[i] if instantes else None
+        if destino == actual and instante is None:
+            continue
+        segmentos.append(Segmento(actual, destino, v_max, instante))
+        actual = destino
+
+    if enlazar:
+        planificar_segmentos(segmentos, 0.0, acel)
+    t = 0.0
+    for seg in segmentos:
+        if not enlazar:
+            seg.v_entrada = seg.v_salida = 0.0
+        if seg.instante is not None:
+            t = max(t, seg.instante)
+        t += sum(intervalos_segmento(seg.longitud, seg.v_entrada, seg.v_salida, seg.v_crucero, acel))
+    return t
+
+
+def duracion_pos1(posiciones, delay=0.001, ranura=1.0):
+    """
+    Duración de la secuencia tal como la ejecuta Pos1.py: cada movimiento a
+    delay fijo dentro de una ranura de un segundo.
+    """
+    actual = 0
+    t = 0.0
+    for destino in posiciones:
+        t += max(ranura, abs(destino - actual) * delay)
+        actual = destino
+    return t
+
+
+# Benchmark: secuencia de Pos1.py y secuencias aleatorias largas
+if __name__ == "__main__":
+    v_max = 1000      # Igual que delay = 0.001 en Pos1.move_steps
+    acel = 20000
+
+    positions = [400, 50, 50, 1, 30, 5, 2]
+    print(f"Secuencia de Pos1 {positions}:")
+    print(f"  Pos1 (ranuras de 1 s):       {duracion_pos1(positions):.3f} s")
+    print(f"  Parando en cada posición:    {duracion_movimientos(positions, v_max, acel, enlazar=False):.3f} s")
+    print(f"  Con anticipación:            {duracion_movimientos(positions, v_max, acel):.3f} s")
+    instantes = [float(i) for i in range(len(positions))]
+    print(f"  Ranuras de 1 s con plazos absolutos: "
+          f"{duracion_movimientos(positions, v_max, acel, instantes=instantes):.3f} s")
+
+    aleatorio = random.Random(1)
+    for nombre, generador in [
+        ("aleatoria", lambda p: aleatorio.randint(0, 2000)),
+        ("barrido con pasos cortos", lambda p: p + aleatorio.randint(-5, 40)),
+    ]:
+        posiciones = []
+        p = 0
+        for _ in range(2000):
+            p = generador(p)
+            posiciones.append(p)
+        parando = duracion_movimientos(posiciones, v_max, acel, enlazar=False)
+        enlazado = duracion_movimientos(posiciones, v_max, acel)
+        print(f"Secuencia {nombre} de {len(posiciones)} movimientos: parando {parando:.2f} s, "
+              f"con anticipación {enlazado:.2f} s ({parando / enlazado:.2f}x)")
+
+    # Coste de planificar al añadir un objetivo con la cola llena
+    class _GPIONulo:
+        LOW, HIGH = 0, 1
+
+        def output(self, pin, valor):
+            pass
+
+    class _MotorNulo:
+        step_pin, dir_pin = 17, 27
+
+    cola = ColaMovimientos(_MotorNulo(), v_max, acel, capacidad=10 ** 6, gpio=_GPIONulo())
+    inicio = time.perf_counter()
+    for i in range(32):
+        cola.agregar(i * 10)
+    print(f"Coste de agregar() con 32 segmentos pendientes: "
+          f"{(time.perf_counter() - inicio) / 32 * 1e6:.1f} µs")
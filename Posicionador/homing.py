@@ -0,0 +1,269 @@
+import math
+import random
+import time
+from threading import Event
+
+
+class FinalDeCarrera:
+    """
+    Final de carrera conectado a una entrada GPIO. El flanco de activación se
+    detecta por interrupción (add_event_detect), así el bucle de pasos solo
+    consulta una bandera en cada paso.
+    """
+    def __init__(self, pin, gpio=None, activo_bajo=True):
+        """
+        :param pin: Pin GPIO del final de carrera.
+        :param gpio: Módulo GPIO a usar (por defecto RPi.GPIO).
+        :param activo_bajo: True si el pin baja a 0 al pisar el final (contacto a masa con pull-up).
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.pin = pin
+        self.activo_bajo = activo_bajo
+        self.disparado = Event()
+
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(self.pin, self.gpio.IN,
+                        pull_up_down=self.gpio.PUD_UP if activo_bajo else self.gpio.PUD_DOWN)
+        flanco = self.gpio.FALLING if activo_bajo else self.gpio.RISING
+        self.gpio.add_event_detect(self.pin, flanco, callback=self._flanco)
+
+    def _flanco(self, canal):
+        self.disparado.set()
+
+    def activo(self):
+        """
+        Devuelve True si el final de carrera está pisado.
+        """
+        return self.gpio.input(self.pin) == (0 if self.activo_bajo else 1)
+
+    def rearmar(self):
+        """
+        Borra el disparo anterior antes de una nueva aproximación.
+        """
+        self.disparado.clear()
+
+
+class Homing:
+    """
+    Búsqueda del origen del guiado en dos velocidades: aproximación rápida
+    hasta el final de carrera, retroceso hasta liberarlo y nueva aproximación
+    lenta para fijar el cero con precisión.
+    """
+    def __init__(self, motor, final, gpio=None, reloj=time, v_rapida=2000, v_lenta=100, acel=20000,
+                 retroceso=30, recorrido_max=50000):
+        """
+        :param motor: Objeto con step_pin y dir_pin (por ejemplo Pos1.BipolarMotor).
+        :param final: Instancia de FinalDeCarrera en el lado del origen.
+        :param gpio: Módulo GPIO a usar (por defecto RPi.GPIO).
+        :param reloj: Objeto con perf_counter() y sleep() (por defecto el módulo time).
+        :param v_rapida: Velocidad de la aproximación rápida (pasos/s).
+        :param v_lenta: Velocidad de la aproximación lenta (pasos/s). Debe poder arrancar y parar sin rampa.
+        :param acel: Aceleración de la aproximación rápida (pasos/s²).
+        :param retroceso: Pasos a retroceder después de liberar el final.
+        :param recorrido_max: Pasos máximos de búsqueda antes de dar error.
+        """
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.gpio = gpio
+        self.motor = motor
+        self.final = final
+        self.reloj = reloj
+        self.v_rapida = v_rapida
+        self.v_lenta = v_lenta
+        self.acel = acel
+        self.retroceso = retroceso
+        self.recorrido_max = recorrido_max
+
+    def _direccion(self, sentido):
+        # Mismo convenio que Pos1: hacia posiciones mayores = DIR bajo
+        self.gpio.output(self.motor.dir_pin, self.gpio.LOW if sentido > 0 else self.gpio.HIGH)
+
+    def _mover(self, sentido, pasos_max, v_crucero, hasta=None):
+        """
+        Mueve el eje hasta pasos_max pasos o hasta que la función hasta() sea cierta.
+        Por encima de v_lenta acelera y frena con rampa, tanto al final del recorrido
+        como al cumplirse la condición.
+        :return: (pasos dados, pasos dados después de cumplirse la condición).
+        """
+        self._direccion(sentido)
+        siguiente = self.reloj.perf_counter()
+        v = min(v_crucero, self.v_lenta)
+        v_lenta2 = self.v_lenta * self.v_lenta
+        frenando = False
+        pasos = 0
+        tras_condicion = 0
+        while pasos < pasos_max:
+            if not frenando and hasta is not None and hasta():
+                frenando = True
+            if frenando:
+                if v <= self.v_lenta:
+                    break
+                v = math.sqrt(max(v * v - 2 * self.acel, 0.0))
+                tras_condicion += 1
+            else:
+                limite_final = math.sqrt(v_lenta2 + 2 * self.acel * (pasos_max - pasos))
+                v = min(v_crucero, math.sqrt(v * v + 2 * self.acel), limite_final)
+            v = max(v, self.v_lenta)
+
+            restante = siguiente - self.reloj.perf_counter()
+            if restante > 0:
+                self.reloj.sleep(restante)
+            self.gpio.output(self.motor.step_pin, self.gpio.HIGH)
+            self.gpio.output(self.motor.step_pin, self.gpio.LOW)
+            pasos += 1
+            siguiente += 1 / v
+        return pasos, tras_condicion
+
+    def buscar_origen(self):
+        """
+        Ejecuta la búsqueda del origen. Al terminar el eje está en la posición 0.
+        :return: Diccionario con el tiempo empleado y los pasos de cada fase.
+        """
+        inicio = self.reloj.perf_counter()
+
+        # Si ya está pisado, salir primero del final
+        if self.final.activo():
+            self._mover(+1, self.recorrido_max, self.v_lenta, hasta=lambda: not self.final.activo())
+
+        # 1. Aproximación rápida; al saltar el final se frena con rampa
+        self.final.rearmar()
+        rapida, pasado = self._mover(-1, self.recorrido_max, self.v_rapida, hasta=self.final.disparado.is_set)
+        if not self.final.disparado.is_set():
+            raise RuntimeError("No se encontró el final de carrera.")
+
+        # 2. Retroceso rápido: deshacer la frenada y alejarse un margen
+        retroceso, _ = self._mover(+1, pasado + self.retroceso, self.v_rapida)
+        if self.final.activo():
+            extra, _ = self._mover(+1, self.recorrido_max, self.v_lenta, hasta=lambda: not self.final.activo())
+            retroceso += extra
+
+        # 3. Aproximación lenta: el cero es el paso en que salta el final
+        self.final.rearmar()
+        lenta, _ = self._mover(-1, 2 * retroceso + self.retroceso, self.v_lenta, hasta=self.final.disparado.is_set)
+        if not self.final.disparado.is_set():
+            raise RuntimeError("El final de carrera no volvió a saltar en la aproximación lenta.")
+
+        return {
+            "tiempo": self.reloj.perf_counter() - inicio,
+            "pasos_rapida": rapida,
+            "pasos_retroceso": retroceso,
+            "pasos_lenta": lenta,
+        }
+
+
+class EjeConFinalSimulado:
+    """
+    Simulación del eje con un final de carrera, con la misma interfaz que
+    RPi.GPIO y un reloj virtual. El final salta con un pequeño ruido de
+    posición y llama a la función del flanco con una latencia dada.
+    """
+    BCM, IN, OUT = "BCM", "IN", "OUT"
+    LOW, HIGH = 0, 1
+    PUD_UP, PUD_DOWN = "PUD_UP", "PUD_DOWN"
+    FALLING, RISING = "FALLING", "RISING"
+
+    def __init__(self, step_pin, dir_pin, final_pin, posicion_final=0.0, posicion=0, ruido=0.3,
+                 histeresis=2.0, latencia=(0.0001, 0.002), semilla=None):
+        """
+        :param posicion_final: Posición real (pasos) en que se pisa el final.
+        :param posicion: Posición inicial del eje.
+        :param ruido: Dispersión de la posición de disparo (pasos).
+        :param histeresis: Distancia para liberar el final una vez pisado (pasos).
+        :param latencia: Retardo mínimo y máximo entre el cambio del contacto y la llamada al callback (s).
+        """
+        self.step_pin = step_pin
+        self.dir_pin = dir_pin
+        self.final_pin = final_pin
+        self.posicion_final = posicion_final
+        self.posicion = posicion
+        self.ruido = ruido
+        self.histeresis = histeresis
+        self.latencia = latencia
+        self.aleatorio = random.Random(semilla)
+        self.niveles = {dir_pin: 0, step_pin: 0}
+        self.pisado = False
+        self.umbral = self._nuevo_umbral()
+        self.callbacks = {}
+        self.pendientes = []
+        self.t = 0.0
+
+    def _nuevo_umbral(self):
+        return self.posicion_final + self.aleatorio.gauss(0, self.ruido)
+
+    # Interfaz de reloj
+    def perf_counter(self):
+        return self.t
+
+    def sleep(self, segundos):
+        self.t += segundos
+        vencidos = [p for p in self.pendientes if p[0] <= self.t]
+        self.pendientes = [p for p in self.pendientes if p[0] > self.t]
+        for _, funcion in vencidos:
+            funcion(self.final_pin)
+
+    # Interfaz GPIO
+    def setmode(self, modo):
+        pass
+
+    def setup(self, pin, modo, pull_up_down=None):
+        pass
+
+    def add_event_detect(self, pin, flanco, callback=None):
+        self.callbacks[pin] = callback
+
+    def input(self, pin):
+        if pin == self.final_pin:
+            return 0 if self.pisado else 1
+        return self.niveles.get(pin, 0)
+
+    def output(self, pin, valor):
+        anterior = self.niveles.get(pin, 0)
+        self.niveles[pin] = valor
+        if pin == self.step_pin and valor and not anterior:
+            self.posicion += 1 if self.niveles[self.dir_pin] == self.LOW else -1
+            if not self.pisado and self.posicion <= self.umbral:
+                self.pisado = True
+                if self.final_pin in self.callbacks:
+                    retardo = self.aleatorio.uniform(*self.latencia)
+                    self.pendientes.append((self.t + retardo, self.callbacks[self.final_pin]))
+            elif self.pisado and self.posicion > self.umbral + self.histeresis:
+                self.pisado = False
+                self.umbral = self._nuevo_umbral()
+
+
+# Prueba simulada: tiempo de búsqueda y repetibilidad del cero
+if __name__ == "__main__":
+    class _Motor:
+        step_pin, dir_pin = 17, 27
+
+    aleatorio = random.Random(7)
+    for dos_velocidades in (False, True):
+        tiempos = []
+        errores = []
+        for prueba in range(50):
+            eje = EjeConFinalSimulado(17, 27, 22, posicion=aleatorio.randint(500, 20000), semilla=prueba)
+            final = FinalDeCarrera(22, gpio=eje)
+            homing = Homing(_Motor(), final, gpio=eje, reloj=eje)
+            if dos_velocidades:
+                tiempos.append(homing.buscar_origen()["tiempo"])
+                errores.append(eje.posicion - eje.posicion_final)
+            else:
+                # Solo aproximación rápida: el cero es la posición en que se ve el disparo
+                cero = []
+
+                def visto():
+                    if final.disparado.is_set() and not cero:
+                        cero.append(eje.posicion)
+                    return bool(cero)
+
+                homing._mover(-1, homing.recorrido_max, homing.v_rapida, hasta=visto)
+                tiempos.append(eje.t)
+                errores.append(cero[0] - eje.posicion_final)
+        media = sum(errores) / len(errores)
+        dispersion = math.sqrt(sum((e - media) ** 2 for e in errores) / len(errores))
+        nombre = "dos velocidades" if dos_velocidades else "solo aproximación rápida"
+        print(f"{nombre}: tiempo medio {sum(tiempos) / len(tiempos):.3f} s, "
+              f"cero = {media:+.2f} pasos, repetibilidad ±{dispersion:.2f} pasos "
+              f"(rango {max(errores) - min(errores)} pasos)")